@@ -1,14 +1,50 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
+import asyncio
 import uvicorn
 import os
 
 from .routers import score, recommend, agarihai
+from .services.discard_service import discard_service
+from .services.engine_executor import engine_executor
+from .services.health_monitor import health_monitor
+from .services.result_cache import result_cache, score_cache
+from .services.riichi_service import riichi_service
+from .services.warmup import warm_up
+from .utils.metrics import MetricsMiddleware, TimedJSONResponse, registry
+from .utils.node_worker_pool import discard_worker_pool
+from .utils.process_engine import process_engine
+from .utils.request_timing import ServerTimingMiddleware
+
+
+async def _run_background():
+    await warm_up.run()
+    await health_monitor.run()
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動・終了時の処理"""
+    # ワーカー起動・キャッシュ準備はバックグラウンドで行い、終わるまで /ready は 503 を返す
+    # ウォームアップ後は各サービスの自己診断を定期実行する
+    background_task = asyncio.create_task(_run_background())
+    yield
+    background_task.cancel()
+    # 常駐Node.jsワーカーを終了
+    discard_worker_pool.shutdown()
+    await riichi_service.shutdown()
+    engine_executor.shutdown()
+    process_engine.shutdown()
+
 
 app = FastAPI(
     title="Hackday Backend API",
     description="FastAPI backend for hackday project",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=TimedJSONResponse
 )
 
 # CORS設定
@@ -18,6 +54,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing", "X-Engine"],
+)
+
+# エンドポイントごとのレイテンシを計測
+app.add_middleware(MetricsMiddleware)
+
+# 計算系APIのレスポンスに処理時間の内訳と使用エンジンを付ける
+app.add_middleware(
+    ServerTimingMiddleware,
+    path_prefixes=[score.router.prefix, recommend.router.prefix, agarihai.router.prefix]
 )
 
 app.include_router(score.router)
@@ -31,9 +77,55 @@ async def root():
 
 @app.get("/health")
 async def health_check():
-    """ヘルスチェック用エンドポイント"""
+    """ヘルスチェック用エンドポイント（プロセスが応答できるかのみ）"""
     return {"status": "healthy", "service": "hackday_backend"}
 
+@app.get("/ready")
+async def readiness_check():
+    """レディネスチェック（起動時のウォームアップが終わるまで503）"""
+    if not warm_up.ready:
+        return JSONResponse(status_code=503, content={"status": "warming_up", "warm_up": warm_up.stats()})
+    return {"status": "ready", "warm_up": warm_up.stats()}
+
+def _collect_service_metrics():
+    """キャッシュ・実行キュー・同時リクエスト集約の現在値（/metrics 出力時に読む）"""
+    caches = {"discard": result_cache.stats(), "score": score_cache.stats()}
+    executor = engine_executor.stats()
+    single_flight = discard_service.stats()
+    return [
+        ("hackday_cache_entries", "gauge", "Result cache entries", ("cache",),
+         {(name, ): stats["entries"] for name, stats in caches.items()}),
+        ("hackday_cache_bytes", "gauge", "Result cache size in bytes", ("cache",),
+         {(name, ): stats["bytes"] for name, stats in caches.items()}),
+        ("hackday_cache_evictions_total", "counter", "Result cache evictions", ("cache",),
+         {(name, ): stats["evictions"] for name, stats in caches.items()}),
+        ("hackday_cache_errors_total", "counter", "Result cache backend errors treated as misses", ("cache",),
+         {(name, ): stats["errors"] for name, stats in caches.items()}),
+        ("hackday_engine_executor_tasks", "gauge", "Engine executor tasks", ("state",),
+         {("running", ): executor["running"], ("queued", ): executor["queued"]}),
+        ("hackday_engine_executor_rejected_total", "counter", "Engine executor rejections", (),
+         {(): executor["rejected"]}),
+        ("hackday_single_flight_in_flight", "gauge", "Shared computations in flight", (),
+         {(): single_flight["in_flight"]}),
+        ("hackday_ready", "gauge", "Whether start-up warm-up has finished", (),
+         {(): int(warm_up.ready)}),
+        ("hackday_warm_up_duration_seconds", "gauge", "Start-up warm-up duration", (),
+         {(): warm_up.duration} if warm_up.duration is not None else {}),
+        ("hackday_health_check_passed", "gauge", "Result of the latest background self-test", ("check",),
+         {(name, ): int(passed) for name, passed in health_monitor.passed().items() if passed is not None}),
+        ("hackday_single_flight_coalesced_total", "counter", "Requests that joined an in-flight computation", (),
+         {(): single_flight["coalesced"]}),
+    ]
+
+
+registry.register_collector(_collect_service_metrics)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus形式のメトリクス"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/api/v1/test")
 async def test_endpoint():
     """テスト用API エンドポイント"""
@@ -2,8 +2,10 @@ from fastapi import APIRouter, HTTPException
 import logging
 import time
 
-from ..schema import RecommendDiscardRequest
-from ..utils.discard_simulator_hybrid import get_shanten_and_effective_tiles_hybrid
+from ..schema import RecommendDiscardRequest, BatchRecommendRequest
+from ..services.discard_service import discard_service
+from ..services.engine_executor import EngineQueueFullError
+from ..services.health_monitor import health_monitor
 
 logger = logging.getLogger(__name__)
 
@@ -28,7 +30,7 @@ async def get_agarihai(request: RecommendDiscardRequest):
         start_time = time.time()
 
         # シャンテン数と有効牌を計算（ハイブリッド版を使用）
-        result = get_shanten_and_effective_tiles_hybrid(request.hand)
+        result = await discard_service.calculate("agarihai", request.hand)
 
         elapsed_time = time.time() - start_time
         logger.info(f"Agarihai calculated in {elapsed_time:.4f}s for hand: {request.hand}")
@@ -52,6 +54,12 @@ async def get_agarihai(request: RecommendDiscardRequest):
                 status_code=400,
                 detail=f"手牌の形式が正しくありません: {error_message}"
             )
+    except EngineQueueFullError as e:
+        logger.warning(f"Engine queue is full: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server busy: {str(e)}"
+        )
     except Exception as e:
         logger.error(f"Error in get_agarihai: {str(e)}")
         raise HTTPException(
@@ -60,34 +68,68 @@ async def get_agarihai(request: RecommendDiscardRequest):
         )
 
 
-@router.get("/health")
-async def agarihai_health_check():
-    """あがり牌サービスのヘルスチェック"""
-    try:
-        # 簡単なテスト計算を実行（13枚の手牌）
-        test_hand = "1122334567m112s"
+@router.post("/batch")
+async def get_agarihai_batch(request: BatchRecommendRequest):
+    """
+    あがり牌を一括取得（同じ手牌は1回だけ計算）
 
-        start_time = time.time()
-        test_result = get_shanten_and_effective_tiles_hybrid(test_hand)
-        elapsed_time = time.time() - start_time
+    Args:
+        request: 手牌データ（13枚）のリスト
 
-        return {
-            "status": "healthy",
-            "service": "agarihai",
-            "test_passed": True,
-            "test_hand": test_hand,
-            "test_result": {
-                "isTenpai": test_result['isTenpai'],
-                "agarihai": test_result['agarihai']
-            },
-            "calculation_time": f"{elapsed_time:.4f}s"
-        }
+    Returns:
+        入力順の計算結果（手牌ごとに成功/失敗を返す）
+    """
+    start_time = time.time()
 
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
-        return {
-            "status": "unhealthy",
-            "service": "agarihai",
-            "test_passed": False,
-            "error": str(e)
-        }
+    hands = [item.hand for item in request.hands]
+    results, unique_hands = await discard_service.calculate_batch("agarihai", hands)
+
+    elapsed_time = time.time() - start_time
+    logger.info(f"Batch agarihai calculated in {elapsed_time:.4f}s for {len(hands)} hands")
+
+    return {
+        "results": [
+            {
+                "success": True,
+                "isTenpai": r["result"]["isTenpai"],
+                "agarihai": r["result"]["agarihai"],
+            } if r["success"] else r
+            for r in results
+        ],
+        "unique_hands": unique_hands,
+        "calculation_time": f"{elapsed_time:.4f}s"
+    }
+
+
+async def _agarihai_self_test():
+    """あがり牌サービスの自己診断"""
+    # 簡単なテスト計算を実行（13枚の手牌）
+    test_hand = "1122334567m112s"
+
+    start_time = time.time()
+    test_result = await discard_service.calculate("agarihai", test_hand, use_cache=False)
+    elapsed_time = time.time() - start_time
+
+    return {
+        "status": "healthy",
+        "service": "agarihai",
+        "test_passed": True,
+        "test_hand": test_hand,
+        "test_result": {
+            "isTenpai": test_result['isTenpai'],
+            "agarihai": test_result['agarihai']
+        },
+        "calculation_time": f"{elapsed_time:.4f}s"
+    }
+
+
+health_monitor.register("agarihai", _agarihai_self_test)
+
+
+@router.get("/health")
+async def agarihai_health_check(deep: bool = False):
+    """
+    あがり牌サービスのヘルスチェック
+    定期実行している自己診断の直近の結果を返す（deep=true なら今すぐ実行する）
+    """
+    return await health_monitor.check("agarihai", deep)
@@ -1,18 +1,38 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import StreamingResponse
+import json
 import logging
 import time
 
-from ..schema import RecommendDiscardRequest, RecommendDiscardResponse
-from ..utils.discard_simulator import get_recommended_discard, get_cache_info
-from ..utils.discard_simulator_hybrid import (
-    get_recommended_discard_hybrid,
-    analyze_discard_candidates_hybrid
-)
+from ..schema import RecommendDiscardRequest, RecommendDiscardResponse, BatchRecommendRequest
+from ..services.discard_service import discard_service, iter_ndjson_lines
+from ..services.engine_executor import engine_executor, EngineQueueFullError
+from ..services.health_monitor import health_monitor
+from ..services.result_cache import result_cache
+from ..utils.discard_simulator import clear_cache
+from ..utils.discard_simulator_hybrid import get_cache_info_hybrid
+from ..utils.metrics import STAGE_DURATION
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(tags=["recommendAPI"], prefix="/api/v1/recommend")
 
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    リクエスト本文を読みながら返すストリーミングレスポンス
+
+    StreamingResponse は切断検知のために receive() を読み続けるため、
+    本文のチャンクを横取りしてしまう。ここでは receive() を本文の読み込みだけに使い、
+    切断は request.stream() 側の ClientDisconnect で検知する。
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
 @router.post("", response_model=RecommendDiscardResponse)
 async def recommend_discard(request: RecommendDiscardRequest) -> RecommendDiscardResponse:
     """
@@ -28,7 +48,7 @@ async def recommend_discard(request: RecommendDiscardRequest) -> RecommendDiscar
         start_time = time.time()
 
         # 推奨打牌を計算（ハイブリッド版を使用）
-        recommended_tile = get_recommended_discard_hybrid(request.hand)
+        recommended_tile = await discard_service.calculate("recommend", request.hand)
 
         elapsed_time = time.time() - start_time
         logger.info(f"Recommendation calculated in {elapsed_time:.4f}s for hand: {request.hand}")
@@ -41,6 +61,12 @@ async def recommend_discard(request: RecommendDiscardRequest) -> RecommendDiscar
             status_code=400,
             detail=f"Invalid hand data: {str(e)}"
         )
+    except EngineQueueFullError as e:
+        logger.warning(f"Engine queue is full: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server busy: {str(e)}"
+        )
     except Exception as e:
         logger.error(f"Error in recommend_discard: {str(e)}")
         raise HTTPException(
@@ -49,51 +75,81 @@ async def recommend_discard(request: RecommendDiscardRequest) -> RecommendDiscar
         )
 
 
-@router.get("/recommend/health")
-async def recommend_health_check():
-    """推奨打牌サービスのヘルスチェック（ハイブリッド版）"""
-    try:
-        # 簡単なテスト計算を実行
-        test_hand = "11223345678m112s"
+@router.post("/batch")
+async def recommend_discard_batch(request: BatchRecommendRequest):
+    """
+    推奨打牌を一括計算（同じ手牌は1回だけ計算）
 
-        start_time = time.time()
-        test_result = get_recommended_discard_hybrid(test_hand)
-        elapsed_time = time.time() - start_time
+    Args:
+        request: 手牌データのリスト
 
-        if test_result:
-            return {
-                "status": "healthy",
-                "service": "recommend_discard_hybrid",
-                "test_passed": True,
-                "test_hand": test_hand,
-                "test_result": test_result,
-                "calculation_time": f"{elapsed_time:.4f}s"
-            }
-        else:
-            return {
-                "status": "unhealthy",
-                "service": "recommend_discard_hybrid",
-                "test_passed": False,
-                "error": "No recommendation returned"
-            }
+    Returns:
+        入力順の計算結果（手牌ごとに成功/失敗を返す）
+    """
+    start_time = time.time()
 
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
+    hands = [item.hand for item in request.hands]
+    results, unique_hands = await discard_service.calculate_batch("recommend", hands)
+
+    elapsed_time = time.time() - start_time
+    logger.info(f"Batch recommendation calculated in {elapsed_time:.4f}s for {len(hands)} hands")
+
+    return {
+        "results": [
+            {"success": True, "recommend": r["result"]} if r["success"] else r
+            for r in results
+        ],
+        "unique_hands": unique_hands,
+        "calculation_time": f"{elapsed_time:.4f}s"
+    }
+
+
+async def _recommend_self_test():
+    """推奨打牌サービスの自己診断（ハイブリッド版）"""
+    # 簡単なテスト計算を実行
+    test_hand = "11223345678m112s"
+
+    start_time = time.time()
+    test_result = await discard_service.calculate("recommend", test_hand, use_cache=False)
+    elapsed_time = time.time() - start_time
+
+    if test_result:
         return {
-            "status": "unhealthy",
-            "service": "recommend_discard",
-            "test_passed": False,
-            "error": str(e)
+            "status": "healthy",
+            "service": "recommend_discard_hybrid",
+            "test_passed": True,
+            "test_hand": test_hand,
+            "test_result": test_result,
+            "calculation_time": f"{elapsed_time:.4f}s"
         }
+    return {
+        "status": "unhealthy",
+        "service": "recommend_discard_hybrid",
+        "test_passed": False,
+        "error": "No recommendation returned"
+    }
+
+
+health_monitor.register("recommend", _recommend_self_test)
+
+
+@router.get("/recommend/health")
+async def recommend_health_check(deep: bool = False):
+    """
+    推奨打牌サービスのヘルスチェック（ハイブリッド版）
+    定期実行している自己診断の直近の結果を返す（deep=true なら今すぐ実行する）
+    """
+    return await health_monitor.check("recommend", deep)
 
 @router.get("/cache/info")
 async def get_cache_statistics():
-    """システム統計情報を取得（ハイブリッド版では従来のキャッシュは使用しない）"""
+    """計算結果キャッシュの統計情報を取得（ヒット・ミス・削除件数・サイズ・同時リクエストの集約数）"""
     try:
         return {
             "status": "success",
-            "message": "ハイブリッド版ではNodeJSプロセスを使用するため、従来のキャッシュは使用していません",
-            "system": "hybrid_nodejs_python"
+            "result_cache": result_cache.stats(),
+            "single_flight": discard_service.stats(),
+            "engine": get_cache_info_hybrid()
         }
     except Exception as e:
         logger.error(f"Error getting system info: {str(e)}")
@@ -103,6 +159,27 @@ async def get_cache_statistics():
         )
 
 
+@router.post("/cache/clear")
+async def clear_cache_statistics():
+    """計算結果キャッシュとPython版のキャッシュをクリア"""
+    result_cache.clear()
+    clear_cache()
+    logger.info("Result cache cleared")
+    return {
+        "status": "success",
+        "result_cache": result_cache.stats()
+    }
+
+
+@router.get("/executor/info")
+async def get_executor_statistics():
+    """エンジン実行キューの統計情報を取得（キュー深さ・待ち時間）"""
+    return {
+        "status": "success",
+        "executor": engine_executor.stats()
+    }
+
+
 @router.post("/analyze")
 async def analyze_discard_options(request: RecommendDiscardRequest):
     """
@@ -118,7 +195,7 @@ async def analyze_discard_options(request: RecommendDiscardRequest):
         start_time = time.time()
 
         # 詳細分析を実行（ハイブリッド版を使用）
-        candidates = analyze_discard_candidates_hybrid(request.hand)
+        candidates = await discard_service.calculate("analyze", request.hand)
 
         elapsed_time = time.time() - start_time
         logger.info(f"Analysis completed in {elapsed_time:.4f}s for hand: {request.hand}")
@@ -135,9 +212,71 @@ async def analyze_discard_options(request: RecommendDiscardRequest):
             status_code=400,
             detail=f"Invalid hand data: {str(e)}"
         )
+    except EngineQueueFullError as e:
+        logger.warning(f"Engine queue is full: {str(e)}")
+        raise HTTPException(
+            status_code=503,
+            detail=f"Server busy: {str(e)}"
+        )
     except Exception as e:
         logger.error(f"Error in analyze_discard_options: {str(e)}")
         raise HTTPException(
             status_code=500,
             detail=f"Internal server error: {str(e)}"
         )
+
+
+@router.post("/analyze/batch")
+async def analyze_discard_options_batch(request: BatchRecommendRequest):
+    """
+    打牌候補の詳細分析を一括実行（同じ手牌は1回だけ計算）
+
+    Args:
+        request: 手牌データのリスト
+
+    Returns:
+        入力順の分析結果（手牌ごとに成功/失敗を返す）
+    """
+    start_time = time.time()
+
+    hands = [item.hand for item in request.hands]
+    results, unique_hands = await discard_service.calculate_batch("analyze", hands)
+
+    elapsed_time = time.time() - start_time
+    logger.info(f"Batch analysis completed in {elapsed_time:.4f}s for {len(hands)} hands")
+
+    return {
+        "results": [
+            {"success": True, "hand": hand, "candidates": r["result"]} if r["success"] else r
+            for hand, r in zip(hands, results)
+        ],
+        "unique_hands": unique_hands,
+        "calculation_time": f"{elapsed_time:.4f}s"
+    }
+
+
+@router.post("/analyze/stream")
+async def analyze_discard_options_stream(request: Request):
+    """
+    打牌候補の詳細分析をストリーミングで実行
+
+    リクエスト本文は1行1手牌のNDJSON（{"hand": "..."}）。
+    本文を少しずつ読みながら計算し、結果を入力順に1行ずつNDJSONで返す。
+    同時に計算する件数は上限があるため、大量の手牌でもメモリ使用量は増えない。
+    """
+    async def generate():
+        start_time = time.time()
+        count = 0
+        results = discard_service.calculate_stream("analyze", iter_ndjson_lines(request.stream()))
+        async for result in results:
+            count += 1
+            if result["success"]:
+                result = {"line": result["line"], "success": True, "hand": result["hand"], "candidates": result["result"]}
+            with STAGE_DURATION.time("serialize"):
+                line = json.dumps(result, ensure_ascii=False) + "\n"
+            yield line
+
+        elapsed_time = time.time() - start_time
+        logger.info(f"Streaming analysis completed in {elapsed_time:.4f}s for {count} hands")
+
+    return BodyStreamingResponse(generate(), media_type="application/x-ndjson")
@@ -2,6 +2,8 @@ from fastapi import APIRouter, Depends, HTTPException
 import logging
 
 from ..schema import RiichiCalculateRequest, RiichiCalculateResponse
+from ..services.health_monitor import health_monitor
+from ..services.result_cache import score_cache
 from ..services.riichi_service import riichi_service
 
 logger = logging.getLogger(__name__)
@@ -41,35 +43,51 @@ async def calculate_riichi_score(request: RiichiCalculateRequest) -> RiichiCalcu
             detail=f"Internal server error: {str(e)}"
         )
 
-@router.get("/health")
-async def riichi_health_check():
-    """riichサービスのヘルスチェック"""
-    try:
-        # 簡単なテスト計算を実行
-        test_result = await riichi_service.calculate_score("112233456789m11s")
-        
-        if test_result.get("success"):
-            return {
-                "status": "healthy",
-                "service": "riichi_calculator",
-                "test_passed": True
-            }
-        else:
-            return {
-                "status": "unhealthy",
-                "service": "riichi_calculator",
-                "test_passed": False,
-                "error": test_result.get("error")
-            }
-            
-    except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
+async def _score_self_test():
+    """riichサービスの自己診断"""
+    # 簡単なテスト計算を実行
+    test_result = await riichi_service.calculate_score("112233456789m11s", use_cache=False)
+
+    if test_result.get("success"):
         return {
-            "status": "unhealthy",
+            "status": "healthy",
             "service": "riichi_calculator",
-            "test_passed": False,
-            "error": str(e)
+            "test_passed": True
         }
+    return {
+        "status": "unhealthy",
+        "service": "riichi_calculator",
+        "test_passed": False,
+        "error": test_result.get("error")
+    }
+
+health_monitor.register("score", _score_self_test)
+
+@router.get("/health")
+async def riichi_health_check(deep: bool = False):
+    """
+    riichサービスのヘルスチェック
+    定期実行している自己診断の直近の結果を返す（deep=true なら今すぐ実行する）
+    """
+    return await health_monitor.check("score", deep)
+
+@router.get("/cache/info")
+async def get_score_cache_statistics():
+    """点数計算結果キャッシュの統計情報を取得"""
+    return {
+        "status": "success",
+        "score_cache": score_cache.stats()
+    }
+
+@router.post("/cache/clear")
+async def clear_score_cache():
+    """点数計算結果キャッシュをクリア"""
+    score_cache.clear()
+    logger.info("Score cache cleared")
+    return {
+        "status": "success",
+        "score_cache": score_cache.stats()
+    }
 
 @router.get("/debug")
 async def riichi_debug():
@@ -47,3 +47,14 @@ class RecommendDiscardRequest(BaseModel):
 class RecommendDiscardResponse(BaseModel):
     """推奨打牌レスポンス"""
     recommend: str = Field(..., description="推奨打牌", example="2s")
+
+
+class BatchRecommendRequest(BaseModel):
+    """一括計算リクエスト（推奨打牌・打牌分析・あがり牌共通）"""
+    hands: List[RecommendDiscardRequest] = Field(
+        ...,
+        description="手牌データのリスト",
+        min_length=1,
+        max_length=1000,
+        example=[{"hand": "11223345678m112s"}, {"hand": "123456789m1123p3s"}]
+    )
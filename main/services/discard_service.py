@@ -0,0 +1,669 @@
+import asyncio
+import json
+from collections import Counter, deque
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Sequence, Tuple, Union
+import logging
+
+from .engine_executor import EngineExecutor, EngineQueueFullError, engine_executor
+from .result_cache import CacheBackend, result_cache
+from ..utils.batch_evaluator import CHUNK_SIZE as BATCH_CHUNK_SIZE, analyze_hands_batch
+from ..utils.canonical import canonicalize, index_maps
+from ..utils.discard_simulator import tile_to_index, count_index_to_tile
+from ..utils.discard_simulator_hybrid import (
+    DISCARD_ENGINE,
+    get_recommended_discard_hybrid,
+    analyze_discard_candidates_hybrid,
+    get_shanten_and_effective_tiles_hybrid
+)
+from ..utils.hand import Hand, pack_counts
+from ..utils.metrics import CACHE_REQUESTS, HAND_SHANTEN
+from ..utils.request_timing import item_timing, set_engine, timed_stage
+from ..utils.shanten_table import get_tile_priority
+
+logger = logging.getLogger(__name__)
+
+# アクション名と計算関数の対応
+ACTIONS: Dict[str, Callable[[str], Any]] = {
+    "recommend": get_recommended_discard_hybrid,
+    "analyze": analyze_discard_candidates_hybrid,
+    "agarihai": get_shanten_and_effective_tiles_hybrid,
+}
+
+# アクションごとの手牌枚数
+HAND_SIZES = {"recommend": 14, "analyze": 14, "agarihai": 13}
+
+# ストリーミング計算で受け付けるNDJSONの1行の最大バイト数
+MAX_NDJSON_LINE_BYTES = 64 * 1024
+
+
+def _map_tile(tile: str, index_map: Sequence[int]) -> str:
+    return count_index_to_tile(index_map[tile_to_index(tile)])
+
+
+def _map_tile_types(tile_types: List[Dict], index_map: Sequence[int]) -> List[Dict]:
+    # 変換後の牌の順（萬子→筒子→索子→字牌）に並べ直す
+    mapped = sorted((index_map[tile_to_index(t['tile'])], t['count']) for t in tile_types)
+    return [{'tile': count_index_to_tile(index), 'count': count} for index, count in mapped]
+
+
+def _map_candidate(candidate: Dict, index_map: Sequence[int]) -> Dict:
+    return {
+        'discard': _map_tile(candidate['discard'], index_map),
+        'shanten': candidate['shanten'],
+        'effective_tiles': candidate['effective_tiles'],
+        'effective_tile_types': _map_tile_types(candidate['effective_tile_types'], index_map)
+    }
+
+
+def _map_agarihai(result: Dict, index_map: Sequence[int]) -> Dict:
+    effective_tiles = _map_tile_types(result['effective_tiles'], index_map)
+    return {
+        **result,
+        'agarihai': [tile['tile'] for tile in effective_tiles],
+        'effective_tiles': effective_tiles
+    }
+
+
+def _sort_candidates(candidates: List[Dict]) -> List[Dict]:
+    # 打牌分析と同じ並び順（同点は出現順のまま）
+    return sorted(candidates, key=lambda x: (x['shanten'], -x['effective_tiles'], -get_tile_priority(x['discard'])))
+
+
+def _recommend_from_candidates(tiles: List[str], candidates: Dict[str, Dict]) -> str:
+    # discard_calculator.js と同じく、枚数の多い順（同数なら出現順）に評価して最初に最良となった牌を選ぶ
+    # candidates は呼び出し元の牌をキーとする（向聴数・有効牌枚数のみ参照）
+    tile_counts = Counter(tiles)
+    best_discard = None
+    best_key = None
+    for tile in sorted(dict.fromkeys(tiles), key=lambda x: -tile_counts[x]):
+        candidate = candidates[tile]
+        key = (-candidate['shanten'], candidate['effective_tiles'], get_tile_priority(tile))
+        if best_key is None or key > best_key:
+            best_key = key
+            best_discard = tile
+    return best_discard
+
+
+def _parse_sized(action: str, hand: str) -> Optional[Hand]:
+    # アクションに合った枚数の正しい手牌なら Hand を返す
+    try:
+        parsed = Hand.parse(hand)
+    except ValueError:
+        return None
+    return parsed if len(parsed) == HAND_SIZES[action] else None
+
+
+def _candidates_to_cache(candidates: List[Dict], to_canonical: Sequence[int]) -> Dict[str, Dict]:
+    # 正規形の牌での打牌 -> 打牌候補（推奨打牌・打牌分析で共有するキャッシュの値）
+    cached = {}
+    for candidate in candidates:
+        candidate = _map_candidate(candidate, to_canonical)
+        cached[candidate['discard']] = candidate
+    return cached
+
+
+def _from_cached(
+    action: str,
+    parsed: Hand,
+    cached: Dict,
+    to_canonical: Sequence[int],
+    from_canonical: Sequence[int]
+) -> Any:
+    # 呼び出し元の牌に戻し、牌の並び順に依存する部分は呼び出し元の手牌で組み立て直す
+    if action == "agarihai":
+        HAND_SHANTEN.inc(action, cached['shanten'])
+        return _map_agarihai(cached, from_canonical)
+    HAND_SHANTEN.inc(action, min(candidate['shanten'] for candidate in cached.values()))
+    tiles = parsed.tiles()
+    candidates = {tile: cached[_map_tile(tile, to_canonical)] for tile in dict.fromkeys(tiles)}
+    if action == "analyze":
+        return _sort_candidates([
+            _map_candidate(candidate, from_canonical) for candidate in candidates.values()
+        ])
+    return _recommend_from_candidates(tiles, candidates)
+
+
+class DiscardService:
+    """推奨打牌・打牌分析・あがり牌計算サービス"""
+
+    def __init__(
+        self,
+        executor: EngineExecutor,
+        actions: Optional[Dict[str, Callable[[str], Any]]] = None,
+        cache: Optional[CacheBackend] = None,
+        analyze_many: Optional[Callable[[List[str]], List[List[Dict]]]] = None
+    ):
+        self.executor = executor
+        self.actions = actions if actions is not None else ACTIONS
+        self.cache = cache
+        # 複数の手牌の打牌候補を1回で計算する関数（一括計算版エンジンのみ。None なら1件ずつ計算する）
+        self.analyze_many = analyze_many
+        # 計算中のキー -> 共有する計算タスク（同じ手牌の同時リクエストは1回だけ計算する）
+        self._in_flight: Dict[Any, asyncio.Task] = {}
+        self._computations = 0
+        self._coalesced = 0
+
+    async def calculate(self, action: str, hand: str, use_cache: bool = True) -> Any:
+        """
+        1つの手牌を計算（エンジンはエグゼキュータ上で実行）
+
+        Args:
+            action: "recommend" / "analyze" / "agarihai"
+            hand: 手牌文字列
+            use_cache: 計算結果キャッシュを使うか（ヘルスチェックでは使わない）
+
+        Returns:
+            各計算関数の戻り値
+        """
+        with timed_stage("parse"):
+            parsed = self._parse_cacheable(action, hand) if use_cache else None
+            if parsed is not None:
+                # キーは色の入れ替え・数字の反転で揃えた正規形（枚数を詰めた整数）
+                # 推奨打牌と打牌分析は同じ打牌候補データを共有する
+                kind = "agarihai" if action == "agarihai" else "candidates"
+                canonical, transform = canonicalize(parsed.counts)
+                to_canonical, from_canonical = index_maps(transform)
+                key = (kind, pack_counts(canonical))
+
+        if parsed is None:
+            # キャッシュなし・不正な手牌はそのまま計算（エラーは計算関数が返す）
+            return await self.executor.run(self.actions[action], hand)
+
+        with timed_stage("cache"):
+            cached = await self.cache.aget(key)
+        CACHE_REQUESTS.inc("discard", "miss" if cached is None else "hit")
+        if cached is not None:
+            set_engine("cache")
+        else:
+            task = self._in_flight.get(key)
+            if task is None:
+                task = asyncio.ensure_future(self._compute(key, hand, to_canonical))
+                self._in_flight[key] = task
+                task.add_done_callback(lambda done: self._finish(key, done))
+                self._computations += 1
+            else:
+                self._coalesced += 1
+                set_engine("single-flight")
+            # 待っている1つのリクエストがキャンセルされても共有の計算は続ける
+            cached = await asyncio.shield(task)
+
+        return _from_cached(action, parsed, cached, to_canonical, from_canonical)
+
+    async def _compute(self, key: Any, hand: str, to_canonical: Sequence[int]) -> Dict:
+        """計算して正規形の牌でキャッシュに保存する"""
+        kind = key[0]
+        if kind == "agarihai":
+            result = await self.executor.run(self.actions["agarihai"], hand)
+            cached = _map_agarihai(result, to_canonical)
+        else:
+            candidates = await self.executor.run(self.actions["analyze"], hand)
+            cached = _candidates_to_cache(candidates, to_canonical)
+        with timed_stage("cache"):
+            await self.cache.aset(key, cached)
+        return cached
+
+    def _finish(self, key: Any, task: asyncio.Task):
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # 待っていたリクエストが全てキャンセルされた場合も例外を回収しておく
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """同時リクエストの集約状況"""
+        return {
+            "in_flight": len(self._in_flight),
+            "computations": self._computations,
+            "coalesced": self._coalesced
+        }
+
+    def _parse_cacheable(self, action: str, hand: str) -> Optional[Hand]:
+        """キャッシュを使える手牌なら Hand を返す"""
+        if self.cache is None:
+            return None
+        return _parse_sized(action, hand)
+
+    async def calculate_batch(self, action: str, hands: List[str]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        複数の手牌をまとめて計算
+
+        同じ手牌（キャッシュ・一括計算では同じ正規形）は1回だけ計算し、異なる手牌はエグゼキュータの同時実行数まで並列に計算する。
+        1件の失敗で全体を失敗させず、入力順に手牌ごとの成功/失敗を返す。
+
+        Returns:
+            (入力順の [{"success": True, "result": ...} または {"success": False, "error": {...}}, ...],
+             計算したキーの種類数)
+        """
+        unique_hands = list(dict.fromkeys(hands))
+        unique_keys = len({self._batch_key(action, hand) for hand in unique_hands})
+        # キューを溢れさせないよう、同時に投入する件数をワーカー数までに抑える
+        window = asyncio.Semaphore(self.executor.max_workers)
+
+        async def calculate_one(hand: str) -> Dict[str, Any]:
+            # 並列に計算する各件の処理時間は別に集計する（合計すると Server-Timing の total を超える）
+            with item_timing():
+                async with window:
+                    return await self._calculate_item(action, hand)
+
+        by_hand: Dict[str, Dict[str, Any]] = {}
+        if self.analyze_many is not None and action != "agarihai":
+            by_hand = await self._calculate_many(action, unique_hands, window)
+
+        rest = [hand for hand in unique_hands if hand not in by_hand]
+        results = await asyncio.gather(*(calculate_one(hand) for hand in rest))
+        by_hand.update(zip(rest, results))
+        return [by_hand[hand] for hand in hands], unique_keys
+
+    def _batch_key(self, action: str, hand: str) -> Any:
+        """一括計算で同じ計算にまとまる単位（正規形でまとめない手牌は手牌文字列そのもの）"""
+        vectorized = self.analyze_many is not None and action != "agarihai"
+        parsed = _parse_sized(action, hand) if self.cache is not None or vectorized else None
+        if parsed is None:
+            return hand
+        kind = "agarihai" if action == "agarihai" else "candidates"
+        return kind, pack_counts(canonicalize(parsed.counts)[0])
+
+    async def _calculate_many(
+        self,
+        action: str,
+        hands: List[str],
+        window: asyncio.Semaphore
+    ) -> Dict[str, Dict[str, Any]]:
+        """
+        キャッシュにない手牌の打牌候補を analyze_many でまとめて計算する
+
+        不正な手牌や計算に失敗した手牌は結果に含めない（呼び出し元で1件ずつ計算してエラーを返す）
+        """
+        entries = {}
+        for hand in hands:
+            parsed = _parse_sized(action, hand)
+            if parsed is None:
+                continue
+            canonical, transform = canonicalize(parsed.counts)
+            to_canonical, from_canonical = index_maps(transform)
+            entries[hand] = (parsed, ("candidates", pack_counts(canonical)), to_canonical, from_canonical)
+
+        # 正規形ごとにキャッシュを引き、ない正規形は代表の手牌1つだけ計算する
+        values: Dict[Any, Dict] = {}
+        misses: Dict[Any, str] = {}
+        for hand, (_, key, _, _) in entries.items():
+            if key in values or key in misses:
+                continue
+            cached = None
+            if self.cache is not None:
+                with timed_stage("cache"):
+                    cached = await self.cache.aget(key)
+                CACHE_REQUESTS.inc("discard", "miss" if cached is None else "hit")
+            if cached is not None:
+                values[key] = cached
+            else:
+                misses[key] = hand
+
+        async def compute_chunk(keys: List[Any]):
+            chunk_hands = [misses[key] for key in keys]
+            with item_timing():
+                try:
+                    async with window:
+                        results = await self.executor.run(self.analyze_many, chunk_hands)
+                except Exception as e:
+                    logger.warning(f"Batch {action} for {len(chunk_hands)} hands failed: {str(e)}")
+                    return
+                for key, hand, candidates in zip(keys, chunk_hands, results):
+                    values[key] = _candidates_to_cache(candidates, entries[hand][2])
+                    if self.cache is not None:
+                        with timed_stage("cache"):
+                            await self.cache.aset(key, values[key])
+
+        keys = list(misses)
+        await asyncio.gather(*(
+            compute_chunk(keys[i:i + BATCH_CHUNK_SIZE]) for i in range(0, len(keys), BATCH_CHUNK_SIZE)
+        ))
+        if misses:
+            set_engine("batch")
+
+        return {
+            hand: {"success": True, "result": _from_cached(action, parsed, values[key], to_canonical, from_canonical)}
+            for hand, (parsed, key, to_canonical, from_canonical) in entries.items()
+            if key in values
+        }
+
+    async def _calculate_item(self, action: str, hand: str) -> Dict[str, Any]:
+        """1件を計算し、例外は手牌ごとのエラー結果に変換する"""
+        try:
+            return {"success": True, "result": await self.calculate(action, hand)}
+        except ValueError as e:
+            return {"success": False, "error": {"message": f"Invalid hand data: {str(e)}"}}
+        except EngineQueueFullError as e:
+            return {"success": False, "error": {"message": f"Server busy: {str(e)}"}}
+        except Exception as e:
+            logger.error(f"Error in {action} for hand {hand}: {str(e)}")
+            return {"success": False, "error": {"message": f"Internal server error: {str(e)}"}}
+
+    async def calculate_stream(
+        self,
+        action: str,
+        lines: AsyncIterator[Union[str, ValueError]],
+        max_in_flight: Optional[int] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        NDJSONの各行（{"hand": "..."}）を順に計算し、結果を入力順に1件ずつ返す
+
+        計算中の件数が max_in_flight に達している間は次の行を読まないため、
+        入力がどれだけ大きくてもメモリ使用量は一定に保たれる。
+        lines の要素が ValueError（iter_ndjson_lines で読めなかった行）ならその行のエラー結果を返す。
+
+        Yields:
+            {"line": 行番号, "success": True, "hand": ..., "result": ...}
+            または {"line": 行番号, "success": False, "error": {...}}
+        """
+        max_in_flight = max(1, max_in_flight or self.executor.max_workers)
+        in_flight: "deque[asyncio.Task]" = deque()
+        line_no = 0
+
+        async def calculate_line(number: int, line: Union[str, ValueError]) -> Dict[str, Any]:
+            try:
+                if isinstance(line, ValueError):
+                    raise line
+                hand = json.loads(line)["hand"]
+                if not isinstance(hand, str):
+                    raise TypeError("hand must be a string")
+            except (ValueError, KeyError, TypeError) as e:
+                return {"line": number, "success": False, "error": {"message": f"Invalid NDJSON line: {str(e)}"}}
+            with item_timing():
+                result = await self._calculate_item(action, hand)
+            return {"line": number, "hand": hand, **result} if result["success"] else {"line": number, **result}
+
+        try:
+            async for line in lines:
+                if isinstance(line, str):
+                    line = line.strip()
+                    if not line:
+                        continue
+                line_no += 1
+                in_flight.append(asyncio.ensure_future(calculate_line(line_no, line)))
+
+                # 上限に達したら先頭の結果を返してから次の行を読む
+                while len(in_flight) >= max_in_flight:
+                    yield await in_flight.popleft()
+                # 先頭から完了済みのものはすぐに返す
+                while in_flight and in_flight[0].done():
+                    yield in_flight.popleft().result()
+
+            while in_flight:
+                yield await in_flight.popleft()
+        finally:
+            # クライアント切断時などは残りの計算を打ち切る
+            for task in in_flight:
+                task.cancel()
+
+
+def _decode_line(data: bytes) -> Union[str, ValueError]:
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        return e
+
+
+async def iter_ndjson_lines(
+    chunks: AsyncIterator[bytes],
+    max_line_bytes: int = MAX_NDJSON_LINE_BYTES
+) -> AsyncIterator[Union[str, ValueError]]:
+    """
+    受信したバイト列のチャンクを行単位に分割する（保持するのは読みかけの1行・max_line_bytes まで）
+
+    UTF-8として読めない行・max_line_bytes を超える行は、その行の代わりに ValueError を返す
+    （calculate_stream がその行だけのエラー結果にする）。長すぎる行の残りは次の改行まで読み捨てる。
+    """
+    buffer = bytearray()
+    overflow = False  # 長すぎる行の残りを読み捨て中
+    too_long = f"line exceeds {max_line_bytes} bytes"
+    async for chunk in chunks:
+        start = 0
+        while True:
+            end = chunk.find(b"\n", start)
+            piece = chunk[start:] if end < 0 else chunk[start:end]
+            if not overflow and len(buffer) + len(piece) > max_line_bytes:
+                overflow = True
+                buffer.clear()
+            if not overflow:
+                buffer += piece
+            if end < 0:
+                break
+            if overflow:
+                yield ValueError(too_long)
+                overflow = False
+            else:
+                yield _decode_line(bytes(buffer))
+            buffer.clear()
+            start = end + 1
+    if overflow:
+        yield ValueError(too_long)
+    elif buffer:
+        yield _decode_line(bytes(buffer))
+
+
+# シングルトンインスタンス
+# 一括計算版エンジンでは複数手牌のリクエストを analyze_hands_batch 1回で計算する
+discard_service = DiscardService(
+    engine_executor,
+    cache=result_cache,
+    analyze_many=analyze_hands_batch if DISCARD_ENGINE == "batch" else None
+)
+
+
+# テスト用の関数
+def test_single_flight(concurrency: int = 50, delay: float = 0.05):
+    """同じ手牌（色違い・並び順違いを含む）の同時リクエストが1回の計算にまとまることのテスト"""
+    import time
+    from .result_cache import MemoryCacheBackend
+    from ..utils.shanten_table import analyze_discard_candidates_table
+
+    def slow_analyze(hand: str):
+        time.sleep(delay)
+        return analyze_discard_candidates_table(hand)
+
+    service = DiscardService(
+        EngineExecutor(max_workers=4, max_queue=100),
+        {"analyze": slow_analyze},
+        MemoryCacheBackend(max_entries=100, max_bytes=1024 * 1024)
+    )
+    hands = ["11223345678m112s", "11223345678p112m", "112p99887765432s", "99887765432p998m"]
+
+    async def run():
+        tasks = [
+            asyncio.ensure_future(service.calculate("analyze", hands[i % len(hands)]))
+            for i in range(concurrency)
+        ]
+        await asyncio.sleep(delay / 5)
+        # 1つのリクエストをキャンセルしても他は結果を受け取れる
+        tasks[0].cancel()
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return results
+
+    print("=== 同時リクエスト集約テスト ===")
+    results = asyncio.run(run())
+    service.executor.shutdown()
+    stats = service.stats()
+    print(stats)
+
+    ok = isinstance(results[0], asyncio.CancelledError)
+    ok = ok and all(results[i] == analyze_discard_candidates_table(hands[i % len(hands)]) for i in range(1, concurrency))
+    ok = ok and stats["computations"] == 1 and stats["coalesced"] == concurrency - 1 and stats["in_flight"] == 0
+    print("OK" if ok else "NG")
+    return ok
+
+
+def test_batch_vectorized(samples: int = 300, seed: int = 0):
+    """一括計算版エンジンで、複数手牌のリクエストが analyze_many 1回にまとまり1件ずつの計算と一致することのテスト"""
+    import random
+    from .result_cache import MemoryCacheBackend
+    from ..utils.shanten_table import (
+        analyze_discard_candidates_table,
+        get_recommended_discard_table,
+        random_hand_counts
+    )
+    from ..utils.hand import TILE_NAMES
+
+    calls = []
+
+    def analyze_many(hand_strs: List[str]) -> List[List[Dict]]:
+        calls.append(len(hand_strs))
+        return analyze_hands_batch(hand_strs)
+
+    rng = random.Random(seed)
+    hands = ["".join(TILE_NAMES[i] * c for i, c in enumerate(random_hand_counts(rng, 14))) for _ in range(samples)]
+    # 重複・色違い（同じ正規形）・不正な手牌を混ぜる
+    hands += hands[:10] + ["11223345678p112m", "11223345678m112s", "123m", "1111m1m"]
+
+    executor = EngineExecutor(max_workers=4, max_queue=1000)
+    service = DiscardService(
+        executor,
+        {"analyze": analyze_discard_candidates_table, "recommend": get_recommended_discard_table},
+        MemoryCacheBackend(max_entries=10000, max_bytes=64 * 1024 * 1024),
+        analyze_many
+    )
+
+    async def run():
+        analyzed, analyzed_keys = await service.calculate_batch("analyze", hands)
+        recommended, recommended_keys = await service.calculate_batch("recommend", hands)
+        return analyzed, recommended, analyzed_keys, recommended_keys
+
+    print("=== 一括計算版の複数手牌テスト ===")
+    analyzed, recommended, analyzed_keys, recommended_keys = asyncio.run(run())
+    executor.shutdown()
+    print(f"{len(hands)}手: analyze_many 呼び出し {len(calls)}回 ({sum(calls)}手)")
+
+    ok = len(calls) == -(-sum(calls) // BATCH_CHUNK_SIZE) and sum(calls) < samples + 2
+    # 色違いの2手は1つの正規形、不正な2手はそれぞれ1キー
+    ok = ok and analyzed_keys == recommended_keys == sum(calls) + 2
+    for hand, analyze, recommend in zip(hands, analyzed, recommended):
+        try:
+            expected = analyze_discard_candidates_table(hand), get_recommended_discard_table(hand)
+        except ValueError:
+            ok = ok and not analyze["success"] and not recommend["success"]
+            continue
+        ok = ok and analyze == {"success": True, "result": expected[0]}
+        ok = ok and recommend == {"success": True, "result": expected[1]}
+    print("OK" if ok else "NG")
+    return ok
+
+
+def test_stream_backpressure(total: int = 2000, max_in_flight: int = 8, delay: float = 0.001):
+    """ストリーミング計算のスループットとバックプレッシャーのテスト"""
+    import time
+
+    def slow_analyze(hand: str):
+        time.sleep(delay)
+        return [{"discard": hand[:2]}]
+
+    service = DiscardService(EngineExecutor(max_workers=max_in_flight, max_queue=0), {"analyze": slow_analyze})
+    state = {"read": 0, "yielded": 0, "max_ahead": 0}
+
+    async def produce():
+        for i in range(total):
+            state["read"] += 1
+            state["max_ahead"] = max(state["max_ahead"], state["read"] - state["yielded"])
+            yield json.dumps({"hand": f"{i % 9 + 1}m"}) + ("\n" if i % 3 else "\n\n")
+
+    async def consume():
+        lines = []
+        async for result in service.calculate_stream("analyze", produce(), max_in_flight):
+            state["yielded"] += 1
+            lines.append(result["line"])
+        return lines
+
+    print("=== ストリーミング計算テスト ===")
+    start_time = time.time()
+    lines = asyncio.run(consume())
+    elapsed_time = time.time() - start_time
+    service.executor.shutdown()
+
+    print(f"{total}行: {elapsed_time:.4f}秒 ({total / elapsed_time:.0f}行/秒)")
+    print(f"読み込み済み・未返却の最大件数: {state['max_ahead']} (上限 {max_in_flight})")
+
+    # 入力順にすべて返り、先読みは上限以内・逐次実行より十分速いこと
+    ok = lines == list(range(1, total + 1))
+    ok = ok and state["max_ahead"] <= max_in_flight
+    ok = ok and elapsed_time < total * delay / 2
+    print("OK" if ok else "NG")
+    return ok
+
+
+def test_batch_server_timing(count: int = 8, delay: float = 0.02):
+    """並列に計算した一括計算・ストリーミングの区間の処理時間が、経過時間を超えないことのテスト"""
+    import time
+    from ..utils.request_timing import RequestTiming, _current
+
+    def slow_analyze(hand: str):
+        with timed_stage("engine"):
+            time.sleep(delay)
+        return [{"discard": hand[:2]}]
+
+    service = DiscardService(EngineExecutor(max_workers=4, max_queue=100), {"analyze": slow_analyze})
+    hands = [f"{i % 9 + 1}m{i // 9 + 1}p" for i in range(count)]
+
+    async def lines():
+        for hand in hands:
+            yield json.dumps({"hand": hand}) + "\n"
+
+    async def run(stream: bool):
+        timing = RequestTiming()
+        _current.set(timing)
+        if stream:
+            results = [result async for result in service.calculate_stream("analyze", lines())]
+        else:
+            results, _ = await service.calculate_batch("analyze", hands)
+        return timing, time.perf_counter() - timing.start, results
+
+    print("=== 一括計算の Server-Timing テスト ===")
+    ok = True
+    for stream in (False, True):
+        timing, elapsed, results = asyncio.run(run(stream))
+        durations = timing.stage_durations()
+        print(f"{'stream' if stream else 'batch'}: {timing.server_timing()}")
+        ok = ok and all(result["success"] for result in results)
+        ok = ok and delay <= durations["engine"] <= elapsed and durations["queue"] <= elapsed
+    service.executor.shutdown()
+    print("OK" if ok else "NG")
+    return ok
+
+
+def test_ndjson_lines(max_line_bytes: int = 64):
+    """NDJSONの行分割で、長すぎる行・UTF-8でない行がその行だけのエラーになることのテスト"""
+    body = (
+        b'{"hand": "1m"}\n'
+        + b'{"hand": "' + b"9" * (max_line_bytes * 4) + b'"}\n'
+        + b'{"hand": "\xff\xfe"}\n'
+        + '{"hand": "2m"}\n'.encode("utf-8")
+        + b'{"hand": "3m"}'
+    )
+
+    async def chunks(size: int):
+        for i in range(0, len(body), size):
+            yield body[i:i + size]
+
+    service = DiscardService(EngineExecutor(max_workers=2, max_queue=0), {"analyze": lambda hand: hand})
+
+    async def run(size: int):
+        lines = iter_ndjson_lines(chunks(size), max_line_bytes)
+        return [result async for result in service.calculate_stream("analyze", lines)]
+
+    print("=== NDJSON行分割テスト ===")
+    ok = True
+    for size in (1, 7, 4096):
+        results = asyncio.run(run(size))
+        ok = ok and [r["line"] for r in results] == [1, 2, 3, 4, 5]
+        ok = ok and [r["success"] for r in results] == [True, False, False, True, True]
+        ok = ok and [r.get("result") for r in results] == ["1m", None, None, "2m", "3m"]
+        ok = ok and "exceeds" in results[1]["error"]["message"]
+    service.executor.shutdown()
+    print("OK" if ok else "NG")
+    return ok
+
+
+if __name__ == "__main__":
+    test_single_flight()
+    test_batch_vectorized()
+    test_stream_backpressure()
+    test_batch_server_timing()
+    test_ndjson_lines()
@@ -0,0 +1,121 @@
+import asyncio
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import logging
+
+from ..utils.request_timing import record_stage
+
+logger = logging.getLogger(__name__)
+
+
+class EngineQueueFullError(Exception):
+    """実行待ちキューが上限に達した場合の例外"""
+
+
+class EngineExecutor:
+    """
+    牌効率エンジン呼び出し用の上限付きエグゼキュータ
+
+    同期的なエンジン関数（Node.jsワーカー待ち・Pythonフォールバック計算）を
+    スレッドプールで実行し、イベントループをブロックしないようにする。
+    実行中 + 待機中の件数が max_workers + max_queue を超えたら受け付けない。
+    """
+
+    def __init__(self, max_workers: int, max_queue: int):
+        self.max_workers = max(1, max_workers)
+        self.max_queue = max(0, max_queue)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._pending = 0  # 待機中 + 実行中
+        self._running = 0
+        self._rejected = 0
+        self._completed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix="engine"
+                )
+            return self._executor
+
+    async def run(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        エンジン関数をスレッドプールで実行して結果を返す
+
+        Raises:
+            EngineQueueFullError: キューが満杯の場合
+        """
+        executor = self._get_executor()
+
+        with self._lock:
+            if self._pending >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                raise EngineQueueFullError(
+                    f"Engine queue is full ({self._pending - self._running} waiting)"
+                )
+            self._pending += 1
+
+        submitted_at = time.perf_counter()
+
+        def task():
+            wait_time = time.perf_counter() - submitted_at
+            record_stage("queue", wait_time)
+            with self._lock:
+                self._running += 1
+                self._wait_total += wait_time
+                self._wait_max = max(self._wait_max, wait_time)
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        def on_done(_future):
+            # 呼び出し元がキャンセルされても実際の処理が終わるまでは件数に含める
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+
+        # 呼び出し元のコンテキスト（リクエストごとの処理時間の集計など）を引き継いで実行
+        future = executor.submit(contextvars.copy_context().run, task)
+        future.add_done_callback(on_done)
+        return await asyncio.wrap_future(future)
+
+    def stats(self) -> Dict[str, Any]:
+        """キュー深さ・待ち時間などの統計情報"""
+        with self._lock:
+            started = self._completed + self._running
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "running": self._running,
+                "queued": self._pending - self._running,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "wait_time": {
+                    "avg": f"{(self._wait_total / started) if started else 0.0:.4f}s",
+                    "max": f"{self._wait_max:.4f}s"
+                }
+            }
+
+    def shutdown(self):
+        """スレッドプールを終了"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# シングルトンインスタンス
+engine_executor = EngineExecutor(
+    max_workers=int(os.getenv("ENGINE_EXECUTOR_WORKERS", min(32, (os.cpu_count() or 1) + 4))),
+    max_queue=int(os.getenv("ENGINE_EXECUTOR_MAX_QUEUE", 100))
+)
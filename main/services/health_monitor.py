@@ -0,0 +1,79 @@
+"""
+各サービスの自己診断（テスト計算）をバックグラウンドで定期実行し、結果を保持する
+ヘルスチェックAPIは保持している結果を返すだけなので、呼ばれても計算は走らない
+"""
+
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+HealthCheck = Callable[[], Awaitable[Dict[str, Any]]]
+
+
+class HealthMonitor:
+    """
+    自己診断の定期実行と結果の保持
+
+    - interval: 自己診断の実行間隔（秒）
+    - 自己診断は {"status": "healthy" / "unhealthy", ...} を返す非同期関数
+    """
+
+    def __init__(self, interval: float):
+        self.interval = max(1.0, interval)
+        self._checks: Dict[str, HealthCheck] = {}
+        self._verdicts: Dict[str, Dict[str, Any]] = {}
+
+    def register(self, name: str, check: HealthCheck):
+        """自己診断を登録"""
+        self._checks[name] = check
+
+    async def run_check(self, name: str) -> Dict[str, Any]:
+        """自己診断を今すぐ実行し、結果を保持して返す"""
+        start = time.perf_counter()
+        try:
+            verdict = await self._checks[name]()
+        except Exception as e:
+            logger.error(f"Health check '{name}' failed: {str(e)}")
+            verdict = {"status": "unhealthy", "service": name, "test_passed": False, "error": str(e)}
+        elapsed = time.perf_counter() - start
+
+        if verdict.get("status") != "healthy":
+            logger.warning(f"Health check '{name}' is unhealthy: {verdict.get('error')}")
+        verdict = {**verdict, "checked_at": time.time(), "check_time": f"{elapsed:.4f}s"}
+        self._verdicts[name] = verdict
+        return verdict
+
+    def get(self, name: str) -> Dict[str, Any]:
+        """保持している直近の結果（未実行なら status=unknown）"""
+        verdict = self._verdicts.get(name)
+        if verdict is None:
+            return {"status": "unknown", "service": name, "test_passed": None, "error": "Health check has not run yet"}
+        return {**verdict, "age": f"{time.time() - verdict['checked_at']:.1f}s"}
+
+    async def check(self, name: str, deep: bool = False) -> Dict[str, Any]:
+        """ヘルスチェックAPI用（deep=True なら今すぐ自己診断を実行する）"""
+        if deep:
+            return await self.run_check(name)
+        return self.get(name)
+
+    def passed(self) -> Dict[str, Optional[bool]]:
+        """自己診断ごとの直近の合否（未実行は None）"""
+        return {
+            name: (self._verdicts[name].get("status") == "healthy") if name in self._verdicts else None
+            for name in self._checks
+        }
+
+    async def run(self):
+        """全ての自己診断を interval ごとに実行し続ける"""
+        while True:
+            for name in list(self._checks):
+                await self.run_check(name)
+            await asyncio.sleep(self.interval)
+
+
+# シングルトンインスタンス
+health_monitor = HealthMonitor(interval=float(os.getenv("HEALTH_CHECK_INTERVAL", 30)))
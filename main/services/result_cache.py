@@ -0,0 +1,482 @@
+import asyncio
+import json
+import os
+from abc import ABC, abstractmethod
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Hashable, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+class CacheBackend(ABC):
+    """
+    計算結果キャッシュの共通インターフェース
+
+    キーはJSONにできるタプル・文字列、値はJSONにできる辞書・リストなどとする。
+    - max_entries: 保持する最大件数
+    - max_bytes: 保持する結果の合計サイズ上限（JSONにしたときのバイト数で概算）
+    - ttl: 有効期限（秒）。0以下なら期限なし
+    上限を超えたら最も長く使われていないものから削除する。
+    イベントループからは aget / aset を使う（ファイルなどを読み書きする実装はスレッドで実行する）
+    """
+
+    backend = "none"
+    # get / set がI/Oで待つことがあるか
+    blocking = False
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float = 0):
+        self.max_entries = max(1, max_entries)
+        self.max_bytes = max(1, max_bytes)
+        self.ttl = ttl if ttl > 0 else None
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._errors = 0
+
+    @abstractmethod
+    def get(self, key: Hashable) -> Optional[Any]:
+        """キャッシュから取得（なければ None）"""
+
+    @abstractmethod
+    def set(self, key: Hashable, value: Any):
+        """キャッシュに保存（上限を超えた分は古いものから削除）"""
+
+    @abstractmethod
+    def clear(self):
+        """キャッシュを全削除（統計情報もリセット）"""
+
+    @abstractmethod
+    def _usage(self) -> Tuple[int, int]:
+        """(件数, 合計バイト数)"""
+
+    async def aget(self, key: Hashable) -> Optional[Any]:
+        """get のイベントループ用"""
+        if not self.blocking:
+            return self.get(key)
+        return await asyncio.to_thread(self.get, key)
+
+    async def aset(self, key: Hashable, value: Any):
+        """set のイベントループ用"""
+        if not self.blocking:
+            return self.set(key, value)
+        return await asyncio.to_thread(self.set, key, value)
+
+    def _reset_counters(self):
+        with self._lock:
+            self._hits = 0
+            self._misses = 0
+            self._evictions = 0
+            self._expirations = 0
+            self._errors = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """ヒット率・サイズなどの統計情報"""
+        entries, size = self._usage()
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "backend": self.backend,
+                "entries": entries,
+                "max_entries": self.max_entries,
+                "bytes": size,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self._hits,
+                "misses": self._misses,
+                "hit_rate": f"{(self._hits / total * 100) if total else 0.0:.1f}%",
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "errors": self._errors
+            }
+
+
+class MemoryCacheBackend(CacheBackend):
+    """プロセス内のLRUキャッシュ（スレッドセーフ）"""
+
+    backend = "memory"
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl: float = 0):
+        super().__init__(max_entries, max_bytes, ttl)
+        # key -> (値, サイズ, 期限)
+        self._entries: "OrderedDict[Hashable, Tuple[Any, int, Optional[float]]]" = OrderedDict()
+        self._bytes = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+
+            value, size, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self._bytes -= size
+                self._expirations += 1
+                self._misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        size = len(_dumps(value).encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+
+            self._entries[key] = (value, size, expires_at)
+            self._bytes += size
+
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self._evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+        self._reset_counters()
+
+    def _usage(self) -> Tuple[int, int]:
+        with self._lock:
+            return len(self._entries), self._bytes
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """
+    ローカルのSQLiteファイル（WALモード）を使う共有キャッシュ
+
+    同じマシン上の複数のuvicornワーカーが同じファイルを参照するため、
+    どのワーカーで計算した結果も全ワーカーで再利用できる。
+    件数・サイズは全ワーカー共通、ヒット・ミスなどの件数はプロセスごとに集計する。
+
+    - 読み出しは書き込みをしない（最終アクセス時刻はメモリにためて、保存時か touch_batch 件ごとにまとめて書く）
+    - 件数・合計サイズは集計用の表で保存・削除のたびに増減させる（保存のたびに全件を数えない）
+    - SQLiteのエラー（ロック待ちのタイムアウトなど）はログに残してミス扱いにする
+    """
+
+    backend = "sqlite"
+    blocking = True
+
+    def __init__(
+        self,
+        path: str,
+        namespace: str,
+        max_entries: int,
+        max_bytes: int,
+        ttl: float = 0,
+        touch_batch: int = 256
+    ):
+        super().__init__(max_entries, max_bytes, ttl)
+        if not namespace.isidentifier():
+            raise ValueError(f"Invalid cache namespace: {namespace}")
+        self.path = str(path)
+        self.table = f"cache_{namespace}"
+        self.usage_table = f"{self.table}_usage"
+        self.touch_batch = max(1, touch_batch)
+        self._local = threading.local()
+        # 書き込み待ちの最終アクセス時刻（エンコード済みのキー -> 時刻）
+        self._touches: Dict[str, float] = {}
+
+    def _connection(self) -> sqlite3.Connection:
+        # 接続はスレッド・プロセスごとに作る（fork後の接続は使い回さない）
+        conn = getattr(self._local, "conn", None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "expires_at REAL, accessed_at REAL NOT NULL)"
+        )
+        conn.execute(f"CREATE INDEX IF NOT EXISTS {self.table}_accessed ON {self.table} (accessed_at)")
+        conn.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.usage_table} ("
+            "id INTEGER PRIMARY KEY CHECK (id = 0), entries INTEGER NOT NULL, bytes INTEGER NOT NULL)"
+        )
+        # 集計用の表がまだなければ既存の行から1回だけ数える
+        if conn.execute(f"SELECT 1 FROM {self.usage_table}").fetchone() is None:
+            with self._transaction(conn):
+                conn.execute(
+                    f"INSERT OR IGNORE INTO {self.usage_table} (id, entries, bytes) "
+                    f"SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}"
+                )
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def _transaction(self, conn: sqlite3.Connection):
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _error(self, operation: str, error: sqlite3.Error):
+        logger.warning(f"SQLite cache {operation} failed ({self.table}): {str(error)}")
+        with self._lock:
+            self._errors += 1
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        encoded_key = _dumps(key)
+        now = time.time()
+        try:
+            row = self._connection().execute(
+                f"SELECT value, expires_at FROM {self.table} WHERE key = ?", (encoded_key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            self._error("get", e)
+            row = None
+
+        if row is None:
+            with self._lock:
+                self._misses += 1
+            return None
+
+        value, expires_at = row
+        if expires_at is not None and expires_at <= now:
+            # 期限切れの行はミスの後の保存で上書きされるので、ここでは書き込まない
+            with self._lock:
+                self._expirations += 1
+                self._misses += 1
+            return None
+
+        with self._lock:
+            self._hits += 1
+            self._touches[encoded_key] = now
+            flush = len(self._touches) >= self.touch_batch
+        if flush:
+            try:
+                conn = self._connection()
+                with self._transaction(conn):
+                    self._flush_touches(conn)
+            except sqlite3.Error as e:
+                self._error("touch", e)
+        return json.loads(value)
+
+    def _flush_touches(self, conn: sqlite3.Connection):
+        """ためておいた最終アクセス時刻を書き込む（トランザクション内で呼ぶ）"""
+        with self._lock:
+            touches, self._touches = self._touches, {}
+        if touches:
+            conn.executemany(
+                f"UPDATE {self.table} SET accessed_at = MAX(accessed_at, ?) WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in touches.items()]
+            )
+
+    def set(self, key: Hashable, value: Any):
+        encoded_key = _dumps(key)
+        encoded_value = _dumps(value)
+        size = len(encoded_value.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        expires_at = now + self.ttl if self.ttl is not None else None
+
+        try:
+            conn = self._connection()
+            with self._transaction(conn):
+                self._flush_touches(conn)
+                old = conn.execute(f"SELECT size FROM {self.table} WHERE key = ?", (encoded_key,)).fetchone()
+                conn.execute(
+                    f"INSERT OR REPLACE INTO {self.table} (key, value, size, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (encoded_key, encoded_value, size, expires_at, now)
+                )
+                conn.execute(
+                    f"UPDATE {self.usage_table} SET entries = entries + ?, bytes = bytes + ?",
+                    (0 if old else 1, size - (old[0] if old else 0))
+                )
+                evicted = self._evict(conn)
+        except sqlite3.Error as e:
+            self._error("set", e)
+            return
+
+        if evicted:
+            with self._lock:
+                self._evictions += evicted
+
+    def _evict(self, conn: sqlite3.Connection) -> int:
+        """上限を超えた分を古いものから削除し、削除件数を返す"""
+        entries, total_bytes = conn.execute(f"SELECT entries, bytes FROM {self.usage_table}").fetchone()
+        if entries <= self.max_entries and total_bytes <= self.max_bytes:
+            return 0
+
+        victims = []
+        freed = 0
+        for key, size in conn.execute(f"SELECT key, size FROM {self.table} ORDER BY accessed_at"):
+            if entries <= self.max_entries and total_bytes <= self.max_bytes:
+                break
+            victims.append((key,))
+            entries -= 1
+            total_bytes -= size
+            freed += size
+
+        conn.executemany(f"DELETE FROM {self.table} WHERE key = ?", victims)
+        conn.execute(
+            f"UPDATE {self.usage_table} SET entries = entries - ?, bytes = bytes - ?",
+            (len(victims), freed)
+        )
+        return len(victims)
+
+    def clear(self):
+        with self._lock:
+            self._touches = {}
+        try:
+            conn = self._connection()
+            with self._transaction(conn):
+                conn.execute(f"DELETE FROM {self.table}")
+                conn.execute(f"UPDATE {self.usage_table} SET entries = 0, bytes = 0")
+        except sqlite3.Error as e:
+            self._error("clear", e)
+        self._reset_counters()
+
+    def _usage(self) -> Tuple[int, int]:
+        try:
+            row = self._connection().execute(f"SELECT entries, bytes FROM {self.usage_table}").fetchone()
+        except sqlite3.Error as e:
+            self._error("stats", e)
+            return 0, 0
+        return (row[0], row[1]) if row else (0, 0)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        stats["path"] = self.path
+        return stats
+
+
+def create_cache_backend(namespace: str) -> CacheBackend:
+    """
+    環境変数の設定に従ってキャッシュを作成
+
+    RESULT_CACHE_BACKEND: "memory"（プロセス内LRU, デフォルト）または "sqlite"（ワーカー間で共有）
+    """
+    backend = os.getenv("RESULT_CACHE_BACKEND", "memory")
+    max_entries = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 10000))
+    max_bytes = int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+    ttl = float(os.getenv("RESULT_CACHE_TTL", 0))
+
+    if backend == "sqlite":
+        path = os.getenv(
+            "RESULT_CACHE_SQLITE_PATH",
+            os.path.join(tempfile.gettempdir(), "hackday_result_cache.sqlite3")
+        )
+        return SQLiteCacheBackend(path, namespace, max_entries, max_bytes, ttl)
+    if backend != "memory":
+        logger.warning(f"Unknown RESULT_CACHE_BACKEND '{backend}', using memory")
+    return MemoryCacheBackend(max_entries, max_bytes, ttl)
+
+
+# シングルトンインスタンス
+# 推奨打牌・打牌分析・あがり牌で共有するキャッシュ
+result_cache = create_cache_backend("discard")
+# 点数計算結果のキャッシュ
+score_cache = create_cache_backend("score")
+
+
+# テスト用の関数
+def _check_backend(make_cache) -> bool:
+    cache = make_cache(max_entries=2, max_bytes=1024)
+    cache.set(("a", (1, 2)), [1])
+    time.sleep(0.01)
+    cache.set("b", [2])
+    time.sleep(0.01)
+    cache.get(("a", (1, 2)))
+    time.sleep(0.01)
+    cache.set("c", {"x": 3})  # 最も使われていない b が削除される
+    ok = cache.get("b") is None and cache.get(("a", (1, 2))) == [1] and cache.get("c") == {"x": 3}
+
+    cache = make_cache(max_entries=100, max_bytes=20)
+    cache.set("a", "x" * 10)
+    time.sleep(0.01)
+    cache.set("b", "y" * 10)  # 合計サイズが上限を超えるので a が削除される
+    ok = ok and cache.get("a") is None and cache.stats()["bytes"] <= 20
+
+    cache = make_cache(max_entries=100, max_bytes=1024, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+    ok = ok and cache.get("a") is None and cache.stats()["expirations"] == 1
+
+    cache.set("a", 1)
+    cache.clear()
+    return ok and cache.get("a") is None and cache.stats()["entries"] == 0
+
+
+def _write_shared(path: str, value: int):
+    SQLiteCacheBackend(path, "test", 100, 1024).set(("shared", value), value)
+
+
+def test_result_cache():
+    """各キャッシュのLRU削除・サイズ上限・有効期限と、SQLite版のプロセス間共有のテスト"""
+    import multiprocessing
+
+    print("=== 結果キャッシュテスト ===")
+    ok = _check_backend(MemoryCacheBackend)
+    print(f"memory: {'OK' if ok else 'NG'}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        counter = iter(range(100))
+
+        def make_sqlite(**kwargs):
+            return SQLiteCacheBackend(os.path.join(tmp, f"cache{next(counter)}.sqlite3"), "test", **kwargs)
+
+        sqlite_ok = _check_backend(make_sqlite)
+
+        # 別プロセスで保存した結果を読めること
+        path = os.path.join(tmp, "shared.sqlite3")
+        processes = [multiprocessing.Process(target=_write_shared, args=(path, i)) for i in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        shared = SQLiteCacheBackend(path, "test", 100, 1024)
+        sqlite_ok = sqlite_ok and all(shared.get(("shared", i)) == i for i in range(4))
+
+        # 集計用の表の件数・サイズが実際の行と一致すること
+        cache = make_sqlite(max_entries=5, max_bytes=1024)
+        for i in range(20):
+            cache.set(("k", i % 8), "v" * i)
+            cache.get(("k", (i * 3) % 8))
+        actual = cache._connection().execute(
+            f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {cache.table}"
+        ).fetchone()
+        sqlite_ok = sqlite_ok and cache._usage() == actual and actual[0] <= 5
+
+        # SQLiteのエラーは例外にせずミス扱いにする
+        cache._connection().execute(f"DROP TABLE {cache.table}")
+        sqlite_ok = sqlite_ok and cache.get(("k", 1)) is None and cache.stats()["errors"] == 1
+        cache.set(("k", 1), 1)
+        sqlite_ok = sqlite_ok and cache.stats()["errors"] == 2
+
+    print(f"sqlite: {'OK' if sqlite_ok else 'NG'}")
+    return ok and sqlite_ok
+
+
+if __name__ == "__main__":
+    test_result_cache()
@@ -1,18 +1,220 @@
 import json
+import os
 import subprocess
 import asyncio
+import itertools
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, List
 import logging
 
+from .result_cache import score_cache
+from ..utils.metrics import CACHE_REQUESTS, FALLBACKS, NODE_FAILURES
+from ..utils.request_timing import set_engine, timed_stage
+
 logger = logging.getLogger(__name__)
 
+
+class RiichiWorkerError(Exception):
+    """常駐riichiワーカーとの通信に失敗した場合の例外"""
+
+
+class RiichiWorker:
+    """
+    常駐riichi_calculator.js（--server）との非同期クライアント
+
+    1本のパイプに複数のリクエストを流し込み、レスポンスはIDで対応付ける。
+    同時に送信中のリクエスト数は max_in_flight で制限する。
+    """
+
+    def __init__(self, script_dir: Path, max_in_flight: int):
+        self.script_dir = script_dir
+        self.max_in_flight = max_in_flight
+        self.process: Optional[asyncio.subprocess.Process] = None
+        self._window = asyncio.Semaphore(max_in_flight)
+        # 割り当て済みのリクエスト数（送信中 + 送信枠の空きを待っているもの）
+        self._assigned = 0
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._request_ids = itertools.count(1)
+        self._reader_task: Optional[asyncio.Task] = None
+        self._stderr_task: Optional[asyncio.Task] = None
+        self._alive = False
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            "node",
+            "riichi_calculator.js",
+            "--server",
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=self.script_dir,
+            limit=1024 * 1024
+        )
+        self._alive = True
+        self._reader_task = asyncio.create_task(self._read_loop())
+        self._stderr_task = asyncio.create_task(self._stderr_loop())
+
+    @property
+    def is_alive(self) -> bool:
+        return self._alive and self.process is not None and self.process.returncode is None
+
+    @property
+    def in_flight(self) -> int:
+        return len(self._pending)
+
+    @property
+    def load(self) -> int:
+        """割り当て済みのリクエスト数（送信枠の空きを待っているものを含む）"""
+        return self._assigned
+
+    async def _read_loop(self):
+        try:
+            while True:
+                line = await self.process.stdout.readline()
+                if not line:
+                    break
+                try:
+                    response = json.loads(line)
+                except json.JSONDecodeError as e:
+                    logger.error(f"Invalid JSON from riichi worker: {str(e)}")
+                    continue
+                future = self._pending.pop(response.pop("id", None), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        finally:
+            # プロセス終了時は待機中のリクエストをすべて失敗させる
+            self._alive = False
+            pending, self._pending = self._pending, {}
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(RiichiWorkerError("riichi worker exited"))
+
+    async def _stderr_loop(self):
+        while True:
+            line = await self.process.stderr.readline()
+            if not line:
+                break
+            logger.warning(f"riichi worker (pid={self.process.pid}) stderr: {line.decode('utf-8').rstrip()}")
+
+    async def request(self, input_data: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """リクエストを送信してレスポンスを待つ"""
+        # 送信枠を待つ前に数える（プールが割り当て先を選ぶときに待ち行列も考慮する）
+        self._assigned += 1
+        try:
+            async with self._window:
+                if not self.is_alive:
+                    raise RiichiWorkerError("riichi worker is not running")
+
+                request_id = next(self._request_ids)
+                future = asyncio.get_running_loop().create_future()
+                self._pending[request_id] = future
+
+                try:
+                    payload = json.dumps({"id": request_id, **input_data}, ensure_ascii=False)
+                    self.process.stdin.write(payload.encode('utf-8') + b"\n")
+                    await self.process.stdin.drain()
+                    return await asyncio.wait_for(future, timeout)
+                except asyncio.TimeoutError:
+                    raise RiichiWorkerError(f"riichi worker timed out after {timeout}s")
+                except (BrokenPipeError, ConnectionResetError) as e:
+                    raise RiichiWorkerError(f"Failed to write to riichi worker: {str(e)}")
+                finally:
+                    self._pending.pop(request_id, None)
+        finally:
+            self._assigned -= 1
+
+    async def close(self):
+        self._alive = False
+        if self.process is None or self.process.returncode is not None:
+            return
+        try:
+            self.process.stdin.close()
+            await asyncio.wait_for(self.process.wait(), 1)
+        except Exception:
+            self.process.kill()
+            await self.process.wait()
+
+
+class RiichiWorkerPool:
+    """
+    常駐riichiワーカーの小さなプール
+
+    リクエストは割り当て済みの件数（送信中 + 送信枠待ち）が最も少ないワーカーに割り当てる。
+    終了したワーカーは次のリクエスト時に作り直す。
+    """
+
+    def __init__(self, script_dir: Path, pool_size: int, max_in_flight: int):
+        self.script_dir = script_dir
+        self.pool_size = max(1, pool_size)
+        self.max_in_flight = max(1, max_in_flight)
+        self._workers: List[RiichiWorker] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock: Optional[asyncio.Lock] = None
+        self._respawns = 0
+
+    async def _ensure_workers(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # 別のイベントループで作られたワーカーは使えないので破棄する
+            for worker in self._workers:
+                if worker.process is not None and worker.process.returncode is None:
+                    worker.process.kill()
+            self._workers = []
+            self._loop = loop
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            for i, worker in enumerate(self._workers):
+                if not worker.is_alive:
+                    self._respawns += 1
+                    logger.warning("riichi worker is dead, respawning")
+                    self._workers[i] = await self._spawn()
+            while len(self._workers) < self.pool_size:
+                self._workers.append(await self._spawn())
+
+    async def _spawn(self) -> RiichiWorker:
+        worker = RiichiWorker(self.script_dir, self.max_in_flight)
+        await worker.start()
+        return worker
+
+    async def start(self):
+        """ワーカーを起動（起動済みなら何もしない）"""
+        await self._ensure_workers()
+
+    async def request(self, input_data: Dict[str, Any], timeout: float = 10) -> Dict[str, Any]:
+        await self._ensure_workers()
+        # 選んでから worker.request が件数を数えるまでの間に await はないため、同時のリクエストでも偏らない
+        worker = min(self._workers, key=lambda w: w.load)
+        return await worker.request(input_data, timeout)
+
+    async def shutdown(self):
+        workers, self._workers = self._workers, []
+        for worker in workers:
+            await worker.close()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "pool_size": self.pool_size,
+            "max_in_flight": self.max_in_flight,
+            "workers": len(self._workers),
+            "in_flight": [w.in_flight for w in self._workers],
+            "queued": [w.load - w.in_flight for w in self._workers],
+            "respawns": self._respawns
+        }
+
+
 class RiichiService:
     """riichライブラリを使用した麻雀点数計算サービス"""
     
     def __init__(self):
         # Node.jsスクリプトのパスを設定
         self.script_path = Path(__file__).parent.parent.parent / "nodejs" / "riichi_calculator.js"
+        # 常駐ワーカー（初回リクエスト時に起動）
+        self.worker_pool = RiichiWorkerPool(
+            self.script_path.parent,
+            pool_size=int(os.getenv("RIICHI_WORKER_POOL_SIZE", min(4, os.cpu_count() or 1))),
+            max_in_flight=int(os.getenv("RIICHI_WORKER_MAX_IN_FLIGHT", 32))
+        )
         
     async def calculate_score(
         self,
@@ -24,7 +226,8 @@ class RiichiService:
         disable_kuitan: bool = False,
         disable_aka: bool = False,
         enable_local_yaku: Optional[list] = None,
-        disable_yaku: Optional[list] = None
+        disable_yaku: Optional[list] = None,
+        use_cache: bool = True
     ) -> Dict[str, Any]:
         """
         麻雀の点数計算を実行
@@ -39,6 +242,7 @@ class RiichiService:
             disable_aka: 赤ドラを無効にする
             enable_local_yaku: 有効にするローカル役のリスト
             disable_yaku: 無効にする役のリスト
+            use_cache: 計算結果キャッシュを使うか（ヘルスチェックでは使わない）
             
         Returns:
             計算結果の辞書
@@ -59,11 +263,22 @@ class RiichiService:
                 }
             }
             
-            # JSON文字列に変換
-            input_json = json.dumps(input_data, ensure_ascii=False)
+            # 同じ入力の計算結果はキャッシュから返す
+            cache_key = json.dumps(input_data, ensure_ascii=False, sort_keys=True)
+            if use_cache:
+                with timed_stage("cache"):
+                    cached = await score_cache.aget(cache_key)
+                CACHE_REQUESTS.inc("score", "miss" if cached is None else "hit")
+                if cached is not None:
+                    set_engine("cache")
+                    return cached
+            
+            result = await self._calculate(input_data)
             
-            # Node.jsスクリプトを実行
-            result = await self._run_node_script(input_json)
+            # 成功した結果のみキャッシュする
+            if use_cache and result.get("success"):
+                with timed_stage("cache"):
+                    await score_cache.aset(cache_key, result)
             
             return result
             
@@ -76,6 +291,27 @@ class RiichiService:
                 }
             }
     
+    async def _calculate(self, input_data: Dict[str, Any]) -> Dict[str, Any]:
+        """常駐ワーカーで実行（失敗した場合は1回限りのプロセスで実行）"""
+        try:
+            with timed_stage("node"):
+                result = await self.worker_pool.request(input_data)
+            set_engine("node")
+            return result
+        except RiichiWorkerError as e:
+            logger.warning(f"riichi worker failed, falling back to one-shot process: {str(e)}")
+            NODE_FAILURES.inc("riichi")
+            FALLBACKS.inc("score")
+        
+        # JSON文字列に変換
+        input_json = json.dumps(input_data, ensure_ascii=False)
+        
+        # Node.jsスクリプトを実行
+        # 1回限りのプロセスもNode.jsなので node 区間として記録する
+        set_engine("node-oneshot")
+        with timed_stage("node", "fallback"):
+            return await self._run_node_script(input_json)
+    
     async def _run_node_script(self, input_json: str) -> Dict[str, Any]:
         """Node.jsスクリプトを非同期で実行"""
         try:
@@ -136,5 +372,41 @@ class RiichiService:
                 }
             }
 
+    async def start(self):
+        """常駐ワーカーを起動"""
+        await self.worker_pool.start()
+
+    async def shutdown(self):
+        """常駐ワーカーを終了"""
+        await self.worker_pool.shutdown()
+
 # シングルトンインスタンス
 riichi_service = RiichiService()
+
+
+# テスト用の関数
+def test_worker_balancing(requests: int = 8):
+    """送信枠を待っているリクエストも数えて、同時のリクエストがワーカーに均等に割り当てられることのテスト"""
+    pool = RiichiWorkerPool(Path(__file__).parent.parent.parent / "nodejs", pool_size=2, max_in_flight=1)
+    input_data = {"hand": "123m456p789s1122z", "options": {}}
+
+    async def run():
+        await pool.start()
+        tasks = [asyncio.ensure_future(pool.request(input_data)) for _ in range(requests)]
+        await asyncio.sleep(0)
+        loads = [worker.load for worker in pool._workers]
+        results = await asyncio.gather(*tasks)
+        await pool.shutdown()
+        return loads, results
+
+    print("=== riichiワーカー割り当てテスト ===")
+    loads, results = asyncio.run(run())
+    print(f"割り当て: {loads}")
+
+    ok = loads == [requests // 2, requests // 2] and all(result.get("success") for result in results)
+    print("OK" if ok else "NG")
+    return ok
+
+
+if __name__ == "__main__":
+    test_worker_balancing()
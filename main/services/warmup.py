@@ -0,0 +1,123 @@
+"""
+起動時のウォームアップ
+Node.jsワーカーの起動・向聴数テーブルの読み込みと待ち牌インデックスの作成・キャッシュの準備・よくある手牌の計算を
+リクエスト受付前に済ませる（終わるまで /ready は 503 を返す）
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+
+from .discard_service import discard_service
+from .engine_executor import engine_executor
+from .riichi_service import riichi_service
+from ..utils import discard_simulator
+from ..utils.discard_simulator import parse_hand
+from ..utils.hand import Hand
+from ..utils.node_worker_pool import discard_worker_pool
+from ..utils.process_engine import WARM_UP_HANDS, process_engine
+from ..utils.shanten_table import get_tables
+from ..utils.wait_index import get_wait_tables
+
+logger = logging.getLogger(__name__)
+
+# 点数計算のウォームアップに使う和了形
+WARM_UP_SCORE_HANDS = [
+    "112233456789m11s",
+    "123m456p789s11122z",
+]
+
+
+class WarmUp:
+    """
+    起動時のウォームアップ処理と、その完了状態
+
+    各手順の失敗はログに残して続行する（Node.jsが使えなくてもフォールバックで応答できるため）
+    """
+
+    def __init__(self, hands: List[str], score_hands: List[str]):
+        self.hands = hands
+        self.score_hands = score_hands
+        self.ready = False
+        self.duration: Optional[float] = None
+        self.steps: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+
+    async def run(self):
+        """ウォームアップを実行し、完了したら ready にする"""
+        start = time.perf_counter()
+        logger.info("Warm-up started")
+
+        await self._step("node_workers", self._start_node_workers)
+        await self._step("tables", self._load_tables)
+        await self._step("caches", self._prime_caches)
+        await self._step("hands", self._replay_hands)
+
+        self.duration = time.perf_counter() - start
+        self.ready = True
+        logger.info(
+            f"Warm-up finished in {self.duration:.3f}s "
+            f"({', '.join(f'{name}={elapsed:.3f}s' for name, elapsed in self.steps.items())})"
+        )
+
+    async def _step(self, name: str, func):
+        start = time.perf_counter()
+        try:
+            await func()
+        except Exception as e:
+            self.errors[name] = str(e)
+            logger.warning(f"Warm-up step '{name}' failed: {str(e)}")
+        self.steps[name] = time.perf_counter() - start
+
+    async def _start_node_workers(self):
+        # 打牌計算用（同期起動なのでスレッドで）と点数計算用の常駐ワーカー
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, discard_worker_pool.start)
+        await riichi_service.start()
+
+    async def _load_tables(self):
+        # 計算用ワーカープロセスはテーブルを読み込んでから起動する（待ち牌インデックスはメモリ上で作成）
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, get_tables)
+        await loop.run_in_executor(None, get_wait_tables)
+        await loop.run_in_executor(None, process_engine.start)
+
+    async def _prime_caches(self):
+        # discard_simulator の lru_cache（正規形ごとの向聴数）を温める
+        # 打牌後・打牌してツモった後の枚数配列を、calculate_effective_tiles_fast と同じ経路で引く
+        def prime():
+            for hand in self.hands:
+                parsed = Hand.parse(hand)
+                counts = list(parsed.counts)
+                for index in parsed.unique_indices():
+                    counts[index] -= 1
+                    shanten, _ = discard_simulator.min_shanten_cached(tuple(counts), 0)
+                    discard_simulator.calculate_effective_tiles_fast(counts, shanten)
+                    counts[index] += 1
+
+        await engine_executor.run(prime)
+
+    async def _replay_hands(self):
+        # 本番と同じ経路で計算する（結果キャッシュには入れない）
+        for hand in self.hands:
+            for action in ("recommend", "analyze"):
+                await discard_service.calculate(action, hand, use_cache=False)
+            await discard_service.calculate("agarihai", "".join(parse_hand(hand)[:13]), use_cache=False)
+        for hand in self.score_hands:
+            result = await riichi_service.calculate_score(hand, use_cache=False)
+            if not result.get("success"):
+                raise RuntimeError(f"score warm-up failed: {result.get('error')}")
+
+    def stats(self) -> Dict[str, Any]:
+        """ウォームアップの状態"""
+        return {
+            "ready": self.ready,
+            "duration": f"{self.duration:.4f}s" if self.duration is not None else None,
+            "steps": {name: f"{elapsed:.4f}s" for name, elapsed in self.steps.items()},
+            "errors": self.errors
+        }
+
+
+# シングルトンインスタンス
+warm_up = WarmUp(WARM_UP_HANDS, WARM_UP_SCORE_HANDS)
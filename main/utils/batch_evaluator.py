@@ -0,0 +1,298 @@
+"""
+NumPyによる有効牌（受け入れ）の一括計算
+打牌候補 × 34種のツモを整数配列の行列として作り、
+全行の向聴数を事前計算済みの色別テーブルから1回のベクトル演算で求める
+複数の手牌もまとめて同じ処理で計算できる
+"""
+
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from .hand import Hand, TILE_NAMES
+from .shanten_table import (
+    MAX_SUIT_TILES,
+    MISSING_ENTRY,
+    calculate_shanten_table,
+    get_tables,
+    get_tile_priority
+)
+from .special_forms import NOT_APPLICABLE, YAOCHU_INDICES
+
+# 一度に評価する手牌数（行列が大きくなりすぎないように分割する）
+CHUNK_SIZE = 256
+
+
+class BatchEvaluator:
+    """事前計算済みテーブルを配列として保持し、向聴数をまとめて計算する"""
+
+    def __init__(self):
+        suit_table, honor_table = get_tables()
+        # mmap されたテーブルはコピーせずに参照する
+        self.suit_table = np.frombuffer(suit_table, dtype=np.uint16)
+        self.honor_table = np.frombuffer(honor_table, dtype=np.uint8)
+        self.suit_weights = (5 ** np.arange(9)).astype(np.int64)
+        self.honor_weights = (5 ** np.arange(7)).astype(np.int64)
+        self._draws = np.eye(34, dtype=np.int16)
+        self._yaochu = np.asarray(YAOCHU_INDICES)
+
+    def shanten(self, counts: np.ndarray, meld_count: int = 0) -> np.ndarray:
+        """
+        向聴数をまとめて計算
+
+        Args:
+            counts: (行数, 34) の枚数配列
+            meld_count: 副露数
+
+        Returns:
+            (行数,) の向聴数配列
+        """
+        rows = counts.shape[0]
+        suits = counts[:, :27].reshape(rows, 3, 9)
+        keys = suits.astype(np.int64) @ self.suit_weights
+        honor_keys = counts[:, 27:].astype(np.int64) @ self.honor_weights
+
+        # テーブルの範囲外（5枚以上の牌・1色15枚以上）の行は個別に計算する
+        invalid = (counts > 4).any(axis=1) | (suits.sum(axis=2) > MAX_SUIT_TILES).any(axis=1)
+        keys[invalid] = 0
+        honor_keys[invalid] = 0
+
+        entries = self.suit_table[keys].astype(np.int32)
+        invalid |= (entries == MISSING_ENTRY).any(axis=1)
+
+        # 各色の候補2つ（同じ場合もある）を (行, 色, 候補) に展開
+        options = np.stack([entries & 0xFF, entries >> 8], axis=2)
+        u = options & 0x0F
+        m = (options >> 4) & 0x07
+        p = options >> 7
+
+        honor = self.honor_table[honor_keys].astype(np.int32)
+        hu = (honor & 0x0F) + 2 * meld_count
+        hm = ((honor >> 4) & 0x07) + meld_count
+        hp = honor >> 7
+
+        # 3色の候補の全組み合わせ（2 x 2 x 2）を一度に評価
+        total_u = (u[:, 0, :, None, None] + u[:, 1, None, :, None] + u[:, 2, None, None, :]
+                   + hu[:, None, None, None])
+        total_m = (m[:, 0, :, None, None] + m[:, 1, None, :, None] + m[:, 2, None, None, :]
+                   + hm[:, None, None, None])
+        total_p = (p[:, 0, :, None, None] | p[:, 1, None, :, None] | p[:, 2, None, None, :]
+                   | hp[:, None, None, None])
+        shanten = np.maximum(8 - total_u, 4 - total_m - total_p).reshape(rows, 8).min(axis=1)
+        shanten = np.minimum(shanten, self.special_shanten(counts, meld_count))
+
+        for row in np.nonzero(invalid)[0]:
+            shanten[row] = calculate_shanten_table(counts[row].tolist(), meld_count)
+
+        return shanten
+
+    def special_shanten(self, counts: np.ndarray, meld_count: int = 0) -> np.ndarray:
+        """
+        七対子・国士無双の向聴数の小さい方をまとめて計算（special_forms.special_shanten と同じ値）
+
+        Returns:
+            (行数,) の向聴数配列（使えない行は NOT_APPLICABLE）
+        """
+        rows = counts.shape[0]
+        if meld_count:
+            return np.full(rows, NOT_APPLICABLE, dtype=np.int32)
+        kinds = (counts > 0).sum(axis=1)
+        pairs = (counts >= 2).sum(axis=1)
+        chiitoitsu = 6 - pairs + np.maximum(0, 7 - kinds)
+        yaochu = counts[:, self._yaochu]
+        kokushi = 13 - (yaochu > 0).sum(axis=1) - (yaochu >= 2).any(axis=1)
+        special = np.minimum(chiitoitsu, kokushi).astype(np.int32)
+        special[counts.sum(axis=1) < 13] = NOT_APPLICABLE
+        return special
+
+    def effective_tiles(self, counts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        各手牌の向聴数と、ツモで向聴数が下がる牌の残り枚数をまとめて計算
+
+        Args:
+            counts: (行数, 34) の枚数配列（13枚の手牌など）
+
+        Returns:
+            (向聴数 (行数,), 有効牌の残り枚数 (行数, 34)。有効牌でない牌は0)
+        """
+        rows = counts.shape[0]
+        base = counts.astype(np.int16)
+        # 候補行列: 各手牌 × 34種のツモ（4枚使っている牌のツモは5枚目になるので評価しない）
+        drawable = base < 4
+        drawn = (base[:, None, :] + self._draws[None, :, :])[drawable]
+
+        base_shanten = self.shanten(base)
+        drawn_shanten = np.full((rows, 34), NOT_APPLICABLE, dtype=base_shanten.dtype)
+        drawn_shanten[drawable] = self.shanten(drawn)
+
+        effective = drawn_shanten < base_shanten[:, None]
+        remaining = np.where(effective, 4 - base, 0)
+        return base_shanten, remaining
+
+    def analyze_counts(self, hands: Sequence[List[int]]) -> List[Dict[int, Tuple[int, np.ndarray]]]:
+        """
+        複数の14枚手牌について、打牌候補ごとの向聴数と有効牌をまとめて計算
+
+        Returns:
+            手牌ごとに {打牌インデックス: (向聴数, 有効牌の残り枚数 (34,))}
+        """
+        results: List[Dict[int, Tuple[int, np.ndarray]]] = [{} for _ in hands]
+
+        for start in range(0, len(hands), CHUNK_SIZE):
+            chunk = np.asarray(hands[start:start + CHUNK_SIZE], dtype=np.int16).reshape(-1, 34)
+            hand_idx, discard_idx = np.nonzero(chunk)
+            # 打牌候補ごとに1枚減らした手牌
+            discarded = chunk[hand_idx] - self._draws[discard_idx]
+            shanten, remaining = self.effective_tiles(discarded)
+
+            for row in range(len(hand_idx)):
+                results[start + hand_idx[row]][int(discard_idx[row])] = (int(shanten[row]), remaining[row])
+
+        return results
+
+
+_evaluator = None
+
+
+def get_batch_evaluator() -> BatchEvaluator:
+    """評価器を取得（初回のみ作成）"""
+    global _evaluator
+    if _evaluator is None:
+        _evaluator = BatchEvaluator()
+    return _evaluator
+
+
+def _effective_tile_types(remaining: np.ndarray) -> List[Dict]:
+    return [
+        {'tile': TILE_NAMES[i], 'count': int(remaining[i])}
+        for i in np.nonzero(remaining)[0]
+    ]
+
+
+def _parse_14(hand_str: str) -> Hand:
+    hand = Hand.parse(hand_str)
+    if len(hand) != 14:
+        raise ValueError(f"手牌は14枚である必要があります。現在: {len(hand)}枚")
+    return hand
+
+
+def _build_candidates(hand: Hand, evaluated: Dict[int, Tuple[int, np.ndarray]]) -> List[Dict]:
+    """打牌候補の詳細（analyze_discard_candidates_table と同じ形式・並び順）"""
+    candidates = []
+    for candidate_idx in hand.unique_indices():
+        shanten, remaining = evaluated[candidate_idx]
+        candidates.append({
+            'discard': TILE_NAMES[candidate_idx],
+            'shanten': shanten,
+            'effective_tiles': int(remaining.sum()),
+            'effective_tile_types': _effective_tile_types(remaining)
+        })
+
+    candidates.sort(key=lambda x: (x['shanten'], -x['effective_tiles'], -get_tile_priority(x['discard'])))
+    return candidates
+
+
+def analyze_hands_batch(hand_strs: Sequence[str]) -> List[List[Dict]]:
+    """
+    複数の手牌の打牌候補をまとめて分析（NumPy一括計算版）
+
+    Args:
+        hand_strs: 14枚の手牌文字列のリスト
+
+    Returns:
+        手牌ごとの打牌候補リスト（analyze_discard_candidates_table と同じ形式）
+    """
+    hands = [_parse_14(hand_str) for hand_str in hand_strs]
+    evaluated = get_batch_evaluator().analyze_counts([hand.counts for hand in hands])
+    return [_build_candidates(hand, result) for hand, result in zip(hands, evaluated)]
+
+
+def analyze_discard_candidates_batch(hand_str: str) -> List[Dict]:
+    """全ての打牌候補を分析して詳細情報を返す（NumPy一括計算版）"""
+    return analyze_hands_batch([hand_str])[0]
+
+
+def get_recommended_discard_batch(hand_str: str) -> str:
+    """
+    推奨打牌を計算（NumPy一括計算版）
+    同点時の優先順位は discard_calculator.js と同じ
+    """
+    hand = _parse_14(hand_str)
+    evaluated = get_batch_evaluator().analyze_counts([hand.counts])[0]
+
+    # 枚数の多い順（同数なら出現順）に評価し、最初に最良となった牌を選ぶ
+    counts = hand.counts
+    best_discard = None
+    best_key = None
+    for candidate_idx in sorted(hand.unique_indices(), key=lambda i: -counts[i]):
+        shanten, remaining = evaluated[candidate_idx]
+        candidate = TILE_NAMES[candidate_idx]
+        key = (-shanten, int(remaining.sum()), get_tile_priority(candidate))
+        if best_key is None or key > best_key:
+            best_key = key
+            best_discard = candidate
+
+    return best_discard if best_discard else TILE_NAMES[hand.order[0]]
+
+
+def get_shanten_and_effective_tiles_batch(hand_str: str) -> Dict:
+    """
+    シャンテン数とあがり牌を取得（NumPy一括計算版）
+    get_shanten_and_effective_tiles_table と同じ形式を返す
+    """
+    hand = Hand.parse(hand_str)
+    if len(hand) != 13:
+        raise ValueError(f"手牌は13枚である必要があります。現在: {len(hand)}枚")
+
+    shanten, remaining = get_batch_evaluator().effective_tiles(
+        np.asarray([hand.counts], dtype=np.int16)
+    )
+    shanten = int(shanten[0])
+    effective_tiles = _effective_tile_types(remaining[0]) if shanten == 0 else []
+
+    return {
+        'shanten': shanten,
+        'isTenpai': shanten == 0,
+        'agarihai': [tile['tile'] for tile in effective_tiles],
+        'effective_tiles': effective_tiles
+    }
+
+
+# テスト用の関数
+def test_batch_accuracy(samples: int = 300, seed: int = 0):
+    """一括計算版とテーブル参照版の一致テスト・性能比較"""
+    import random
+    import time
+    from .shanten_table import analyze_discard_candidates_table, random_hand_counts
+
+    def counts_to_hand(counts: List[int]) -> str:
+        hand = ''
+        for suit, offset, size in (('m', 0, 9), ('p', 9, 9), ('s', 18, 9), ('z', 27, 7)):
+            numbers = ''.join(str(i + 1) * counts[offset + i] for i in range(size))
+            if numbers:
+                hand += numbers + suit
+        return hand
+
+    rng = random.Random(seed)
+    hands = [counts_to_hand(random_hand_counts(rng, 14)) for _ in range(samples)]
+
+    print("=== NumPy一括計算版 精度・性能テスト ===")
+
+    get_batch_evaluator()
+
+    start_time = time.time()
+    expected = [analyze_discard_candidates_table(hand) for hand in hands]
+    table_time = time.time() - start_time
+
+    start_time = time.time()
+    actual = analyze_hands_batch(hands)
+    batch_time = time.time() - start_time
+
+    mismatches = sum(1 for a, b in zip(expected, actual) if a != b)
+    print(f"{samples}手: テーブル参照版 {table_time:.4f}秒, 一括計算版 {batch_time:.4f}秒, 不一致 {mismatches}件")
+
+    return mismatches == 0
+
+
+if __name__ == "__main__":
+    test_batch_accuracy()
@@ -0,0 +1,341 @@
+"""
+牌効率エンジンのベンチマーク
+固定シードで作ったランダムな13枚・14枚の手牌（向聴数ごとに同数）を各エンジンで計算し、
+スループット・レイテンシ（p50/p99）・最大メモリ使用量（tracemalloc）・キャッシュ統計を計測する
+
+使い方:
+    python -m main.utils.benchmark --per-stratum 10 --output benchmark.json
+    python -m main.utils.benchmark --baseline benchmark.json --tolerance 0.2
+ベースラインより指定割合以上遅くなったエンジンがあれば終了コード1で終了する
+"""
+
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .shanten_table import calculate_shanten_table, random_hand_counts
+
+# 向聴数の区分（14枚は和了形も0向聴に含める。4以上はまとめる）
+STRATA = [0, 1, 2, 3, 4]
+
+TILE_NAMES = [f"{i % 9 + 1}{'mpsz'[i // 9]}" for i in range(34)]
+
+
+def counts_to_hand(counts: List[int]) -> str:
+    """枚数配列を手牌文字列に変換"""
+    hand = ''
+    for suit, offset, size in (('m', 0, 9), ('p', 9, 9), ('s', 18, 9), ('z', 27, 7)):
+        numbers = ''.join(str(i + 1) * counts[offset + i] for i in range(size))
+        if numbers:
+            hand += numbers + suit
+    return hand
+
+
+def build_corpus(per_stratum: int, seed: int, max_draws: int = 200000) -> Dict[str, Dict[int, List[str]]]:
+    """
+    向聴数ごとに per_stratum 手ずつの手牌を作成
+
+    聴牌に近い手はランダムに引くとまれなので、足りない区分は max_draws 回まで引き直す。
+
+    Returns:
+        {"13": {向聴数: [手牌, ...]}, "14": {...}}
+    """
+    rng = random.Random(seed)
+    corpus = {}
+    for size in (13, 14):
+        strata = {stratum: [] for stratum in STRATA}
+        for _ in range(max_draws):
+            if all(len(hands) >= per_stratum for hands in strata.values()):
+                break
+            counts = random_hand_counts(rng, size)
+            stratum = min(max(calculate_shanten_table(counts), 0), STRATA[-1])
+            if len(strata[stratum]) < per_stratum:
+                strata[stratum].append(counts_to_hand(counts))
+        corpus[str(size)] = strata
+    return corpus
+
+
+# エンジン定義: 名前 -> {"analyze": 14枚, "ukeire": 13枚, "cache_info", "clear_cache"}
+def _original_engine() -> Dict[str, Callable]:
+    from . import discard_simulator as engine
+
+    def ukeire(hand_str: str) -> Tuple[int, int]:
+        counts = engine.tiles_to_counts(engine.parse_hand(hand_str))
+        shanten, _ = engine.min_shanten_cached(tuple(counts))
+        return shanten, engine.calculate_effective_tiles_fast(counts, shanten)
+
+    return {
+        "analyze": engine.analyze_discard_candidates,
+        "ukeire": ukeire,
+        "cache_info": engine.get_cache_info,
+        "clear_cache": engine.clear_cache
+    }
+
+
+def _optimized_engine() -> Dict[str, Callable]:
+    from . import discard_simulator_optimized as engine
+
+    def ukeire(hand_str: str) -> Tuple[int, int]:
+        counts = engine.tiles_to_counts(engine.parse_hand(hand_str))
+        shanten = engine.calculate_shanten_fast(tuple(counts))
+        return shanten, engine.calculate_effective_tiles_optimized(counts, shanten)
+
+    return {
+        "analyze": engine.analyze_discard_candidates_optimized,
+        "ukeire": ukeire,
+        "cache_info": engine.get_cache_info_optimized,
+        "clear_cache": engine.clear_cache_optimized
+    }
+
+
+def _improved_engine() -> Dict[str, Callable]:
+    from . import discard_simulator_improved as engine
+
+    def ukeire(hand_str: str) -> Tuple[int, int]:
+        counts = engine.tiles_to_counts(engine.parse_hand(hand_str))
+        shanten, _ = engine.min_shanten_improved(tuple(counts))
+        return shanten, engine.calculate_effective_tiles_improved(counts, shanten)
+
+    return {
+        "analyze": engine.analyze_discard_candidates_improved,
+        "ukeire": ukeire,
+        "cache_info": engine.get_cache_info_improved,
+        "clear_cache": engine.clear_cache_improved
+    }
+
+
+def _hybrid_engine() -> Dict[str, Callable]:
+    from . import discard_simulator_hybrid as engine
+
+    return {
+        "analyze": engine.analyze_discard_candidates_hybrid,
+        "ukeire": engine.get_shanten_and_effective_tiles_hybrid,
+        "cache_info": engine.get_cache_info_hybrid,
+        "clear_cache": engine.clear_cache_hybrid
+    }
+
+
+def _table_engine() -> Dict[str, Callable]:
+    from . import shanten_table as engine
+
+    return {
+        "analyze": engine.analyze_discard_candidates_table,
+        "ukeire": engine.get_shanten_and_effective_tiles_table,
+        "cache_info": engine.get_table_info,
+        "clear_cache": lambda: None
+    }
+
+
+def _batch_engine() -> Dict[str, Callable]:
+    from . import batch_evaluator as engine
+    from .shanten_table import get_table_info
+
+    return {
+        "analyze": engine.analyze_discard_candidates_batch,
+        "ukeire": engine.get_shanten_and_effective_tiles_batch,
+        "cache_info": get_table_info,
+        "clear_cache": lambda: None
+    }
+
+
+ENGINES = {
+    "original": _original_engine,
+    "optimized": _optimized_engine,
+    "improved": _improved_engine,
+    "hybrid": _hybrid_engine,
+    "table": _table_engine,
+    "batch": _batch_engine,
+}
+
+DEFAULT_ENGINES = ["original", "optimized", "improved", "hybrid"]
+
+# 各操作で使う手牌の枚数
+OPERATIONS = {"analyze": "14", "ukeire": "13"}
+
+
+def _percentile(sorted_values: List[float], ratio: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(ratio * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def _run_operation(func: Callable, hands: List[str]) -> Tuple[List[float], int]:
+    latencies = []
+    errors = 0
+    for hand_str in hands:
+        start = time.perf_counter()
+        try:
+            func(hand_str)
+        except Exception:
+            errors += 1
+        latencies.append(time.perf_counter() - start)
+    return latencies, errors
+
+
+def run_engine(name: str, corpus: Dict[str, Dict[int, List[str]]], measure_memory: bool = True) -> Dict[str, Any]:
+    """1つのエンジンで全操作を計測"""
+    engine = ENGINES[name]()
+    result: Dict[str, Any] = {"operations": {}}
+
+    for operation, size in OPERATIONS.items():
+        hands = [hand for stratum in STRATA for hand in corpus[size][stratum]]
+        engine["clear_cache"]()
+
+        start = time.perf_counter()
+        latencies, errors = _run_operation(engine[operation], hands)
+        elapsed = time.perf_counter() - start
+
+        by_stratum = {}
+        offset = 0
+        for stratum in STRATA:
+            count = len(corpus[size][stratum])
+            values = sorted(latencies[offset:offset + count])
+            offset += count
+            by_stratum[str(stratum)] = {
+                "hands": count,
+                "p50_ms": _percentile(values, 0.5) * 1000,
+                "p99_ms": _percentile(values, 0.99) * 1000
+            }
+
+        values = sorted(latencies)
+        stats = {
+            "hands": len(hands),
+            "errors": errors,
+            "total_s": elapsed,
+            "throughput_per_s": len(hands) / elapsed if elapsed > 0 else 0.0,
+            "p50_ms": _percentile(values, 0.5) * 1000,
+            "p99_ms": _percentile(values, 0.99) * 1000,
+            "by_shanten": by_stratum,
+            "cache": engine["cache_info"]()
+        }
+
+        # メモリは計測の影響が大きいので、キャッシュを空にしてもう一度実行して測る
+        if measure_memory:
+            engine["clear_cache"]()
+            tracemalloc.start()
+            _run_operation(engine[operation], hands)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            stats["peak_memory_kb"] = peak / 1024
+
+        result["operations"][operation] = stats
+
+    return result
+
+
+def compare_with_baseline(report: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    ベースラインと比較して悪化した項目を返す
+
+    スループットが (1 - tolerance) 倍未満、または p99 が (1 + tolerance) 倍を超えたら悪化とみなす。
+    """
+    regressions = []
+    for name, result in report["results"].items():
+        base_result = baseline.get("results", {}).get(name)
+        if base_result is None:
+            continue
+        for operation, stats in result["operations"].items():
+            base = base_result["operations"].get(operation)
+            if base is None:
+                continue
+            if stats["throughput_per_s"] < base["throughput_per_s"] * (1 - tolerance):
+                regressions.append(
+                    f"{name}.{operation}: throughput {stats['throughput_per_s']:.1f}/s "
+                    f"< baseline {base['throughput_per_s']:.1f}/s"
+                )
+            if stats["p99_ms"] > base["p99_ms"] * (1 + tolerance):
+                regressions.append(
+                    f"{name}.{operation}: p99 {stats['p99_ms']:.2f}ms > baseline {base['p99_ms']:.2f}ms"
+                )
+    return regressions
+
+
+def run_benchmark(
+    engines: List[str],
+    per_stratum: int = 10,
+    seed: int = 0,
+    measure_memory: bool = True
+) -> Dict[str, Any]:
+    """ベンチマークを実行してレポート（JSONにできる辞書）を返す"""
+    corpus = build_corpus(per_stratum, seed)
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "seed": seed,
+            "per_stratum": per_stratum,
+            "engines": engines
+        },
+        "corpus": {
+            size: {str(stratum): len(hands) for stratum, hands in strata.items()}
+            for size, strata in corpus.items()
+        },
+        "results": {}
+    }
+
+    for name in engines:
+        report["results"][name] = run_engine(name, corpus, measure_memory)
+    return report
+
+
+def print_report(report: Dict[str, Any]):
+    """結果を表形式で表示"""
+    print(f"{'engine':<10} {'op':<8} {'hands':>6} {'err':>4} {'hands/s':>10} {'p50 ms':>9} {'p99 ms':>9} {'peak KB':>10}")
+    for name, result in report["results"].items():
+        for operation, stats in result["operations"].items():
+            peak = f"{stats['peak_memory_kb']:.0f}" if "peak_memory_kb" in stats else "-"
+            print(
+                f"{name:<10} {operation:<8} {stats['hands']:>6} {stats['errors']:>4} "
+                f"{stats['throughput_per_s']:>10.1f} {stats['p50_ms']:>9.2f} {stats['p99_ms']:>9.2f} {peak:>10}"
+            )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="牌効率エンジンのベンチマーク")
+    parser.add_argument("--engines", default=",".join(DEFAULT_ENGINES),
+                        help=f"計測するエンジン（カンマ区切り: {', '.join(ENGINES)}）")
+    parser.add_argument("--per-stratum", type=int, default=10, help="向聴数ごとの手牌数")
+    parser.add_argument("--seed", type=int, default=0, help="手牌生成のシード")
+    parser.add_argument("--output", help="結果を書き出すJSONファイル")
+    parser.add_argument("--baseline", help="比較するベースラインのJSONファイル")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="許容する悪化の割合")
+    parser.add_argument("--no-memory", action="store_true", help="メモリ使用量を計測しない")
+    args = parser.parse_args(argv)
+
+    engines = [name.strip() for name in args.engines.split(",") if name.strip()]
+    unknown = [name for name in engines if name not in ENGINES]
+    if unknown:
+        parser.error(f"unknown engines: {', '.join(unknown)}")
+
+    report = run_benchmark(engines, args.per_stratum, args.seed, not args.no_memory)
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"結果を {args.output} に保存しました")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report, baseline, args.tolerance)
+        if regressions:
+            print("ベースラインより悪化しました:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("ベースラインからの悪化はありません")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+手牌の色の対称性による正規化
+萬子・筒子・索子の入れ替えや、1色の数字の反転（1↔9, 2↔8, ...）をしても
+向聴数・有効牌の枚数は変わらないため、同じ形の手牌を1つの正規形にまとめる
+
+正規形: 各色を「反転前後で小さい方」の枚数列に揃え、その枚数列の順に色を並べ替えたもの
+変換（どの色をどこに移し、反転したか）を返すので、正規形での結果を元の牌に戻せる
+"""
+
+from functools import lru_cache
+from typing import Sequence, Tuple
+
+# 正規形の各色の位置ごとに (元の色番号, 反転したか)
+SuitTransform = Tuple[Tuple[int, bool], ...]
+
+IDENTITY_TRANSFORM: SuitTransform = ((0, False), (1, False), (2, False))
+
+
+def canonicalize(counts: Sequence[int]) -> Tuple[Tuple[int, ...], SuitTransform]:
+    """
+    枚数配列を正規形に変換
+
+    Args:
+        counts: 34種の枚数配列
+
+    Returns:
+        (正規形の枚数タプル, 変換)
+    """
+    suits = []
+    for suit in range(3):
+        segment = tuple(counts[suit * 9:suit * 9 + 9])
+        mirrored = segment[::-1]
+        if mirrored < segment:
+            suits.append((mirrored, suit, True))
+        else:
+            suits.append((segment, suit, False))
+    suits.sort()
+
+    canonical = suits[0][0] + suits[1][0] + suits[2][0] + tuple(counts[27:34])
+    transform = tuple((suit, mirrored) for _, suit, mirrored in suits)
+    return canonical, transform
+
+
+def canonical_counts(counts: Sequence[int]) -> Tuple[int, ...]:
+    """正規形の枚数タプルのみを返す（キャッシュのキー用）"""
+    return canonicalize(counts)[0]
+
+
+@lru_cache(maxsize=None)
+def index_maps(transform: SuitTransform) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    """
+    変換に対応する牌インデックスの対応表
+
+    Returns:
+        (元のインデックス -> 正規形のインデックス, 正規形のインデックス -> 元のインデックス)
+    """
+    to_canonical = list(range(34))
+    for slot, (suit, mirrored) in enumerate(transform):
+        for rank in range(9):
+            to_canonical[suit * 9 + rank] = slot * 9 + (8 - rank if mirrored else rank)
+
+    from_canonical = [0] * 34
+    for index, canonical_index in enumerate(to_canonical):
+        from_canonical[canonical_index] = index
+
+    return tuple(to_canonical), tuple(from_canonical)
+
+
+# テスト用の関数
+def test_canonicalize(samples: int = 2000, seed: int = 0):
+    """正規形の一意性と変換の可逆性のテスト"""
+    import itertools
+    import random
+
+    rng = random.Random(seed)
+    ok = True
+
+    for _ in range(samples):
+        counts = [0] * 34
+        for _ in range(14):
+            index = rng.randrange(34)
+            while counts[index] >= 4:
+                index = rng.randrange(34)
+            counts[index] += 1
+
+        canonical, transform = canonicalize(counts)
+        to_canonical, from_canonical = index_maps(transform)
+
+        # 変換で元の枚数配列と正規形が行き来できること
+        if any(canonical[to_canonical[i]] != counts[i] for i in range(34)):
+            ok = False
+        if any(counts[from_canonical[i]] != canonical[i] for i in range(34)):
+            ok = False
+
+        # 色の入れ替え・反転をしても同じ正規形になること
+        for order in itertools.permutations(range(3)):
+            flips = [rng.random() < 0.5 for _ in range(3)]
+            moved = []
+            for suit, flip in zip(order, flips):
+                segment = counts[suit * 9:suit * 9 + 9]
+                moved += segment[::-1] if flip else segment
+            if canonical_counts(moved + counts[27:]) != canonical:
+                ok = False
+
+    print("=== 手牌正規化テスト ===")
+    print("OK" if ok else "NG")
+    return ok
+
+
+if __name__ == "__main__":
+    test_canonicalize()
@@ -10,6 +10,11 @@ from itertools import combinations
 from functools import lru_cache
 import copy
 
+from .canonical import canonical_counts
+from .hand import KEY_BITS, Hand, TILE_INDEX, TILE_NAMES, pack_counts, unpack_key
+from .special_forms import draw_tiles, special_shanten
+from .suit_bits import FIELD_MASK, decode_suit, encode_suit, extract_isolated
+
 
 def parse_hand(hand_str: str) -> List[str]:
     """
@@ -62,18 +67,13 @@ def count_index_to_tile(index: int) -> str:
     """
     枚数配列のインデックスから牌文字列に変換
     """
-    if index < 9:
-        return str(index + 1) + 'm'
-    elif index < 18:
-        return str(index - 8) + 'p'
-    elif index < 27:
-        return str(index - 17) + 's'
-    else:
-        return str(index - 26) + 'z'
+    return TILE_NAMES[index]
 
 
 class Block:
     """面子・塔子・対子を表すクラス"""
+    __slots__ = ('type', 'tile_index')
+
     def __init__(self, block_type: str, tile_index: int):
         self.type = block_type  # 'kotsu', 'shuntsu', 'toitsu', 'ryammen', 'kanchan', 'penchan'
         self.tile_index = tile_index
@@ -81,6 +81,8 @@ class Block:
 
 class DecomposeResult:
     """分解結果を表すクラス"""
+    __slots__ = ('rest', 'blocks')
+
     def __init__(self, rest: List[int], blocks: List[Block]):
         self.rest = rest
         self.blocks = blocks
@@ -89,47 +91,17 @@ class DecomposeResult:
 def find_isolated_kotsu_shuntsu(counts: List[int]) -> Tuple[List[Block], List[int]]:
     """
     孤立した刻子・順子を抽出
+    数牌は1色27ビットの表現で、孤立判定をシフトとマスクでまとめて行う
     """
     blocks = []
     new_counts = counts[:]
     
     # 萬子・筒子・索子の処理
     for suit_offset in [0, 9, 18]:
-        for i in range(9):
-            tile_idx = suit_offset + i
-            
-            # 刻子の抽出
-            if new_counts[tile_idx] >= 3:
-                # 孤立しているかチェック
-                is_isolated = True
-                for j in range(max(0, i-2), min(9, i+3)):
-                    if j != i and new_counts[suit_offset + j] > 0:
-                        is_isolated = False
-                        break
-                
-                if is_isolated:
-                    new_counts[tile_idx] -= 3
-                    blocks.append(Block('kotsu', tile_idx))
-            
-            # 順子の抽出
-            if (i <= 6 and 
-                new_counts[tile_idx] == 1 and 
-                new_counts[tile_idx + 1] == 1 and 
-                new_counts[tile_idx + 2] == 1):
-                
-                # 孤立しているかチェック
-                is_isolated = True
-                for j in range(max(0, i-2), min(9, i+5)):
-                    if j < i or j > i+2:
-                        if new_counts[suit_offset + j] > 0:
-                            is_isolated = False
-                            break
-                
-                if is_isolated:
-                    new_counts[tile_idx] -= 1
-                    new_counts[tile_idx + 1] -= 1
-                    new_counts[tile_idx + 2] -= 1
-                    blocks.append(Block('shuntsu', tile_idx))
+        rest, suit_blocks = extract_isolated(encode_suit(counts, suit_offset))
+        if suit_blocks:
+            new_counts[suit_offset:suit_offset + 9] = decode_suit(rest)
+            blocks.extend(Block(block_type, suit_offset + rank) for block_type, rank in suit_blocks)
     
     # 字牌の刻子
     for i in range(27, 34):
@@ -252,46 +224,215 @@ def calculate_shanten(blocks: List[Block], meld_count: int = 0) -> int:
     return 8 - mentsu * 2 - tatsu - (1 if has_toitsu else 0)
 
 
-@lru_cache(maxsize=2048)
+# 分解探索の選択肢（extract_mentsu_tatsu と同じ順に試す）
+_TOITSU, _KOTSU, _SHUNTSU, _RYAMMEN, _KANCHAN, _SINGLE = range(6)
+_OPTION_BLOCK_TYPES = ('toitsu', 'kotsu', 'shuntsu', 'ryammen', 'kanchan', None)
+# 選択肢ごとの 面子数・塔子数・牌の枚数 の増分
+_OPTION_MENTSU = (0, 1, 1, 0, 0, 0)
+_OPTION_TATSU = (1, 0, 0, 1, 1, 0)
+_OPTION_TILES = (2, 3, 3, 2, 2, 1)
+# 選択肢・先頭の牌ごとの、詰めた枚数から引く値（1種類3ビット）
+_UNIT = tuple(1 << (KEY_BITS * i) for i in range(34))
+_OPTION_DELTAS = tuple(
+    tuple(
+        sum(_UNIT[i + offset] for offset in offsets) if i + max(offsets) < 34 else 0
+        for i in range(34)
+    )
+    for offsets in ((0, 0), (0, 0, 0), (0, 1, 2), (0, 1), (0, 2), (0,))
+)
+_NEXT_RANK = FIELD_MASK << KEY_BITS
+_SECOND_RANK = FIELD_MASK << (KEY_BITS * 2)
+
+
+def _first_tile(board: int) -> int:
+    """詰めた枚数で最初に1枚以上ある牌（なければ34）"""
+    if not board:
+        return 34
+    return ((board & -board).bit_length() - 1) // KEY_BITS
+
+
+def _shanten_value(mentsu: int, tatsu: int, has_toitsu: bool) -> int:
+    """calculate_shanten と同じ式（ブロック数から計算）"""
+    if mentsu + tatsu > 4:
+        return 4 - mentsu - (1 if has_toitsu else 0)
+    return 8 - mentsu * 2 - tatsu
+
+
+def _optimistic_shanten(mentsu: int, tatsu: int, remaining: int) -> int:
+    """
+    残り牌がすべて面子・塔子になり、対子もあると仮定した場合の向聴数（到達できる向聴数の下限）
+    向聴数はブロックを増やしても悪くならないので、残り牌で作れる最大の組み合わせだけを見ればよい
+    """
+    best = 8
+    for extra in range(remaining // 3 + 1):
+        best = min(best, _shanten_value(mentsu + extra, tatsu + (remaining - extra * 3) // 2, True))
+    return best
+
+
+def _search_min_shanten(
+    counts: List[int],
+    meld_count: int = 0,
+    keep_ties: bool = False,
+    collect: bool = False,
+    limit: int = 9
+) -> Tuple[int, int, List[DecomposeResult]]:
+    """
+    分解を列挙せずに最小向聴数を探索（分枝限定法）
+
+    extract_mentsu_tatsu と同じ分岐を明示的なスタックでたどる。
+    残り牌は1種類3ビットに詰めた整数で持ち、先頭の牌の検索と順子・塔子の判定はシフトとマスクで行う。
+    残り牌から見積もった向聴数の下限が最良値に届かない分岐は打ち切る。
+
+    Args:
+        counts: 34種類の牌の枚数配列
+        meld_count: 副露数
+        keep_ties: 最小向聴数となる分解を全て数える（下限が最良値と等しい分岐は打ち切らない）
+        collect: 最小向聴数となる分解を DecomposeResult として集める（keep_ties 扱い）
+        limit: この値未満の向聴数だけを探す（七対子・国士無双の向聴数など）。
+            下限が limit に届かなければ探索せず、見つからなければ (limit, 0, []) を返す
+
+    Returns:
+        (最小向聴数, 最小向聴数となる分解の数（keep_ties のときのみ正確）, 分解結果リスト)
+    """
+    keep_ties = keep_ties or collect
+    isolated_blocks, rest = find_isolated_kotsu_shuntsu(counts)
+    board = pack_counts(rest)
+
+    mentsu = meld_count + len(isolated_blocks)
+    tatsu = 0
+    toitsu = 0
+    remaining = sum(rest)
+    best = 9
+    ties = 0
+    best_results: List[DecomposeResult] = []
+    # これ以上良くならない値（到達したら探索を終える）
+    floor = _optimistic_shanten(mentsu, tatsu, remaining)
+    if floor >= limit:
+        return limit, 0, []
+
+    stack = [[_first_tile(board), _TOITSU]]  # 深さごとの [先頭の牌, 次に試す選択肢]
+    path: List[Tuple[int, int]] = []  # 深さごとに選んだ (牌, 選択肢)
+
+    while stack:
+        frame = stack[-1]
+        i = frame[0]
+
+        if i < 0:
+            # 打ち切った分岐（選んだ選択肢を戻すだけ）
+            option = -1
+        elif i == 34:
+            # 全ての牌を割り当てた
+            value = _shanten_value(mentsu, tatsu, toitsu > 0)
+            if value < best:
+                best = value
+                ties = 1
+                if collect:
+                    best_results = []
+            elif value == best:
+                ties += 1
+            if collect and value == best:
+                blocks = isolated_blocks + [
+                    Block(_OPTION_BLOCK_TYPES[option], index)
+                    for index, option in path if option != _SINGLE
+                ]
+                best_results.append(DecomposeResult([0] * 34, blocks))
+            if best == floor and not keep_ties:
+                break
+            option = -1
+        else:
+            option = frame[1]
+            position = i % 9 if i < 27 else 9
+            # 先頭の牌から3種類分（枚数・次の牌・2つ先の牌）
+            field = board >> (KEY_BITS * i)
+            while option <= _SINGLE:
+                if option == _TOITSU:
+                    ok = field & FIELD_MASK >= 2
+                elif option == _KOTSU:
+                    ok = field & FIELD_MASK >= 3
+                elif option == _SHUNTSU:
+                    ok = position <= 6 and field & _NEXT_RANK and field & _SECOND_RANK
+                elif option == _RYAMMEN:
+                    ok = position <= 7 and field & _NEXT_RANK
+                elif option == _KANCHAN:
+                    ok = position <= 6 and field & _SECOND_RANK
+                else:
+                    ok = True
+                if ok:
+                    break
+                option += 1
+
+        if option == -1 or option > _SINGLE:
+            # この深さの選択肢を試し終えたので1つ戻る
+            stack.pop()
+            if path:
+                index, undo = path.pop()
+                board += _OPTION_DELTAS[undo][index]
+                mentsu -= _OPTION_MENTSU[undo]
+                tatsu -= _OPTION_TATSU[undo]
+                remaining += _OPTION_TILES[undo]
+                if undo == _TOITSU:
+                    toitsu -= 1
+            continue
+
+        frame[1] = option + 1
+        board -= _OPTION_DELTAS[option][i]
+        mentsu += _OPTION_MENTSU[option]
+        tatsu += _OPTION_TATSU[option]
+        remaining -= _OPTION_TILES[option]
+        if option == _TOITSU:
+            toitsu += 1
+        path.append((i, option))
+
+        bound = _optimistic_shanten(mentsu, tatsu, remaining)
+        if bound > best or (bound == best and not keep_ties) or bound >= limit:
+            # この分岐では最良値を更新できない（次の周で戻し、同じ深さの次の選択肢を試す）
+            stack.append([-1, _SINGLE])
+            continue
+
+        stack.append([_first_tile(board), _TOITSU])
+
+    if best >= limit:
+        return limit, 0, []
+    return best, ties, best_results
+
+
 def min_shanten_cached(counts_tuple: Tuple[int, ...], meld_count: int = 0) -> Tuple[int, int]:
     """
     最小向聴数を取得（キャッシュ版・結果の詳細は省略）
+    色の入れ替え・数字の反転で同じ形になる手牌はキャッシュを共有する（キーは正規形を詰めた整数）
+
+    Returns:
+        (七対子・国士無双を含めた最小向聴数, 一般手で最小向聴数となる分解の数（特殊形の方が良いか同じなら0）)
     """
-    counts = list(counts_tuple)
-    all_results = extract_mentsu_tatsu(counts)
-    
-    min_shanten_value = float('inf')
-    result_count = 0
-    
-    for result in all_results:
-        shanten = calculate_shanten(result.blocks, meld_count)
-        if shanten < min_shanten_value:
-            min_shanten_value = shanten
-            result_count = 1
-        elif shanten == min_shanten_value:
-            result_count += 1
-    
-    return int(min_shanten_value), result_count
+    return _min_shanten_canonical(pack_counts(canonical_counts(counts_tuple)), meld_count)
 
 
-def min_shanten(counts: List[int], meld_count: int = 0) -> Tuple[int, List[DecomposeResult]]:
+@lru_cache(maxsize=2048)
+def _min_shanten_canonical(key: int, meld_count: int = 0) -> Tuple[int, int]:
+    # 正規化（色の入れ替え・数字の反転）は七対子・国士無双の向聴数を変えない
+    counts = list(unpack_key(key))
+    special = special_shanten(counts, meld_count)
+    shanten, ties, _ = _search_min_shanten(counts, meld_count, keep_ties=True, limit=special)
+    return shanten, ties
+
+
+def min_shanten(
+    counts: List[int],
+    meld_count: int = 0,
+    with_results: bool = False
+) -> Tuple[int, List[DecomposeResult]]:
     """
     最小向聴数と分解結果を取得
+    七対子・国士無双の向聴数を先に求め、一般手はそれより良くなる場合だけ探索する
+
+    Args:
+        counts: 34種類の牌の枚数配列
+        meld_count: 副露数
+        with_results: 最小向聴数となる一般手の分解結果も返す（False なら空リスト。特殊形の方が良いか同じなら空）
     """
-    all_results = extract_mentsu_tatsu(counts)
-    
-    min_shanten_value = float('inf')
-    best_results = []
-    
-    for result in all_results:
-        shanten = calculate_shanten(result.blocks, meld_count)
-        if shanten < min_shanten_value:
-            min_shanten_value = shanten
-            best_results = [result]
-        elif shanten == min_shanten_value:
-            best_results.append(result)
-    
-    return int(min_shanten_value), best_results
+    special = special_shanten(counts, meld_count)
+    shanten, _, results = _search_min_shanten(list(counts), meld_count, collect=with_results, limit=special)
+    return shanten, results
 
 
 def get_recommended_discard(hand_str: str) -> str:
@@ -304,75 +445,60 @@ def get_recommended_discard(hand_str: str) -> str:
     Returns:
         推奨打牌の文字列（例: "6m"）
     """
-    tiles = parse_hand(hand_str)
+    hand = Hand.parse(hand_str)
+    
+    if len(hand) != 14:
+        raise ValueError(f"手牌は14枚である必要があります。現在: {len(hand)}枚")
     
-    if len(tiles) != 14:
-        raise ValueError(f"手牌は14枚である必要があります。現在: {len(tiles)}枚")
+    from .shanten_table import IncrementalShanten
     
-    # 手牌をcountsに変換
-    initial_counts = tiles_to_counts(tiles)
+    # 色ごとの分解結果を保持する評価器を作成
+    evaluator = IncrementalShanten(hand.counts)
     
     # 各打牌候補について評価
-    unique_tiles = list(set(tiles))
     best_discard = None
     best_shanten = float('inf')
     best_effective_tiles = 0
     
-    # 候補をカウント順でソート（多い牌から評価することで早期終了しやすくする）
-    tile_counts = Counter(tiles)
-    unique_tiles.sort(key=lambda x: tile_counts[x], reverse=True)
+    # 候補をカウント順でソート（多い牌から評価することで早期終了しやすくする。同数なら出現順）
+    counts = hand.counts
+    unique_indices = sorted(hand.unique_indices(), key=lambda i: -counts[i])
     
-    for candidate in unique_tiles:
-        # 候補牌のインデックスを取得
-        candidate_idx = tile_to_index(candidate)
-        if candidate_idx == -1:
-            continue
-            
-        # 候補牌を1枚減らしたcountsを作成
-        counts = initial_counts[:]
-        counts[candidate_idx] -= 1
+    for candidate_idx in unique_indices:
+        # 候補牌を1枚減らす（変化した色だけを引き直す）
+        evaluator.remove(candidate_idx)
         
         # 向聴数を計算
-        shanten, _ = min_shanten_cached(tuple(counts), 0)
+        shanten = evaluator.shanten()
         
         # 現在の最良より悪い場合は有効牌計算をスキップ
         if shanten > best_shanten:
+            evaluator.add(candidate_idx)
             continue
         
         # 有効牌の枚数を計算
-        effective_tiles = calculate_effective_tiles_fast(counts, shanten)
+        effective_tiles = sum(t['count'] for t in evaluator.effective_tile_types(shanten))
+        evaluator.add(candidate_idx)
         
         # より良い選択肢かチェック
         if (shanten < best_shanten or 
             (shanten == best_shanten and effective_tiles > best_effective_tiles)):
             best_shanten = shanten
             best_effective_tiles = effective_tiles
-            best_discard = candidate
+            best_discard = TILE_NAMES[candidate_idx]
             
             # 0向聴でかつ有効牌が多い場合は早期終了
             if shanten == 0 and effective_tiles >= 8:
                 break
     
-    return best_discard if best_discard else tiles[0]
+    return best_discard if best_discard else TILE_NAMES[hand.order[0]]
 
 
 def tile_to_index(tile: str) -> int:
     """
-    牌文字列をインデックスに変換
+    牌文字列をインデックスに変換（不正な牌は -1）
     """
-    if len(tile) != 2:
-        return -1
-    
-    num, suit = tile[0], tile[1]
-    if suit == 'm':
-        return int(num) - 1
-    elif suit == 'p':
-        return int(num) - 1 + 9
-    elif suit == 's':
-        return int(num) - 1 + 18
-    elif suit == 'z':
-        return int(num) - 1 + 27
-    return -1
+    return TILE_INDEX.get(tile, -1)
 
 
 def calculate_effective_tiles_fast(counts: List[int], current_shanten: int) -> int:
@@ -381,8 +507,8 @@ def calculate_effective_tiles_fast(counts: List[int], current_shanten: int) -> i
     """
     effective_tiles = 0
     
-    # 各牌について、1枚追加した場合の向聴数を確認
-    for i in range(34):
+    # 各牌について、1枚追加した場合の向聴数を確認（どの形でも向聴数が下がらない牌は試さない）
+    for i in draw_tiles(counts, current_shanten):
         if counts[i] < 4:  # まだ取れる牌
             counts[i] += 1
             test_shanten, _ = min_shanten_cached(tuple(counts), 0)
@@ -403,41 +529,31 @@ def analyze_discard_candidates(hand_str: str) -> List[Dict]:
     Returns:
         打牌候補の詳細情報リスト
     """
-    tiles = parse_hand(hand_str)
+    hand = Hand.parse(hand_str)
     
-    if len(tiles) != 14:
-        raise ValueError(f"手牌は14枚である必要があります。現在: {len(tiles)}枚")
+    if len(hand) != 14:
+        raise ValueError(f"手牌は14枚である必要があります。現在: {len(hand)}枚")
     
-    # 各打牌候補について評価
-    unique_tiles = list(set(tiles))
+    from .shanten_table import IncrementalShanten
+    
+    # 色ごとの分解結果を保持する評価器（打牌・ツモでは変化した色だけを引き直す）
+    evaluator = IncrementalShanten(hand.counts)
+    
+    # 各打牌候補について評価（出現順）
     candidates = []
     
-    for candidate in unique_tiles:
+    for candidate_idx in hand.unique_indices():
         # 候補牌を1枚取り除いた手牌で計算
-        remaining_tiles = tiles[:]
-        remaining_tiles.remove(candidate)
-        
-        counts = tiles_to_counts(remaining_tiles)
-        shanten, results = min_shanten(counts)
+        evaluator.remove(candidate_idx)
+        shanten = evaluator.shanten()
         
         # 有効牌の枚数を計算
-        effective_tiles = 0
-        effective_tile_types = []
-        for i in range(34):
-            if counts[i] < 4:  # まだ取れる牌
-                test_counts = counts[:]
-                test_counts[i] += 1
-                test_shanten, _ = min_shanten(test_counts)
-                if test_shanten < shanten:
-                    tile_count = 4 - counts[i]
-                    effective_tiles += tile_count
-                    effective_tile_types.append({
-                        'tile': count_index_to_tile(i),
-                        'count': tile_count
-                    })
+        effective_tile_types = evaluator.effective_tile_types(shanten)
+        effective_tiles = sum(t['count'] for t in effective_tile_types)
+        evaluator.add(candidate_idx)
         
         candidates.append({
-            'discard': candidate,
+            'discard': TILE_NAMES[candidate_idx],
             'shanten': shanten,
             'effective_tiles': effective_tiles,
             'effective_tile_types': effective_tile_types
@@ -454,7 +570,7 @@ def clear_cache():
     キャッシュをクリア（メモリ使用量削減用）
     """
     tiles_to_counts_cached.cache_clear()
-    min_shanten_cached.cache_clear()
+    _min_shanten_canonical.cache_clear()
 
 
 def get_cache_info():
@@ -463,7 +579,7 @@ def get_cache_info():
     """
     return {
         'tiles_to_counts_cache': tiles_to_counts_cached.cache_info()._asdict(),
-        'min_shanten_cache': min_shanten_cached.cache_info()._asdict()
+        'min_shanten_cache': _min_shanten_canonical.cache_info()._asdict()
     }
 
 
@@ -497,6 +613,70 @@ def test_recommended_discard():
             print(f"エラー: {hand} - {e}")
 
 
+# 分解数が多くなる手牌（清一色・七対子形・九蓮宝燈形など）
+WORST_CASE_HANDS = [
+    "11223344556677m",
+    "2233445566778p1z",
+    "1112345678999m1p",
+    "1122334455667m",
+    "13579m13579p2468s",
+]
+
+
+def test_min_shanten_search(samples: int = 1000, seed: int = 0):
+    """分枝限定法の探索と全分解を列挙する方法の一致テスト・時間とピークメモリの比較"""
+    import random
+    import time
+    import tracemalloc
+    from .shanten_table import random_hand_counts
+
+    def enumerate_all(counts):
+        # 全分解を列挙してから最小値を取る（従来の方法）。七対子・国士無双の方が良いか同じなら分解結果は空
+        results = extract_mentsu_tatsu(counts)
+        values = [calculate_shanten(result.blocks) for result in results]
+        best = min(values)
+        special = special_shanten(counts)
+        if special <= best:
+            return special, []
+        return best, [result for result, value in zip(results, values) if value == best]
+
+    def blocks_of(results):
+        return [[(block.type, block.tile_index) for block in result.blocks] for result in results]
+
+    rng = random.Random(seed)
+    mismatches = 0
+    for _ in range(samples):
+        counts = random_hand_counts(rng, rng.choice([13, 14]))
+        expected, expected_results = enumerate_all(counts)
+        shanten, results = min_shanten(counts, with_results=True)
+        mismatches += shanten != expected or blocks_of(results) != blocks_of(expected_results)
+        mismatches += min_shanten(counts)[0] != expected
+    print("=== 分枝限定法 一致テスト ===")
+    print(f"{samples}手: 不一致 {mismatches}件")
+
+    def measure(func, counts, repeat=5):
+        start = time.perf_counter()
+        for _ in range(repeat):
+            func(counts)
+        elapsed = (time.perf_counter() - start) / repeat
+        tracemalloc.start()
+        func(counts)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return elapsed, peak
+
+    print("\n=== 最悪ケースの時間・ピークメモリ（全分解の列挙 → 分枝限定法） ===")
+    for hand in WORST_CASE_HANDS:
+        counts = tiles_to_counts(parse_hand(hand))
+        old_time, old_peak = measure(enumerate_all, counts)
+        new_time, new_peak = measure(min_shanten, counts)
+        print(
+            f"{hand}: {old_time * 1000:.2f}ms → {new_time * 1000:.2f}ms, "
+            f"{old_peak / 1024:.0f}KB → {new_peak / 1024:.0f}KB"
+        )
+    return mismatches == 0
+
+
 if __name__ == "__main__":
     # 例: "112233456m568p12s" の推奨打牌を計算
     hand = "112233456m568p12s"
@@ -533,3 +713,5 @@ if __name__ == "__main__":
     print("\n" + "="*50)
     print("テスト実行:")
     test_recommended_discard()
+    print()
+    test_min_shanten_search()
@@ -3,12 +3,97 @@
 NodeJSの高速アルゴリズムをPythonから呼び出し
 """
 
-import subprocess
-import json
 import os
-from typing import List, Dict
+from typing import Callable, List, Dict, Any
 from functools import lru_cache
 
+from .batch_evaluator import (
+    get_recommended_discard_batch,
+    analyze_discard_candidates_batch
+)
+from .hand import Hand
+from .metrics import FALLBACKS, NODE_FAILURES
+from .node_worker_pool import NodeWorkerError, discard_worker_pool
+from .process_engine import process_engine
+from .request_timing import set_engine, timed_stage
+from .shanten_table import (
+    get_recommended_discard_table,
+    analyze_discard_candidates_table
+)
+from .wait_index import get_shanten_and_effective_tiles_index
+
+# 使用するエンジン: "node"（NodeJS + テーブル参照版フォールバック）、
+# "table"（テーブル参照版のみ）または "batch"（NumPy一括計算版のみ）
+DISCARD_ENGINE = os.getenv("DISCARD_ENGINE", "node")
+
+
+# Python での計算（テーブル参照版）。プロセスプールが有効なら複数コアに分けて計算する
+def _recommend_python(hand_str: str) -> str:
+    if process_engine.enabled:
+        return process_engine.get_recommended_discard(hand_str)
+    return get_recommended_discard_table(hand_str)
+
+
+def _analyze_python(hand_str: str) -> List[Dict]:
+    if process_engine.enabled:
+        return process_engine.analyze_discard_candidates(hand_str)
+    return analyze_discard_candidates_table(hand_str)
+
+
+def _python_engine_name() -> str:
+    return "process" if process_engine.enabled else "table"
+
+
+def _run_engine(func: Callable[[str], Any], hand_str: str) -> Any:
+    """Python版エンジンで計算（Node.jsを使わない設定の場合）"""
+    set_engine("batch" if DISCARD_ENGINE == 'batch' else _python_engine_name())
+    with timed_stage("engine"):
+        return func(hand_str)
+
+
+def _run_fallback(action: str, func: Callable[[str], Any], hand_str: str) -> Any:
+    """Node.jsが失敗した場合にPython版で計算"""
+    NODE_FAILURES.inc("discard")
+    FALLBACKS.inc(action)
+    set_engine(f"{_python_engine_name()}-fallback")
+    with timed_stage("python_fallback", "fallback"):
+        return func(hand_str)
+
+
+def _validate_hand(hand_str: str, size: int):
+    """
+    Node.jsに渡す前に手牌を検証する（不正な手牌は ValueError。Node.jsの失敗・フォールバックとして数えない）
+    """
+    hand = Hand.parse(hand_str)
+    if len(hand) != size:
+        raise ValueError(f"手牌は{size}枚である必要があります。現在: {len(hand)}枚")
+
+
+def _call_node(input_data: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    """
+    常駐Node.jsワーカーで計算を実行
+
+    Args:
+        input_data: discard_calculator.js への入力（hand, action）
+        timeout: タイムアウト（秒）
+
+    Returns:
+        Node.jsからのレスポンス辞書（success=Trueのもの）
+
+    Raises:
+        NodeWorkerError: タイムアウト・通信の失敗、または検証済みの手牌でNode.jsが失敗を返した場合
+    """
+    with timed_stage("node"):
+        response = discard_worker_pool.request(input_data, timeout=timeout)
+
+    if not response.get('success'):
+        raise NodeWorkerError(
+            f"NodeJS calculation failed: {response.get('error', {}).get('message', 'Unknown error')}"
+        )
+
+    set_engine("node")
+    return response
+
 
 def get_recommended_discard_hybrid(hand_str: str) -> str:
     """
@@ -21,41 +106,27 @@ def get_recommended_discard_hybrid(hand_str: str) -> str:
     Returns:
         推奨打牌の文字列（例: "6m"）
     """
-    try:
-        # NodeJSスクリプトのパス
-        script_path = '/app/nodejs/discard_calculator.js'
+    if DISCARD_ENGINE == 'table':
+        return _run_engine(_recommend_python, hand_str)
+    if DISCARD_ENGINE == 'batch':
+        return _run_engine(get_recommended_discard_batch, hand_str)
+    _validate_hand(hand_str, 14)
 
+    try:
         # 入力データを準備
         input_data = {
             'hand': hand_str,
             'action': 'recommend'
         }
 
-        # NodeJSを実行
-        result = subprocess.run(
-            ['node', script_path, json.dumps(input_data)],
-            capture_output=True,
-            text=True,
-            timeout=5  # 5秒でタイムアウト
-        )
-
-        if result.returncode != 0:
-            raise Exception(f"NodeJS execution failed: {result.stderr}")
-
-        # 結果をパース
-        response = json.loads(result.stdout)
-
-        if not response.get('success'):
-            raise Exception(f"NodeJS calculation failed: {response.get('error', {}).get('message', 'Unknown error')}")
+        # 常駐NodeJSワーカーで実行（5秒でタイムアウト）
+        response = _call_node(input_data, timeout=5)
 
         return response['recommend']
 
-    except Exception as e:
-        # NodeJSが失敗した場合は元のPython実装にフォールバック
-        import sys
-        sys.path.append('/app')
-        from main.utils.discard_simulator import get_recommended_discard
-        return get_recommended_discard(hand_str)
+    except NodeWorkerError:
+        # NodeJSが失敗した場合はテーブル参照版にフォールバック
+        return _run_fallback('recommend', _recommend_python, hand_str)
 
 
 def analyze_discard_candidates_hybrid(hand_str: str) -> List[Dict]:
@@ -68,32 +139,21 @@ def analyze_discard_candidates_hybrid(hand_str: str) -> List[Dict]:
     Returns:
         打牌候補の詳細情報リスト
     """
-    try:
-        # NodeJSスクリプトのパス
-        script_path = '/app/nodejs/discard_calculator.js'
+    if DISCARD_ENGINE == 'table':
+        return _run_engine(_analyze_python, hand_str)
+    if DISCARD_ENGINE == 'batch':
+        return _run_engine(analyze_discard_candidates_batch, hand_str)
+    _validate_hand(hand_str, 14)
 
+    try:
         # 入力データを準備
         input_data = {
             'hand': hand_str,
             'action': 'analyze'
         }
 
-        # NodeJSを実行
-        result = subprocess.run(
-            ['node', script_path, json.dumps(input_data)],
-            capture_output=True,
-            text=True,
-            timeout=10  # 10秒でタイムアウト
-        )
-
-        if result.returncode != 0:
-            raise Exception(f"NodeJS execution failed: {result.stderr}")
-
-        # 結果をパース
-        response = json.loads(result.stdout)
-
-        if not response.get('success'):
-            raise Exception(f"NodeJS calculation failed: {response.get('error', {}).get('message', 'Unknown error')}")
+        # 常駐NodeJSワーカーで実行（10秒でタイムアウト）
+        response = _call_node(input_data, timeout=10)
 
         # priority フィールドを除去（APIレスポンスには含めない）
         candidates = response['candidates']
@@ -103,20 +163,19 @@ def analyze_discard_candidates_hybrid(hand_str: str) -> List[Dict]:
 
         return candidates
 
-    except Exception as e:
-        # NodeJSが失敗した場合は元のPython実装にフォールバック
-        import sys
-        sys.path.append('/app')
-        from main.utils.discard_simulator import analyze_discard_candidates
-        return analyze_discard_candidates(hand_str)
+    except NodeWorkerError:
+        # NodeJSが失敗した場合はテーブル参照版にフォールバック
+        return _run_fallback('analyze', _analyze_python, hand_str)
 
 
 def get_cache_info_hybrid():
     """キャッシュの統計情報を取得（ハイブリッド版）"""
     return {
         'hybrid_mode': True,
-        'backend': 'NodeJS with Python fallback',
-        'note': 'NodeJS implementation does not use caching'
+        'backend': 'NodeJS with table fallback' if DISCARD_ENGINE == 'node' else DISCARD_ENGINE,
+        'note': 'NodeJS implementation does not use caching',
+        'node_worker_pool': discard_worker_pool.stats(),
+        'process_engine': process_engine.stats()
     }
 
 
@@ -130,6 +189,7 @@ def get_shanten_and_effective_tiles_hybrid(hand_str: str) -> Dict:
     """
     シャンテン数と有効牌を取得（ハイブリッド版）
     新しいAPI形式でisTenpaiとagarihaiを返す
+    あがり牌は待ち牌インデックス（wait_index）の色ごとのエントリを組み合わせて求める
 
     Args:
         hand_str: 手牌文字列（例: "11223345678m11s"） - 13枚
@@ -144,92 +204,16 @@ def get_shanten_and_effective_tiles_hybrid(hand_str: str) -> Dict:
     # 事前に手牌の枚数をチェック
     try:
         # 簡易的な手牌解析で枚数チェック
-        import sys
-        sys.path.append('/app')
-        from main.utils.discard_simulator import parse_hand
-        tiles = parse_hand(hand_str)
-        if len(tiles) != 13:
-            raise ValueError(f"手牌は13枚である必要があります。現在: {len(tiles)}枚")
+        hand = Hand.parse(hand_str)
+        if len(hand) != 13:
+            raise ValueError(f"手牌は13枚である必要があります。現在: {len(hand)}枚")
     except Exception as parse_error:
         raise ValueError(f"手牌の形式が正しくありません: {str(parse_error)}")
 
-    try:
-        # NodeJSスクリプトのパス
-        script_path = '/app/nodejs/discard_calculator.js'
-
-        # 入力データを準備
-        input_data = {
-            'hand': hand_str,
-            'action': 'agarihai'
-        }
-
-        # NodeJSを実行
-        result = subprocess.run(
-            ['node', script_path, json.dumps(input_data)],
-            capture_output=True,
-            text=True,
-            timeout=5  # 5秒でタイムアウト
-        )
-
-        if result.returncode != 0:
-            raise Exception(f"NodeJS execution failed: {result.stderr}")
-
-        # 結果をパース
-        response = json.loads(result.stdout)
-
-        if not response.get('success'):
-            raise Exception(f"NodeJS calculation failed: {response.get('error', {}).get('message', 'Unknown error')}")
-
-        # レスポンス形式を変更：isTenpaiとagarihaiに変換
-        shanten = response['shanten']
-        is_tenpai = shanten == 0
-        agarihai = [tile['tile'] for tile in response['effective_tiles']] if shanten == 0 else []
-
-        return {
-            'shanten': shanten,
-            'isTenpai': is_tenpai,
-            'agarihai': agarihai,
-            'effective_tiles': response['effective_tiles']  # 後方互換性のため残す
-        }
-
-    except Exception as e:
-        # NodeJSが失敗した場合は元のPython実装にフォールバック
-        import sys
-        sys.path.append('/app')
-        from main.utils.discard_simulator import min_shanten, tiles_to_counts, parse_hand, count_index_to_tile
-
-        tiles = parse_hand(hand_str)
-        if len(tiles) != 13:
-            raise ValueError(f"手牌は13枚である必要があります。現在: {len(tiles)}枚")
-
-        counts = tiles_to_counts(tiles)
-        shanten, _ = min_shanten(counts)
-
-        effective_tiles = []
-        if shanten == 0:
-            for i in range(34):
-                if counts[i] < 4:
-                    test_counts = counts[:]
-                    test_counts[i] += 1
-                    test_shanten, _ = min_shanten(test_counts)
-
-                    if test_shanten < shanten:
-                        tile_count = 4 - counts[i]
-                        effective_tiles.append({
-                            'tile': count_index_to_tile(i),
-                            'count': tile_count
-                        })
-
-        # レスポンス形式を変更：isTenpaiとagarihaiに変換
-        is_tenpai = shanten == 0
-        agarihai = [tile['tile'] for tile in effective_tiles] if shanten == 0 else []
-
-        return {
-            'shanten': shanten,
-            'isTenpai': is_tenpai,
-            'agarihai': agarihai,
-            'effective_tiles': effective_tiles  # 後方互換性のため残す
-        }
+    # 待ち牌インデックスの組み合わせだけで求まるため、エンジン設定によらず探索もNode.jsも使わない
+    set_engine("index")
+    with timed_stage("engine"):
+        return get_shanten_and_effective_tiles_index(hand_str)
 
 
 # テスト用の関数
@@ -315,5 +299,45 @@ def test_hybrid_accuracy():
     print(f"全体結果: {'すべて一致' if all_match else '一部不一致'}")
 
 
+def test_invalid_hand_metrics():
+    """不正な手牌を各エンドポイントに送っても、Node.jsの失敗・フォールバックとして数えないことのテスト"""
+    import asyncio
+    from fastapi import HTTPException
+    from main.routers.agarihai import get_agarihai
+    from main.routers.recommend import analyze_discard_options, recommend_discard
+    from main.schema import RecommendDiscardRequest
+
+    def totals():
+        return sum(NODE_FAILURES.collect().values()), sum(FALLBACKS.collect().values())
+
+    async def post(handler, hand: str) -> int:
+        try:
+            await handler(RecommendDiscardRequest(hand=hand))
+        except HTTPException as e:
+            return e.status_code
+        return 200
+
+    async def run():
+        return [
+            await post(handler, hand)
+            for handler in (recommend_discard, analyze_discard_options, get_agarihai)
+            for hand in ("11m", "bad", "11111m23456p789s1z")
+        ]
+
+    print("=== 不正な手牌のメトリクステスト ===")
+    discard_worker_pool.start()
+    before = totals()
+    statuses = asyncio.run(run())
+    after = totals()
+    discard_worker_pool.shutdown()
+
+    print(f"ステータス: {statuses}")
+    print(f"Node.js失敗・フォールバック: {before} -> {after}")
+    ok = all(status == 400 for status in statuses) and after == before == (0, 0)
+    print("OK" if ok else "NG")
+    return ok
+
+
 if __name__ == "__main__":
     test_hybrid_accuracy()
+    test_invalid_hand_metrics()
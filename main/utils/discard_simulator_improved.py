@@ -3,77 +3,41 @@
 元のロジックと同じ結果を出しつつ、パフォーマンスを改善
 """
 
-import re
 from typing import List, Tuple, Dict, Optional
-from collections import Counter, defaultdict
+from collections import defaultdict
 from itertools import combinations
 from functools import lru_cache
 import copy
 
+from .hand import Hand, TILE_INDEX, TILE_NAMES, pack_counts, unpack_key
+from .special_forms import special_shanten
+from .suit_bits import decode_suit, encode_suit, extract_isolated
+
 
 def parse_hand(hand_str: str) -> List[str]:
     """手牌文字列をパースして牌のリストに変換"""
-    tiles = []
-    pattern = r'(\d+)([mpsz])'
-    matches = re.findall(pattern, hand_str)
-
-    for numbers, suit in matches:
-        for num in numbers:
-            tiles.append(num + suit)
-
-    return tiles
+    return Hand.parse(hand_str).tiles()
 
 
 def tiles_to_counts(tiles: List[str]) -> List[int]:
     """牌のリストを34種類の牌の枚数配列に変換"""
-    counts = [0] * 34
-
-    for tile in tiles:
-        if len(tile) == 2:
-            num, suit = tile[0], tile[1]
-            if suit == 'm':
-                counts[int(num) - 1] += 1
-            elif suit == 'p':
-                counts[int(num) - 1 + 9] += 1
-            elif suit == 's':
-                counts[int(num) - 1 + 18] += 1
-            elif suit == 'z':
-                counts[int(num) - 1 + 27] += 1
-
-    return counts
+    return list(Hand.from_tiles(tiles).counts)
 
 
 def tile_to_index(tile: str) -> int:
     """牌文字列をインデックスに変換"""
-    if len(tile) != 2:
-        return -1
-
-    num, suit = tile[0], tile[1]
-    if suit == 'm':
-        return int(num) - 1
-    elif suit == 'p':
-        return int(num) - 1 + 9
-    elif suit == 's':
-        return int(num) - 1 + 18
-    elif suit == 'z':
-        return int(num) - 1 + 27
-    return -1
+    return TILE_INDEX.get(tile, -1)
 
 
 def count_index_to_tile(index: int) -> str:
     """枚数配列のインデックスから牌文字列に変換"""
-    if index < 9:
-        return str(index + 1) + 'm'
-    elif index < 18:
-        return str(index - 8) + 'p'
-    elif index < 27:
-        return str(index - 17) + 's'
-    else:
-        return str(index - 26) + 'z'
+    return TILE_NAMES[index]
 
 
 class Block:
     """面子・塔子・対子を表すクラス"""
+    __slots__ = ('type', 'tile_index')
+
     def __init__(self, block_type: str, tile_index: int):
         self.type = block_type  # 'kotsu', 'shuntsu', 'toitsu', 'ryammen', 'kanchan', 'penchan'
         self.tile_index = tile_index
@@ -81,6 +45,8 @@ class Block:
 
 class DecomposeResult:
     """分解結果を表すクラス"""
+    __slots__ = ('rest', 'blocks')
+
     def __init__(self, rest: List[int], blocks: List[Block]):
         self.rest = rest
         self.blocks = blocks
@@ -187,43 +153,12 @@ def find_isolated_kotsu_shuntsu(counts: List[int]) -> Tuple[List[Block], List[in
     blocks = []
     new_counts = counts[:]
 
-    # 萬子・筒子・索子の処理
+    # 萬子・筒子・索子の処理（1色27ビットの表現で孤立判定）
     for suit_offset in [0, 9, 18]:
-        for i in range(9):
-            tile_idx = suit_offset + i
-
-            # 刻子の抽出
-            if new_counts[tile_idx] >= 3:
-                # 孤立しているかチェック
-                is_isolated = True
-                for j in range(max(0, i-2), min(9, i+3)):
-                    if j != i and new_counts[suit_offset + j] > 0:
-                        is_isolated = False
-                        break
-
-                if is_isolated:
-                    new_counts[tile_idx] -= 3
-                    blocks.append(Block('kotsu', tile_idx))
-
-            # 順子の抽出
-            if (i <= 6 and
-                new_counts[tile_idx] == 1 and
-                new_counts[tile_idx + 1] == 1 and
-                new_counts[tile_idx + 2] == 1):
-
-                # 孤立しているかチェック
-                is_isolated = True
-                for j in range(max(0, i-2), min(9, i+5)):
-                    if j < i or j > i+2:
-                        if new_counts[suit_offset + j] > 0:
-                            is_isolated = False
-                            break
-
-                if is_isolated:
-                    new_counts[tile_idx] -= 1
-                    new_counts[tile_idx + 1] -= 1
-                    new_counts[tile_idx + 2] -= 1
-                    blocks.append(Block('shuntsu', tile_idx))
+        rest, suit_blocks = extract_isolated(encode_suit(counts, suit_offset))
+        if suit_blocks:
+            new_counts[suit_offset:suit_offset + 9] = decode_suit(rest)
+            blocks.extend(Block(block_type, suit_offset + rank) for block_type, rank in suit_blocks)
 
     # 字牌の刻子
     for i in range(27, 34):
@@ -251,15 +186,26 @@ def calculate_shanten(blocks: List[Block], meld_count: int = 0) -> int:
     return 8 - mentsu * 2 - tatsu - (1 if has_toitsu else 0)
 
 
-@lru_cache(maxsize=16384)
 def min_shanten_improved(counts_tuple: Tuple[int, ...], meld_count: int = 0) -> Tuple[int, int]:
     """
     最小向聴数を取得（改良版・キャッシュ効率向上）
+    キャッシュのキーは枚数を詰めた整数
     """
-    counts = list(counts_tuple)
+    return _min_shanten_key(pack_counts(counts_tuple), meld_count)
+
+
+@lru_cache(maxsize=16384)
+def _min_shanten_key(key: int, meld_count: int = 0) -> Tuple[int, int]:
+    counts = list(unpack_key(key))
+
+    # 七対子・国士無双が聴牌（14枚なら和了）なら一般手はそれより良くならないので列挙しない
+    special = special_shanten(counts, meld_count)
+    if special <= (-1 if sum(counts) >= 14 else 0):
+        return special, 0
+
     all_results = extract_mentsu_tatsu_optimized(counts)
 
-    min_shanten_value = float('inf')
+    min_shanten_value = special
     result_count = 0
 
     for result in all_results:
@@ -275,16 +221,20 @@ def min_shanten_improved(counts_tuple: Tuple[int, ...], meld_count: int = 0) ->
 
 def calculate_effective_tiles_improved(counts: List[int], current_shanten: int) -> int:
     """有効牌の枚数を計算（改良版・高速化）"""
+    return _effective_tiles(Hand(counts), current_shanten)
+
+
+def _effective_tiles(hand: Hand, current_shanten: int) -> int:
+    """1枚ずつツモを足してキーを O(1) で更新しながら有効牌を数える"""
     effective_tiles = 0
-    counts_tuple = tuple(counts)
+    counts = hand.counts
 
     # 各牌について、1枚追加した場合の向聴数を確認
     for i in range(34):
         if counts[i] < 4:  # まだ取れる牌
-            # 新しいcountsを作成
-            new_counts = list(counts_tuple)
-            new_counts[i] += 1
-            test_shanten, _ = min_shanten_improved(tuple(new_counts), 0)
+            hand.add(i)
+            test_shanten, _ = _min_shanten_key(hand.key, 0)
+            hand.remove(i)
             if test_shanten < current_shanten:
                 effective_tiles += (4 - counts[i])
 
@@ -302,77 +252,60 @@ def get_recommended_discard_improved(hand_str: str) -> str:
     Returns:
         推奨打牌の文字列（例: "6m"）
     """
-    tiles = parse_hand(hand_str)
-
-    if len(tiles) != 14:
-        raise ValueError(f"手牌は14枚である必要があります。現在: {len(tiles)}枚")
+    hand = Hand.parse(hand_str)
 
-    # 手牌をcountsに変換
-    initial_counts = tiles_to_counts(tiles)
+    if len(hand) != 14:
+        raise ValueError(f"手牌は14枚である必要があります。現在: {len(hand)}枚")
 
     # 各打牌候補について評価
-    unique_tiles = list(set(tiles))
     best_discard = None
     best_shanten = float('inf')
     best_effective_tiles = 0
 
     # 候補をカウント順でソート（元のロジックに合わせて）
-    tile_counts = Counter(tiles)
-    unique_tiles.sort(key=lambda x: tile_counts[x], reverse=True)
+    counts = hand.counts
+    unique_indices = sorted(hand.unique_indices(), key=lambda i: -counts[i])
 
-    for candidate in unique_tiles:
-        # 候補牌のインデックスを取得
-        candidate_idx = tile_to_index(candidate)
-        if candidate_idx == -1:
-            continue
-
-        # 候補牌を1枚減らしたcountsを作成
-        counts = initial_counts[:]
-        counts[candidate_idx] -= 1
-
-        # 向聴数を計算
-        shanten, _ = min_shanten_improved(tuple(counts), 0)
+    for candidate_idx in unique_indices:
+        # 候補牌を1枚減らして向聴数を計算
+        hand.remove(candidate_idx)
+        shanten, _ = _min_shanten_key(hand.key, 0)
 
         # 現在の最良より悪い場合は有効牌計算をスキップ
         if shanten > best_shanten:
+            hand.add(candidate_idx)
             continue
 
         # 有効牌の枚数を計算
-        effective_tiles = calculate_effective_tiles_improved(counts, shanten)
+        effective_tiles = _effective_tiles(hand, shanten)
+        hand.add(candidate_idx)
 
         # より良い選択肢かチェック
         if (shanten < best_shanten or
             (shanten == best_shanten and effective_tiles > best_effective_tiles)):
             best_shanten = shanten
             best_effective_tiles = effective_tiles
-            best_discard = candidate
+            best_discard = TILE_NAMES[candidate_idx]
 
-    return best_discard if best_discard else tiles[0]
+    return best_discard if best_discard else TILE_NAMES[hand.order[0]]
 
 
 def analyze_discard_candidates_improved(hand_str: str) -> List[Dict]:
     """
     全ての打牌候補を分析して詳細情報を返す（改良版）
     """
-    tiles = parse_hand(hand_str)
+    hand = Hand.parse(hand_str)
 
-    if len(tiles) != 14:
-        raise ValueError(f"手牌は14枚である必要があります。現在: {len(tiles)}枚")
+    if len(hand) != 14:
+        raise ValueError(f"手牌は14枚である必要があります。現在: {len(hand)}枚")
 
-    initial_counts = tiles_to_counts(tiles)
-    unique_tiles = list(set(tiles))
+    counts = hand.counts
     candidates = []
 
-    for candidate in unique_tiles:
-        candidate_idx = tile_to_index(candidate)
-        if candidate_idx == -1:
-            continue
-
+    for candidate_idx in hand.unique_indices():
         # 候補牌を1枚取り除いた手牌で計算
-        counts = initial_counts[:]
-        counts[candidate_idx] -= 1
-
-        shanten, _ = min_shanten_improved(tuple(counts))
+        hand.remove(candidate_idx)
+        shanten, _ = _min_shanten_key(hand.key, 0)
 
         # 有効牌の詳細計算
         effective_tiles = 0
@@ -380,20 +313,21 @@ def analyze_discard_candidates_improved(hand_str: str) -> List[Dict]:
 
         for i in range(34):
             if counts[i] < 4:
-                test_counts = counts[:]
-                test_counts[i] += 1
-                test_shanten, _ = min_shanten_improved(tuple(test_counts))
+                hand.add(i)
+                test_shanten, _ = _min_shanten_key(hand.key, 0)
+                hand.remove(i)
 
                 if test_shanten < shanten:
                     tile_count = 4 - counts[i]
                     effective_tiles += tile_count
                     effective_tile_types.append({
-                        'tile': count_index_to_tile(i),
+                        'tile': TILE_NAMES[i],
                         'count': tile_count
                     })
 
+        hand.add(candidate_idx)
         candidates.append({
-            'discard': candidate,
+            'discard': TILE_NAMES[candidate_idx],
             'shanten': shanten,
             'effective_tiles': effective_tiles,
             'effective_tile_types': effective_tile_types
@@ -408,13 +342,13 @@ def analyze_discard_candidates_improved(hand_str: str) -> List[Dict]:
 def get_cache_info_improved():
     """キャッシュの統計情報を取得"""
     return {
-        'min_shanten_cache': min_shanten_improved.cache_info()._asdict()
+        'min_shanten_cache': _min_shanten_key.cache_info()._asdict()
     }
 
 
 def clear_cache_improved():
     """キャッシュをクリア"""
-    min_shanten_improved.cache_clear()
+    _min_shanten_key.cache_clear()
 
 
 # テスト用の関数
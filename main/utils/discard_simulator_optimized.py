@@ -3,80 +3,47 @@
 従来版の指数的計算量を改善し、より効率的なアルゴリズムを実装
 """
 
-import re
 from typing import List, Tuple, Dict, Optional
-from collections import Counter
 from functools import lru_cache
 
+from .hand import Hand, TILE_INDEX, TILE_NAMES, pack_counts, unpack_key
+
 
 def parse_hand(hand_str: str) -> List[str]:
     """手牌文字列をパースして牌のリストに変換"""
-    tiles = []
-    pattern = r'(\d+)([mpsz])'
-    matches = re.findall(pattern, hand_str)
-
-    for numbers, suit in matches:
-        for num in numbers:
-            tiles.append(num + suit)
-
-    return tiles
+    return Hand.parse(hand_str).tiles()
 
 
 def tiles_to_counts(tiles: List[str]) -> List[int]:
     """牌のリストを34種類の牌の枚数配列に変換"""
-    counts = [0] * 34
-
-    for tile in tiles:
-        if len(tile) == 2:
-            num, suit = tile[0], tile[1]
-            if suit == 'm':
-                counts[int(num) - 1] += 1
-            elif suit == 'p':
-                counts[int(num) - 1 + 9] += 1
-            elif suit == 's':
-                counts[int(num) - 1 + 18] += 1
-            elif suit == 'z':
-                counts[int(num) - 1 + 27] += 1
-
-    return counts
+    return list(Hand.from_tiles(tiles).counts)
 
 
 def tile_to_index(tile: str) -> int:
     """牌文字列をインデックスに変換"""
-    if len(tile) != 2:
-        return -1
-
-    num, suit = tile[0], tile[1]
-    if suit == 'm':
-        return int(num) - 1
-    elif suit == 'p':
-        return int(num) - 1 + 9
-    elif suit == 's':
-        return int(num) - 1 + 18
-    elif suit == 'z':
-        return int(num) - 1 + 27
-    return -1
+    return TILE_INDEX.get(tile, -1)
 
 
 def count_index_to_tile(index: int) -> str:
     """枚数配列のインデックスから牌文字列に変換"""
-    if index < 9:
-        return str(index + 1) + 'm'
-    elif index < 18:
-        return str(index - 8) + 'p'
-    elif index < 27:
-        return str(index - 17) + 's'
-    else:
-        return str(index - 26) + 'z'
+    return TILE_NAMES[index]
 
 
-@lru_cache(maxsize=4096)
 def calculate_shanten_fast(counts_tuple: Tuple[int, ...]) -> int:
     """
     高速向聴数計算（一般手のみ対応）
+    キャッシュのキーは枚数を詰めた整数
+    """
+    return _calculate_shanten_key(pack_counts(counts_tuple))
+
+
+@lru_cache(maxsize=4096)
+def _calculate_shanten_key(key: int) -> int:
+    """
+    高速向聴数計算の本体（キーは pack_counts の整数）
     動的プログラミングを使用してO(1)に近い計算時間を実現
     """
-    counts = list(counts_tuple)
+    counts = list(unpack_key(key))
 
     # 字牌の処理
     jihai_pairs = 0
@@ -163,16 +130,20 @@ def calculate_shanten_fast(counts_tuple: Tuple[int, ...]) -> int:
 
 def calculate_effective_tiles_optimized(counts: List[int], current_shanten: int) -> int:
     """有効牌計算の最適化版"""
+    return _effective_tiles(Hand(counts), current_shanten)
+
+
+def _effective_tiles(hand: Hand, current_shanten: int) -> int:
+    """1枚ずつツモを足してキーを O(1) で更新しながら有効牌を数える"""
     effective_count = 0
-    counts_tuple = tuple(counts)
+    counts = hand.counts
 
     # 各牌種について1枚追加した場合の向聴数をチェック
     for i in range(34):
         if counts[i] < 4:  # 4枚未満の牌のみチェック
-            # 1枚追加
-            new_counts = list(counts_tuple)
-            new_counts[i] += 1
-            new_shanten = calculate_shanten_fast(tuple(new_counts))
+            hand.add(i)
+            new_shanten = _calculate_shanten_key(hand.key)
+            hand.remove(i)
 
             if new_shanten < current_shanten:
                 effective_count += (4 - counts[i])
@@ -190,77 +161,62 @@ def get_recommended_discard_optimized(hand_str: str) -> str:
     Returns:
         推奨打牌の文字列（例: "6m"）
     """
-    tiles = parse_hand(hand_str)
+    hand = Hand.parse(hand_str)
 
-    if len(tiles) != 14:
-        raise ValueError(f"手牌は14枚である必要があります。現在: {len(tiles)}枚")
-
-    # 手牌をcountsに変換
-    initial_counts = tiles_to_counts(tiles)
+    if len(hand) != 14:
+        raise ValueError(f"手牌は14枚である必要があります。現在: {len(hand)}枚")
 
     # 各打牌候補について評価
-    unique_tiles = list(set(tiles))
     best_discard = None
     best_shanten = float('inf')
     best_effective_tiles = 0
 
     # 候補をカウント順でソート（安定した結果のため）
-    tile_counts = Counter(tiles)
-    unique_tiles.sort(key=lambda x: (tile_counts[x], x), reverse=True)
-
-    for candidate in unique_tiles:
-        # 候補牌のインデックスを取得
-        candidate_idx = tile_to_index(candidate)
-        if candidate_idx == -1:
-            continue
-
-        # 候補牌を1枚減らしたcountsを作成
-        counts = initial_counts[:]
-        counts[candidate_idx] -= 1
+    counts = hand.counts
+    unique_indices = sorted(
+        hand.unique_indices(), key=lambda i: (counts[i], TILE_NAMES[i]), reverse=True
+    )
 
-        # 向聴数を計算
-        shanten = calculate_shanten_fast(tuple(counts))
+    for candidate_idx in unique_indices:
+        # 候補牌を1枚減らして向聴数を計算
+        hand.remove(candidate_idx)
+        shanten = _calculate_shanten_key(hand.key)
 
         # 現在の最良より悪い場合はスキップ
         if shanten > best_shanten:
+            hand.add(candidate_idx)
             continue
 
         # 有効牌の枚数を計算
-        effective_tiles = calculate_effective_tiles_optimized(counts, shanten)
+        effective_tiles = _effective_tiles(hand, shanten)
+        hand.add(candidate_idx)
 
         # より良い選択肢かチェック
         if (shanten < best_shanten or
             (shanten == best_shanten and effective_tiles > best_effective_tiles)):
             best_shanten = shanten
             best_effective_tiles = effective_tiles
-            best_discard = candidate
+            best_discard = TILE_NAMES[candidate_idx]
 
-    return best_discard if best_discard else tiles[0]
+    return best_discard if best_discard else TILE_NAMES[hand.order[0]]
 
 
 def analyze_discard_candidates_optimized(hand_str: str) -> List[Dict]:
     """
     全ての打牌候補を分析して詳細情報を返す（最適化版）
     """
-    tiles = parse_hand(hand_str)
+    hand = Hand.parse(hand_str)
 
-    if len(tiles) != 14:
-        raise ValueError(f"手牌は14枚である必要があります。現在: {len(tiles)}枚")
+    if len(hand) != 14:
+        raise ValueError(f"手牌は14枚である必要があります。現在: {len(hand)}枚")
 
-    initial_counts = tiles_to_counts(tiles)
-    unique_tiles = list(set(tiles))
+    counts = hand.counts
     candidates = []
 
-    for candidate in unique_tiles:
-        candidate_idx = tile_to_index(candidate)
-        if candidate_idx == -1:
-            continue
-
+    for candidate_idx in hand.unique_indices():
         # 候補牌を1枚取り除いた手牌で計算
-        counts = initial_counts[:]
-        counts[candidate_idx] -= 1
-
-        shanten = calculate_shanten_fast(tuple(counts))
+        hand.remove(candidate_idx)
+        shanten = _calculate_shanten_key(hand.key)
 
         # 有効牌の詳細計算
         effective_tiles = 0
@@ -268,20 +224,21 @@ def analyze_discard_candidates_optimized(hand_str: str) -> List[Dict]:
 
         for i in range(34):
             if counts[i] < 4:
-                test_counts = counts[:]
-                test_counts[i] += 1
-                test_shanten = calculate_shanten_fast(tuple(test_counts))
+                hand.add(i)
+                test_shanten = _calculate_shanten_key(hand.key)
+                hand.remove(i)
 
                 if test_shanten < shanten:
                     tile_count = 4 - counts[i]
                     effective_tiles += tile_count
                     effective_tile_types.append({
-                        'tile': count_index_to_tile(i),
+                        'tile': TILE_NAMES[i],
                         'count': tile_count
                     })
 
+        hand.add(candidate_idx)
         candidates.append({
-            'discard': candidate,
+            'discard': TILE_NAMES[candidate_idx],
             'shanten': shanten,
             'effective_tiles': effective_tiles,
             'effective_tile_types': effective_tile_types
@@ -296,13 +253,13 @@ def analyze_discard_candidates_optimized(hand_str: str) -> List[Dict]:
 def get_cache_info_optimized():
     """キャッシュの統計情報を取得"""
     return {
-        'shanten_cache': calculate_shanten_fast.cache_info()._asdict()
+        'shanten_cache': _calculate_shanten_key.cache_info()._asdict()
     }
 
 
 def clear_cache_optimized():
     """キャッシュをクリア"""
-    calculate_shanten_fast.cache_clear()
+    _calculate_shanten_key.cache_clear()
 
 
 # テスト用の関数
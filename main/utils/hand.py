@@ -0,0 +1,213 @@
+"""
+手牌の共通表現
+34種類の牌の枚数を bytearray で持ち、1枚の増減は O(1)
+キャッシュのキーには1種類3ビットに詰めた整数を使う（34要素のタプルより小さく、ハッシュも速い）
+0-8: 1-9m, 9-17: 1-9p, 18-26: 1-9s, 27-33: 1-7z
+"""
+
+import re
+from typing import Iterable, List, Sequence, Tuple
+
+# インデックス <-> 牌文字列
+TILE_NAMES: Tuple[str, ...] = tuple(f"{i % 9 + 1}{'mpsz'[i // 9]}" for i in range(34))
+TILE_INDEX = {name: index for index, name in enumerate(TILE_NAMES)}
+
+# 1種類あたりの枚数の上限・キーのビット数
+MAX_COPIES = 4
+KEY_BITS = 3
+_KEY_MASK = (1 << KEY_BITS) - 1
+_KEY_UNITS = tuple(1 << (KEY_BITS * i) for i in range(34))
+
+# 手牌文字列の「数字の並び + 色」と、色ごとの 数字 -> インデックス（存在しない牌は -1）
+_HAND_PATTERN = re.compile(r'([0-9]+)([mpsz])')
+_DIGIT_INDICES = {
+    suit: {str(number): (offset + number - 1 if 1 <= number <= size else -1) for number in range(10)}
+    for suit, offset, size in (('m', 0, 9), ('p', 9, 9), ('s', 18, 9), ('z', 27, 7))
+}
+
+
+def tile_name(index: int) -> str:
+    """インデックスから牌文字列に変換"""
+    return TILE_NAMES[index]
+
+
+def tile_index(tile: str) -> int:
+    """牌文字列からインデックスに変換（不正な牌は -1）"""
+    return TILE_INDEX.get(tile, -1)
+
+
+def pack_counts(counts: Sequence[int]) -> int:
+    """枚数配列を1種類3ビットの整数に詰める"""
+    key = 0
+    for i in range(33, -1, -1):
+        key = (key << KEY_BITS) | counts[i]
+    return key
+
+
+def unpack_key(key: int) -> Tuple[int, ...]:
+    """pack_counts の逆変換"""
+    return tuple((key >> (KEY_BITS * i)) & _KEY_MASK for i in range(34))
+
+
+class Hand:
+    """
+    手牌（34種類の枚数・詰めたキー・枚数・入力順の牌）
+
+    order は parse した時点の牌の並び（打牌候補を出現順に評価するために使う）で、
+    add / remove では変わらない
+    """
+
+    __slots__ = ('counts', 'key', 'size', 'order')
+
+    def __init__(self, counts: Iterable[int] = (), order: bytes = b''):
+        self.counts = bytearray(34)
+        for i, count in enumerate(counts):
+            if count > MAX_COPIES:
+                raise ValueError(f"同じ牌は{MAX_COPIES}枚までです: {TILE_NAMES[i]} {count}枚")
+            self.counts[i] = count
+        self.key = pack_counts(self.counts)
+        self.size = sum(self.counts)
+        self.order = bytes(order) if order else bytes(
+            i for i in range(34) for _ in range(self.counts[i])
+        )
+
+    @classmethod
+    def parse(cls, hand_str: str) -> "Hand":
+        """
+        手牌文字列を直接枚数に変換（例: "112233456m568p112s"）
+
+        Raises:
+            ValueError: 存在しない牌・同じ牌が5枚以上の場合
+        """
+        hand = cls.__new__(cls)
+        hand.counts = counts = bytearray(34)
+        order = bytearray()
+        key = 0
+        for numbers, suit in _HAND_PATTERN.findall(hand_str):
+            indices = _DIGIT_INDICES[suit]
+            for digit in numbers:
+                index = indices[digit]
+                if index < 0:
+                    raise ValueError(f"不正な牌です: {digit}{suit}")
+                if counts[index] >= MAX_COPIES:
+                    raise ValueError(f"同じ牌は{MAX_COPIES}枚までです: {digit}{suit}")
+                counts[index] += 1
+                key += _KEY_UNITS[index]
+                order.append(index)
+        hand.key = key
+        hand.size = len(order)
+        hand.order = bytes(order)
+        return hand
+
+    @classmethod
+    def from_tiles(cls, tiles: Iterable[str]) -> "Hand":
+        """牌文字列のリストから作成"""
+        order = bytes(TILE_INDEX[tile] for tile in tiles)
+        counts = bytearray(34)
+        for index in order:
+            counts[index] += 1
+        return cls(counts, order)
+
+    def add(self, index: int):
+        """牌を1枚加える"""
+        if self.counts[index] >= MAX_COPIES:
+            raise ValueError(f"同じ牌は{MAX_COPIES}枚までです: {TILE_NAMES[index]}")
+        self.counts[index] += 1
+        self.key += _KEY_UNITS[index]
+        self.size += 1
+
+    def remove(self, index: int):
+        """牌を1枚取り除く"""
+        if self.counts[index] == 0:
+            raise ValueError(f"手牌にない牌です: {TILE_NAMES[index]}")
+        self.counts[index] -= 1
+        self.key -= _KEY_UNITS[index]
+        self.size -= 1
+
+    def copy(self) -> "Hand":
+        hand = Hand.__new__(Hand)
+        hand.counts = bytearray(self.counts)
+        hand.key = self.key
+        hand.size = self.size
+        hand.order = self.order
+        return hand
+
+    def tiles(self) -> List[str]:
+        """入力順の牌文字列のリスト"""
+        return [TILE_NAMES[index] for index in self.order]
+
+    def unique_indices(self) -> List[int]:
+        """入力順で最初に出てきた順の牌の種類"""
+        return list(dict.fromkeys(self.order))
+
+    def counts_tuple(self) -> Tuple[int, ...]:
+        return tuple(self.counts)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Hand) and self.key == other.key
+
+    def __hash__(self) -> int:
+        return hash(self.key)
+
+    def __repr__(self) -> str:
+        return f"Hand({''.join(self.tiles())!r})"
+
+
+# テスト用の関数
+def test_hand(samples: int = 2000, seed: int = 0):
+    """パース結果・詰めたキー・増減が既存の変換関数と一致することのテスト"""
+    import random
+    import sys
+    import time
+    from .discard_simulator import parse_hand, tiles_to_counts
+    from .shanten_table import random_hand_counts
+
+    rng = random.Random(seed)
+    hand_strs = []
+    for _ in range(samples):
+        counts = random_hand_counts(rng, 14)
+        tiles = [TILE_NAMES[i] for i in range(34) for _ in range(counts[i])]
+        rng.shuffle(tiles)
+        hand_strs.append(''.join(tiles))
+
+    mismatches = 0
+    for hand_str in hand_strs:
+        hand = Hand.parse(hand_str)
+        counts = tiles_to_counts(parse_hand(hand_str))
+        mismatches += list(hand.counts) != counts or hand.tiles() != parse_hand(hand_str)
+        mismatches += unpack_key(hand.key) != tuple(counts) or len(hand) != 14
+        index = hand.order[0]
+        hand.remove(index)
+        hand.add(index)
+        mismatches += hand.key != pack_counts(counts)
+
+    for invalid in ("0m", "8z", "11111m"):
+        try:
+            Hand.parse(invalid)
+            mismatches += 1
+        except ValueError:
+            pass
+
+    start_time = time.time()
+    for hand_str in hand_strs:
+        tiles_to_counts(parse_hand(hand_str))
+    list_time = time.time() - start_time
+
+    start_time = time.time()
+    for hand_str in hand_strs:
+        Hand.parse(hand_str)
+    hand_time = time.time() - start_time
+
+    counts = tuple(Hand.parse(hand_strs[0]).counts)
+    print("=== Hand 一致テスト ===")
+    print(f"{samples}手: 不一致 {mismatches}件")
+    print(f"パース: 牌リスト経由 {list_time:.4f}秒, 直接 {hand_time:.4f}秒")
+    print(f"キーのサイズ: タプル {sys.getsizeof(counts)}バイト, 整数 {sys.getsizeof(pack_counts(counts))}バイト")
+    return mismatches == 0
+
+
+if __name__ == "__main__":
+    test_hand()
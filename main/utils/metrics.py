@@ -0,0 +1,275 @@
+"""
+Prometheus形式のメトリクス
+計測する側（リクエスト処理中）はスレッドごとの集計領域に加算するだけでロックを取らない
+/metrics の出力時に全スレッドの集計を合算する
+"""
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+from fastapi.responses import JSONResponse
+
+# レイテンシ用のバケット（秒）
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class _ThreadShards:
+    """スレッドごとの集計領域（作成時のみロックを取る）"""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._shards: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def get(self) -> Dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            with self._lock:
+                self._shards.append(shard)
+        return shard
+
+    def all(self) -> List[Dict]:
+        with self._lock:
+            return list(self._shards)
+
+
+class Counter:
+    """単調増加するカウンタ"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._shards = _ThreadShards()
+
+    def inc(self, *labels: Any, amount: float = 1):
+        shard = self._shards.get()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def collect(self) -> Dict[Tuple, float]:
+        totals: Dict[Tuple, float] = {}
+        for shard in self._shards.all():
+            for labels, value in list(shard.items()):
+                totals[labels] = totals.get(labels, 0) + value
+        return totals
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """バケットごとの件数・合計・件数を持つヒストグラム"""
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._shards = _ThreadShards()
+
+    def observe(self, value: float, *labels: Any):
+        shard = self._shards.get()
+        state = shard.get(labels)
+        if state is None:
+            # [各バケットの件数..., +Inf の件数, 合計]
+            state = [0] * (len(self.buckets) + 1) + [0.0]
+            shard[labels] = state
+        state[bisect.bisect_left(self.buckets, value)] += 1
+        state[-1] += value
+
+    @contextmanager
+    def time(self, *labels: Any) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def collect(self) -> Dict[Tuple, List[float]]:
+        totals: Dict[Tuple, List[float]] = {}
+        for shard in self._shards.all():
+            for labels, state in list(shard.items()):
+                total = totals.setdefault(labels, [0] * len(state))
+                for i, value in enumerate(list(state)):
+                    total[i] += value
+        return totals
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for labels, state in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), state):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _format_value(bound)
+                bucket_labels = _format_labels(self.labelnames + ("le",), labels + (le,))
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f"{self.name}_sum{label_text} {_format_value(state[-1])}")
+            lines.append(f"{self.name}_count{label_text} {cumulative}")
+        return lines
+
+
+def _format_labels(names: Sequence[str], values: Sequence[Any]) -> str:
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        pairs.append(f'{name}="{escaped}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Registry:
+    """メトリクスとコレクタ（出力時に値を読む関数）の一覧"""
+
+    def __init__(self):
+        self._metrics: List[Any] = []
+        self._collectors: List[Callable[[], List[Tuple[str, str, str, Dict[Tuple, float]]]]] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def register_collector(self, collector: Callable[[], List[Tuple[str, str, str, Sequence[str], Dict[Tuple, float]]]]):
+        """
+        出力時に呼ばれるコレクタを登録
+        コレクタは (名前, 種類, 説明, ラベル名, {ラベル値: 値}) のリストを返す
+        """
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            for name, kind, documentation, labelnames, values in collector():
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(values.items()):
+                    lines.append(f"{name}{_format_labels(labelnames, labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+REQUEST_DURATION = registry.register(Histogram(
+    "hackday_request_duration_seconds", "HTTP request latency by endpoint", ("method", "endpoint", "status")
+))
+STAGE_DURATION = registry.register(Histogram(
+    "hackday_stage_duration_seconds",
+    "Latency by processing stage (parse, cache, queue, node, engine, fallback, serialize)",
+    ("stage",)
+))
+NODE_FAILURES = registry.register(Counter(
+    "hackday_node_failures_total", "Failed Node.js calls", ("service",)
+))
+FALLBACKS = registry.register(Counter(
+    "hackday_fallbacks_total", "Fallbacks to the Python engine after a Node.js failure", ("action",)
+))
+CACHE_REQUESTS = registry.register(Counter(
+    "hackday_cache_requests_total", "Result cache lookups", ("cache", "result")
+))
+HAND_SHANTEN = registry.register(Counter(
+    "hackday_hand_shanten_total", "Shanten of requested hands", ("action", "shanten")
+))
+
+
+class TimedJSONResponse(JSONResponse):
+    """JSONへの変換時間を serialize ステージとして計測するレスポンス"""
+
+    def render(self, content: Any) -> bytes:
+        with STAGE_DURATION.time("serialize"):
+            return super().render(content)
+
+
+class MetricsMiddleware:
+    """エンドポイントごとのレイテンシを計測するASGIミドルウェア"""
+
+    def __init__(self, app):
+        self.app = app
+        self._paths: Dict[Any, str] = {}
+
+    def _endpoint_path(self, scope) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._paths.get(endpoint)
+        if path is None:
+            # ルーティング済みのエンドポイント関数からパスを引く（パスの種類数だけに抑える）
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            path = path or "unmatched"
+            self._paths[endpoint] = path
+        return path
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            REQUEST_DURATION.observe(
+                time.perf_counter() - start, scope["method"], self._endpoint_path(scope), status["code"]
+            )
+
+
+# テスト用の関数
+def test_metrics_threads(threads: int = 8, per_thread: int = 10000):
+    """複数スレッドから同時に加算しても合計が一致することのテスト"""
+    counter = Counter("test_total", "test", ("kind",))
+    histogram = Histogram("test_seconds", "test", buckets=(0.5, 1.0))
+
+    def work():
+        for i in range(per_thread):
+            counter.inc("a")
+            histogram.observe(0.25 if i % 2 else 0.75)
+
+    workers = [threading.Thread(target=work) for _ in range(threads)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    state = histogram.collect()[()]
+    ok = counter.collect()[("a",)] == threads * per_thread
+    ok = ok and state[0] == state[1] == threads * per_thread // 2
+    print("=== メトリクス集計テスト ===")
+    print("\n".join(histogram.render()))
+    print("OK" if ok else "NG")
+    return ok
+
+
+if __name__ == "__main__":
+    test_metrics_threads()
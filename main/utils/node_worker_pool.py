@@ -0,0 +1,226 @@
+"""
+常駐Node.jsワーカープール
+discard_calculator.js をサーバーモード（--server）で起動し、
+1行1JSONのリクエスト／レスポンスでやり取りする
+"""
+
+import itertools
+import json
+import logging
+import os
+import queue
+import subprocess
+import threading
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SCRIPT_PATH = Path(__file__).parent.parent.parent / "nodejs" / "discard_calculator.js"
+
+
+class NodeWorkerError(Exception):
+    """Node.jsワーカーとの通信に失敗した場合の例外"""
+
+
+class NodeWorker:
+    """1つの常駐Node.jsプロセス（同時に1リクエストのみ処理）"""
+
+    def __init__(self, script_path: Path):
+        self.script_path = Path(script_path)
+        self.served = 0
+        self.process = subprocess.Popen(
+            ["node", self.script_path.name, "--server"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            text=True,
+            bufsize=1,
+            cwd=self.script_path.parent
+        )
+        self._responses: "queue.Queue[Optional[str]]" = queue.Queue()
+
+        # 標準出力・標準エラーはそれぞれ専用スレッドで読み続ける
+        threading.Thread(target=self._read_stdout, daemon=True).start()
+        threading.Thread(target=self._read_stderr, daemon=True).start()
+
+    def _read_stdout(self):
+        for line in self.process.stdout:
+            self._responses.put(line)
+        # EOF（プロセス終了）を通知
+        self._responses.put(None)
+
+    def _read_stderr(self):
+        for line in self.process.stderr:
+            logger.warning(f"Node.js worker (pid={self.process.pid}) stderr: {line.rstrip()}")
+
+    def is_alive(self) -> bool:
+        return self.process.poll() is None
+
+    def request(self, payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+        """リクエストを送信し、同じIDのレスポンスを待つ"""
+        request_id = payload["id"]
+        try:
+            self.process.stdin.write(json.dumps(payload, ensure_ascii=False) + "\n")
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError, ValueError) as e:
+            raise NodeWorkerError(f"Failed to write to Node.js worker: {str(e)}")
+
+        while True:
+            try:
+                line = self._responses.get(timeout=timeout)
+            except queue.Empty:
+                raise NodeWorkerError(f"Node.js worker timed out after {timeout}s")
+
+            if line is None:
+                raise NodeWorkerError(f"Node.js worker exited (returncode={self.process.poll()})")
+
+            try:
+                response = json.loads(line)
+            except json.JSONDecodeError as e:
+                raise NodeWorkerError(f"Invalid JSON response from Node.js worker: {str(e)}")
+
+            # 以前のリクエストの応答が残っていた場合は読み捨てる
+            if response.get("id") != request_id:
+                continue
+
+            self.served += 1
+            return response
+
+    def close(self):
+        """プロセスを終了させる"""
+        try:
+            self.process.stdin.close()
+        except Exception:
+            pass
+        try:
+            self.process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class NodeWorkerPool:
+    """
+    常駐Node.jsワーカーのプール
+
+    - pool_size: 同時に起動しておくワーカー数
+    - max_requests: 1ワーカーが処理するリクエスト数の上限（超えたら再起動）
+    - クラッシュ・タイムアウトしたワーカーは自動的に作り直す
+    """
+
+    def __init__(self, script_path: Path, pool_size: int, max_requests: int):
+        self.script_path = Path(script_path)
+        self.pool_size = max(1, pool_size)
+        self.max_requests = max(1, max_requests)
+        self._idle: "queue.Queue[NodeWorker]" = queue.Queue()
+        self._workers = set()
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self._request_ids = itertools.count(1)
+        self._respawns = 0
+        self._recycles = 0
+
+    def start(self):
+        """ワーカーを起動（未起動の場合のみ）"""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+            self._closed = False
+            for _ in range(self.pool_size):
+                self._idle.put(self._spawn_locked())
+
+    def _spawn_locked(self) -> NodeWorker:
+        worker = NodeWorker(self.script_path)
+        self._workers.add(worker)
+        return worker
+
+    def _replace(self, worker: NodeWorker) -> Optional[NodeWorker]:
+        """ワーカーを終了させ、代わりのワーカーを起動する"""
+        worker.close()
+        with self._lock:
+            self._workers.discard(worker)
+            if self._closed:
+                return None
+            return self._spawn_locked()
+
+    def request(self, payload: Dict[str, Any], timeout: float = 5) -> Dict[str, Any]:
+        """
+        空いているワーカーにリクエストを送信してレスポンスを返す
+
+        Args:
+            payload: discard_calculator.js に渡す入力データ（hand, action）
+            timeout: ワーカー取得・応答待ちのタイムアウト（秒）
+
+        Returns:
+            Node.jsからのレスポンス辞書
+        """
+        self.start()
+
+        try:
+            worker = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            raise NodeWorkerError(f"No idle Node.js worker within {timeout}s")
+
+        try:
+            if not worker.is_alive():
+                self._respawns += 1
+                logger.warning(f"Node.js worker (pid={worker.process.pid}) is dead, respawning")
+                worker = self._replace(worker)
+                if worker is None:
+                    raise NodeWorkerError("Node.js worker pool is shut down")
+
+            request_payload = dict(payload)
+            request_payload["id"] = next(self._request_ids)
+
+            try:
+                return worker.request(request_payload, timeout)
+            except NodeWorkerError:
+                # 状態が不明なワーカーは使い回さない
+                self._respawns += 1
+                logger.warning(f"Node.js worker (pid={worker.process.pid}) failed, respawning")
+                worker = self._replace(worker)
+                raise
+        finally:
+            if worker is not None:
+                if worker.served >= self.max_requests:
+                    self._recycles += 1
+                    worker = self._replace(worker)
+            if worker is not None:
+                self._idle.put(worker)
+
+    def shutdown(self):
+        """全ワーカーを終了させる"""
+        with self._lock:
+            self._closed = True
+            self._started = False
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.close()
+        while True:
+            try:
+                self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+    def stats(self) -> Dict[str, Any]:
+        """プールの統計情報"""
+        return {
+            "pool_size": self.pool_size,
+            "max_requests": self.max_requests,
+            "workers": len(self._workers),
+            "idle_workers": self._idle.qsize(),
+            "respawns": self._respawns,
+            "recycles": self._recycles
+        }
+
+
+# シングルトンインスタンス（初回リクエスト時にワーカーを起動）
+discard_worker_pool = NodeWorkerPool(
+    DEFAULT_SCRIPT_PATH,
+    pool_size=int(os.getenv("DISCARD_NODE_POOL_SIZE", os.cpu_count() or 2)),
+    max_requests=int(os.getenv("DISCARD_NODE_MAX_REQUESTS", 1000))
+)
@@ -0,0 +1,275 @@
+"""
+プロセスプールによる打牌候補の並列計算
+Pythonでの計算（Node.jsのフォールバック・DISCARD_ENGINE=table）はGILのため1コアでしか動かないので、
+打牌候補や一括計算の手牌を常駐ワーカープロセスに分けて複数コアで計算する
+
+ワーカーは起動時に向聴数テーブルを読み込み、キャッシュを温めてから受け付ける
+結果はテーブル参照版（shanten_table）の逐次計算と完全に一致する
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Optional, Tuple
+
+from .hand import Hand, TILE_NAMES
+from .shanten_table import (
+    IncrementalShanten,
+    analyze_discard_candidates_table,
+    get_recommended_discard_table,
+    get_shanten_and_effective_tiles_table,
+    get_tables,
+    get_tile_priority
+)
+
+logger = logging.getLogger(__name__)
+
+# ワーカーの起動方式（forkserver はこのモジュールを読み込んだ状態のサーバープロセスから fork する）
+_MP_CONTEXT = multiprocessing.get_context("forkserver")
+_MP_CONTEXT.set_forkserver_preload([__name__])
+
+# ワーカーのキャッシュを温めるための手牌
+WARM_UP_HANDS = [
+    "112233456m568p12s",
+    "123456789m1123p3s",
+    "11223345678m112s",
+    "19m19p19s1234567z1m",
+]
+
+
+def _init_worker():
+    """ワーカー起動時の初期化（テーブル読み込み・キャッシュの準備）"""
+    get_tables()
+    for hand_str in WARM_UP_HANDS:
+        analyze_discard_candidates_table(hand_str)
+
+
+def _warm_up() -> int:
+    return os.getpid()
+
+
+def _evaluate_discards(counts: bytes, discard_indices: List[int]) -> List[Tuple[int, List[Dict]]]:
+    """
+    打牌候補ごとの向聴数と有効牌を計算（ワーカーで実行）
+
+    Returns:
+        discard_indices と同じ順の (向聴数, 有効牌リスト)
+    """
+    evaluator = IncrementalShanten(counts)
+    results = []
+    for index in discard_indices:
+        evaluator.remove(index)
+        shanten = evaluator.shanten()
+        results.append((shanten, evaluator.effective_tile_types(shanten)))
+        evaluator.add(index)
+    return results
+
+
+def _analyze_hands(hand_strs: List[str]) -> List[List[Dict]]:
+    """複数の手牌をまとめて分析（ワーカーで実行）"""
+    return [analyze_discard_candidates_table(hand_str) for hand_str in hand_strs]
+
+
+def _parse_14(hand_str: str) -> Hand:
+    hand = Hand.parse(hand_str)
+    if len(hand) != 14:
+        raise ValueError(f"手牌は14枚である必要があります。現在: {len(hand)}枚")
+    return hand
+
+
+class ProcessEngine:
+    """
+    常駐ワーカープロセスで打牌候補を並列計算するエンジン
+
+    - max_workers: ワーカープロセス数（0なら無効）
+    - ワーカーが異常終了した場合はプールを作り直し、その回は逐次計算する
+    """
+
+    def __init__(self, max_workers: int):
+        self.max_workers = max(0, max_workers)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._restarts = 0
+        self._worker_pids: List[int] = []
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_workers > 0
+
+    def start(self):
+        """ワーカーを起動し、全ワーカーの初期化が終わるまで待つ"""
+        if not self.enabled:
+            return
+        self._get_executor()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                # スレッドやNode.jsワーカーのパイプを持つプロセスから fork しないよう forkserver で起動する
+                # （テーブルは各ワーカーが mmap で開くので、ページキャッシュは共有される）
+                executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    mp_context=_MP_CONTEXT,
+                    initializer=_init_worker
+                )
+                # 全ワーカーを今のうちに起動させる（初回リクエストで起動を待たせない）
+                futures = [executor.submit(_warm_up) for _ in range(self.max_workers)]
+                self._worker_pids = sorted({future.result() for future in futures})
+                self._executor = executor
+                logger.info(f"Process engine started with {self.max_workers} workers")
+            return self._executor
+
+    def _restart(self, error: Exception):
+        logger.warning(f"Process engine pool is broken, restarting: {str(error)}")
+        with self._lock:
+            executor, self._executor = self._executor, None
+            self._restarts += 1
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def evaluate_discards(self, hand: Hand) -> Dict[int, Tuple[int, List[Dict]]]:
+        """
+        打牌候補をワーカー数に分割して並列に評価
+
+        Returns:
+            {打牌インデックス（出現順）: (向聴数, 有効牌リスト)}
+        """
+        # ワーカーには34バイトの枚数だけを送る
+        counts = bytes(hand.counts)
+        candidates = hand.unique_indices()
+        chunk_size = -(-len(candidates) // self.max_workers)
+        chunks = [candidates[i:i + chunk_size] for i in range(0, len(candidates), chunk_size)]
+
+        try:
+            executor = self._get_executor()
+            futures = [executor.submit(_evaluate_discards, counts, chunk) for chunk in chunks]
+            results = [result for future in futures for result in future.result()]
+        except BrokenProcessPool as e:
+            self._restart(e)
+            results = _evaluate_discards(counts, candidates)
+
+        return dict(zip(candidates, results))
+
+    def analyze_discard_candidates(self, hand_str: str) -> List[Dict]:
+        """全ての打牌候補を分析（analyze_discard_candidates_table と同じ結果）"""
+        hand = _parse_14(hand_str)
+        candidates = []
+        for candidate_idx, (shanten, effective_tile_types) in self.evaluate_discards(hand).items():
+            candidates.append({
+                'discard': TILE_NAMES[candidate_idx],
+                'shanten': shanten,
+                'effective_tiles': sum(t['count'] for t in effective_tile_types),
+                'effective_tile_types': effective_tile_types
+            })
+
+        candidates.sort(key=lambda x: (x['shanten'], -x['effective_tiles'], -get_tile_priority(x['discard'])))
+        return candidates
+
+    def get_recommended_discard(self, hand_str: str) -> str:
+        """推奨打牌を計算（get_recommended_discard_table と同じ結果）"""
+        hand = _parse_14(hand_str)
+        evaluated = self.evaluate_discards(hand)
+
+        # 枚数の多い順（同数なら出現順）に評価し、最初に最良となった牌を選ぶ
+        counts = hand.counts
+        best_discard = None
+        best_key = None
+        for candidate_idx in sorted(evaluated, key=lambda i: -counts[i]):
+            shanten, effective_tile_types = evaluated[candidate_idx]
+            candidate = TILE_NAMES[candidate_idx]
+            key = (-shanten, sum(t['count'] for t in effective_tile_types), get_tile_priority(candidate))
+            if best_key is None or key > best_key:
+                best_key = key
+                best_discard = candidate
+
+        return best_discard if best_discard else TILE_NAMES[hand.order[0]]
+
+    def get_shanten_and_effective_tiles(self, hand_str: str) -> Dict:
+        """シャンテン数とあがり牌を取得（ワーカー1つで計算）"""
+        try:
+            return self._get_executor().submit(get_shanten_and_effective_tiles_table, hand_str).result()
+        except BrokenProcessPool as e:
+            self._restart(e)
+            return get_shanten_and_effective_tiles_table(hand_str)
+
+    def analyze_hands(self, hand_strs: List[str]) -> List[List[Dict]]:
+        """複数の手牌をワーカー数に分割して並列に分析"""
+        chunk_size = max(1, -(-len(hand_strs) // self.max_workers))
+        chunks = [hand_strs[i:i + chunk_size] for i in range(0, len(hand_strs), chunk_size)]
+        try:
+            executor = self._get_executor()
+            futures = [executor.submit(_analyze_hands, chunk) for chunk in chunks]
+            return [result for future in futures for result in future.result()]
+        except BrokenProcessPool as e:
+            self._restart(e)
+            return _analyze_hands(hand_strs)
+
+    def shutdown(self):
+        """ワーカープロセスを終了"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        """プールの統計情報"""
+        return {
+            "max_workers": self.max_workers,
+            "started": self._executor is not None,
+            "worker_pids": self._worker_pids,
+            "restarts": self._restarts
+        }
+
+
+# シングルトンインスタンス（DISCARD_PROCESS_WORKERS が1以上のときに有効）
+process_engine = ProcessEngine(max_workers=int(os.getenv("DISCARD_PROCESS_WORKERS", 0)))
+
+
+# テスト用の関数
+def test_process_engine(samples: int = 300, seed: int = 0, max_workers: int = 2):
+    """プロセスプール版と逐次計算版の一致テスト・性能比較"""
+    import random
+    import time
+    from .shanten_table import random_hand_counts
+
+    names = [f"{i % 9 + 1}{'mpsz'[i // 9]}" for i in range(34)]
+    rng = random.Random(seed)
+    hands = []
+    for _ in range(samples):
+        counts = random_hand_counts(rng, 14)
+        tiles = [names[i] for i in range(34) for _ in range(counts[i])]
+        rng.shuffle(tiles)
+        hands.append(''.join(tiles))
+
+    print("=== プロセスプール版 一致テスト ===")
+    engine = ProcessEngine(max_workers)
+    start_time = time.time()
+    engine.start()
+    print(f"ワーカー起動: {time.time() - start_time:.4f}秒 ({max_workers}プロセス)")
+
+    mismatches = 0
+    for hand_str in hands:
+        mismatches += engine.analyze_discard_candidates(hand_str) != analyze_discard_candidates_table(hand_str)
+        mismatches += engine.get_recommended_discard(hand_str) != get_recommended_discard_table(hand_str)
+        mismatches += engine.get_shanten_and_effective_tiles(hand_str[:26]) != \
+            get_shanten_and_effective_tiles_table(hand_str[:26])
+
+    start_time = time.time()
+    expected = [analyze_discard_candidates_table(hand_str) for hand_str in hands]
+    serial_time = time.time() - start_time
+
+    start_time = time.time()
+    actual = engine.analyze_hands(hands)
+    parallel_time = time.time() - start_time
+    mismatches += sum(1 for a, b in zip(expected, actual) if a != b)
+
+    engine.shutdown()
+    print(f"{samples}手: 逐次 {serial_time:.4f}秒, 並列 {parallel_time:.4f}秒, 不一致 {mismatches}件")
+    return mismatches == 0
+
+
+if __name__ == "__main__":
+    test_process_engine()
@@ -0,0 +1,150 @@
+"""
+リクエストごとの処理時間の内訳（Server-Timing / X-Engine ヘッダ）
+サービス層・エンジン層は引数で受け渡さず、contextvars 経由で現在のリクエストに書き込む
+エグゼキュータのスレッドにはコンテキストをコピーして渡す（同じ集計オブジェクトを共有する）
+一括計算・ストリーミングで並列に処理する各件は item_timing で別に集計し、区間ごとの最大値だけを反映する
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional, Sequence
+
+from .metrics import STAGE_DURATION
+
+# Server-Timing に出す区間（この順で出力し、最後に total を付ける）
+STAGES = ("parse", "cache", "queue", "node", "engine", "python_fallback")
+
+
+class RequestTiming:
+    """1リクエスト分の区間ごとの処理時間と、結果を返したエンジン"""
+
+    __slots__ = ("start", "durations", "parallel", "engine")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.durations: Dict[str, float] = {}
+        # 並列に処理した件の区間ごとの最大値（合計すると経過時間を超えるため）
+        self.parallel: Dict[str, float] = {}
+        self.engine: Optional[str] = None
+
+    def add(self, stage: str, seconds: float):
+        self.durations[stage] = self.durations.get(stage, 0.0) + seconds
+
+    def merge_parallel(self, item: "RequestTiming"):
+        """並列に処理した1件分の集計を反映（区間ごとに最大値を残す）"""
+        for stage, seconds in item.stage_durations().items():
+            self.parallel[stage] = max(self.parallel.get(stage, 0.0), seconds)
+        if item.engine is not None:
+            self.engine = item.engine
+
+    def stage_durations(self) -> Dict[str, float]:
+        """区間ごとの処理時間（逐次に処理した分 + 並列に処理した分の最大値）"""
+        durations = dict(self.durations)
+        for stage, seconds in self.parallel.items():
+            durations[stage] = durations.get(stage, 0.0) + seconds
+        return durations
+
+    def server_timing(self) -> str:
+        """Server-Timing ヘッダの値（ミリ秒）"""
+        durations = self.stage_durations()
+        parts = [
+            f"{stage};dur={durations[stage] * 1000:.3f}"
+            for stage in STAGES if stage in durations
+        ]
+        parts.append(f"total;dur={(time.perf_counter() - self.start) * 1000:.3f}")
+        return ", ".join(parts)
+
+
+_current: ContextVar[Optional[RequestTiming]] = ContextVar("request_timing", default=None)
+
+
+def current_timing() -> Optional[RequestTiming]:
+    """処理中のリクエストの集計（リクエスト外なら None）"""
+    return _current.get()
+
+
+def record_stage(stage: str, seconds: float, metric_stage: Optional[str] = None):
+    """
+    区間の処理時間を記録（/metrics のヒストグラムにも加算する）
+
+    Args:
+        stage: Server-Timing の区間名
+        seconds: 処理時間（秒）
+        metric_stage: /metrics での区間名（省略時は stage と同じ）
+    """
+    STAGE_DURATION.observe(seconds, metric_stage or stage)
+    timing = _current.get()
+    if timing is not None:
+        timing.add(stage, seconds)
+
+
+@contextmanager
+def timed_stage(stage: str, metric_stage: Optional[str] = None) -> Iterator[None]:
+    """with ブロックの処理時間を区間として記録"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - start, metric_stage)
+
+
+@contextmanager
+def item_timing() -> Iterator[None]:
+    """
+    並列に処理する1件分の区間を別に集計し、終了時に現在のリクエストへ区間ごとの最大値として反映
+    asyncio のタスクごとに呼ぶこと（タスクはコンテキストのコピーを持つため、他の件の集計と混ざらない）
+    """
+    parent = _current.get()
+    if parent is None:
+        yield
+        return
+    item = RequestTiming()
+    token = _current.set(item)
+    try:
+        yield
+    finally:
+        _current.reset(token)
+        parent.merge_parallel(item)
+
+
+def set_engine(engine: str):
+    """結果を返したエンジンを記録（X-Engine ヘッダ）"""
+    timing = _current.get()
+    if timing is not None:
+        timing.engine = engine
+
+
+class ServerTimingMiddleware:
+    """
+    対象パスのレスポンスに Server-Timing と X-Engine ヘッダを付けるASGIミドルウェア
+
+    ヘッダはレスポンス開始時点までの集計を出す（ストリーミングでは開始前の区間のみ）
+    """
+
+    def __init__(self, app, path_prefixes: Sequence[str]):
+        self.app = app
+        self.path_prefixes = tuple(path_prefixes)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.path_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        timing = RequestTiming()
+        token = _current.set(timing)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", timing.server_timing().encode("latin-1")))
+                headers.append((b"timing-allow-origin", b"*"))
+                if timing.engine is not None:
+                    headers.append((b"x-engine", timing.engine.encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
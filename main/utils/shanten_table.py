@@ -0,0 +1,623 @@
+"""
+テーブル参照による向聴数計算エンジン
+数牌1色（9種）と字牌（7種）の枚数ベクトルごとに、取り得る
+（面子・塔子・雀頭）の組み合わせを事前計算しておき、
+向聴数を数回のテーブル参照と小さな合成処理だけで求める
+
+discard_simulator.min_shanten と完全に同じ値を返す
+"""
+
+import logging
+import mmap
+import os
+import random
+import struct
+import sys
+import zlib
+from array import array
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from .hand import Hand, TILE_NAMES
+from .special_forms import SpecialShanten, draw_tiles, special_shanten
+from .suit_bits import decode_suit, encode_suit, extract_isolated
+
+
+SUIT_TABLE_SIZE = 5 ** 9   # 数牌1色（各牌0〜4枚）の枚数ベクトル数
+HONOR_TABLE_SIZE = 5 ** 7  # 字牌の枚数ベクトル数
+MAX_SUIT_TILES = 14        # 事前計算する1色あたりの最大枚数
+MISSING_ENTRY = 0xFFFF     # 事前計算していないエントリ
+
+# 事前計算済みテーブルファイル
+# ヘッダ（32バイト）: マジック, フォーマット版数, テーブル版数, 各テーブルのエントリ数, CRC32
+# 本体: 数牌テーブル（uint16 リトルエンディアン）→ 字牌テーブル（uint8）
+TABLE_MAGIC = b"SHTB"
+TABLE_FORMAT_VERSION = 1
+TABLE_VERSION = 1          # 分解ルール・エンコードを変更したら上げる
+TABLE_HEADER = struct.Struct("<4sHHIII")
+TABLE_HEADER_SIZE = 32
+DEFAULT_TABLE_PATH = Path(
+    os.getenv("SHANTEN_TABLE_PATH", Path(__file__).parent / "data" / "shanten_table.bin")
+)
+
+logger = logging.getLogger(__name__)
+
+# 1色の分解結果は (u, m, p) で表す
+#   u = 2 * 面子数 + 塔子数（対子を含む）
+#   m = 面子数
+#   p = 対子を含むかどうか
+# calculate_shanten の式は max(8 - U, 4 - M - P)（U, M は全色の合計、P は論理和）と等しいため、
+# u・m・m+p がすべて以上の候補に支配される候補は捨ててよい（1色あたり高々2候補になる）
+Option = Tuple[int, int, int]
+
+
+def _prune(options) -> Tuple[Option, ...]:
+    """支配される候補を取り除く"""
+    result = []
+    for o in sorted(set(options), reverse=True):
+        if not any(r[0] >= o[0] and r[1] >= o[1] and r[1] + r[2] >= o[1] + o[2] for r in result):
+            result.append(o)
+    return tuple(result)
+
+
+_decompose_memo: Dict[Tuple[int, ...], Tuple[Option, ...]] = {}
+
+
+def _decompose_suit(counts: Tuple[int, ...]) -> Tuple[Option, ...]:
+    """
+    数牌1色の全分解（extract_mentsu_tatsu の再帰部分と同じ分岐）の候補を求める
+    """
+    cached = _decompose_memo.get(counts)
+    if cached is not None:
+        return cached
+
+    i = 0
+    while i < 9 and counts[i] == 0:
+        i += 1
+    if i == 9:
+        return ((0, 0, 0),)
+
+    options = []
+    c = list(counts)
+
+    def take(indices, block: Option):
+        for j in indices:
+            c[j] -= 1
+        for u, m, p in _decompose_suit(tuple(c)):
+            options.append((u + block[0], m + block[1], p | block[2]))
+        for j in indices:
+            c[j] += 1
+
+    # 対子
+    if c[i] >= 2:
+        take((i, i), (1, 0, 1))
+    # 刻子
+    if c[i] >= 3:
+        take((i, i, i), (2, 1, 0))
+    # 順子
+    if i <= 6 and c[i + 1] > 0 and c[i + 2] > 0:
+        take((i, i + 1, i + 2), (2, 1, 0))
+    # 両面塔子
+    if i <= 7 and c[i + 1] > 0:
+        take((i, i + 1), (1, 0, 0))
+    # 嵌張塔子
+    if i <= 6 and c[i + 2] > 0:
+        take((i, i + 2), (1, 0, 0))
+    # 単騎として残す
+    take((i,), (0, 0, 0))
+
+    result = _prune(options)
+    _decompose_memo[counts] = result
+    return result
+
+
+def _extract_isolated_suit(counts: List[int]) -> int:
+    """
+    find_isolated_kotsu_shuntsu と同じ規則で孤立した刻子・順子を取り除き、その個数を返す
+    """
+    rest, blocks = extract_isolated(encode_suit(counts))
+    if blocks:
+        counts[:] = decode_suit(rest)
+    return len(blocks)
+
+
+@lru_cache(maxsize=4096)
+def suit_options(counts: Tuple[int, ...]) -> Tuple[Option, ...]:
+    """数牌1色の枚数ベクトルに対する分解候補（孤立面子の抽出を含む）"""
+    rest = list(counts)
+    isolated = _extract_isolated_suit(rest)
+    return tuple((u + 2 * isolated, m + isolated, p) for u, m, p in _decompose_suit(tuple(rest)))
+
+
+def honor_option(counts: Tuple[int, ...]) -> Option:
+    """字牌の枚数ベクトルに対する分解結果（刻子は必ず抜き出されるため候補は1つ）"""
+    kotsu = sum(1 for c in counts if c >= 3)
+    toitsu = sum(1 for c in counts if c == 2)
+    return (2 * kotsu + toitsu, kotsu, 1 if toitsu > 0 else 0)
+
+
+def _encode_option(option: Option) -> int:
+    u, m, p = option
+    return u | (m << 4) | (p << 7)
+
+
+def _decode_option(code: int) -> Option:
+    return (code & 0x0F, (code >> 4) & 0x07, code >> 7)
+
+
+def _encode_options(options: Tuple[Option, ...]) -> int:
+    first = _encode_option(options[0])
+    second = _encode_option(options[-1])
+    return first | (second << 8)
+
+
+def _iter_suit_vectors(size: int, max_tiles: int):
+    """各牌0〜4枚・合計 max_tiles 枚以下の枚数ベクトルを列挙"""
+    counts = [0] * size
+
+    def rec(i: int, remaining: int):
+        if i == size:
+            yield counts
+            return
+        for n in range(min(4, remaining) + 1):
+            counts[i] = n
+            yield from rec(i + 1, remaining - n)
+        counts[i] = 0
+
+    return rec(0, max_tiles)
+
+
+def suit_key(counts, offset: int = 0, size: int = 9) -> int:
+    """枚数ベクトル（counts[offset:offset+size]）を5進数のキーに変換"""
+    key = 0
+    for i in range(offset + size - 1, offset - 1, -1):
+        key = key * 5 + counts[i]
+    return key
+
+
+def build_suit_table() -> array:
+    """数牌1色の全枚数ベクトル（合計14枚以下）の分解候補テーブルを作成"""
+    table = array('H', [MISSING_ENTRY]) * SUIT_TABLE_SIZE
+    for counts in _iter_suit_vectors(9, MAX_SUIT_TILES):
+        rest = list(counts)
+        isolated = _extract_isolated_suit(rest)
+        options = tuple(
+            (u + 2 * isolated, m + isolated, p) for u, m, p in _decompose_suit(tuple(rest))
+        )
+        if len(options) > 2:
+            raise RuntimeError(f"Unexpected number of decomposition options for {counts}: {options}")
+        table[suit_key(counts)] = _encode_options(options)
+    _decompose_memo.clear()
+    return table
+
+
+def build_honor_table() -> array:
+    """字牌の全枚数ベクトルの分解結果テーブルを作成"""
+    table = array('B', bytes(HONOR_TABLE_SIZE))
+    for counts in _iter_suit_vectors(7, 28):
+        table[suit_key(counts, 0, 7)] = _encode_option(honor_option(tuple(counts)))
+    return table
+
+
+def write_table_file(path: Path = DEFAULT_TABLE_PATH) -> Path:
+    """
+    テーブルを作成してファイルに書き出す（ビルド時に1回だけ実行）
+
+    Returns:
+        書き出したファイルのパス
+    """
+    path = Path(path)
+    suit_table = build_suit_table()
+    honor_table = build_honor_table()
+    if sys.byteorder != "little":
+        suit_table.byteswap()
+    payload = suit_table.tobytes() + honor_table.tobytes()
+
+    header = TABLE_HEADER.pack(
+        TABLE_MAGIC,
+        TABLE_FORMAT_VERSION,
+        TABLE_VERSION,
+        len(suit_table),
+        len(honor_table),
+        zlib.crc32(payload)
+    )
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(header.ljust(TABLE_HEADER_SIZE, b"\0"))
+        f.write(payload)
+    # 読み込み中のワーカーがいても壊れないように置き換える
+    os.replace(tmp_path, path)
+    return path
+
+
+def open_table_file(path: Path = DEFAULT_TABLE_PATH) -> Optional[Tuple[memoryview, memoryview]]:
+    """
+    テーブルファイルを mmap で開く（コピーせずに参照する）
+
+    Returns:
+        (数牌テーブル, 字牌テーブル)。ファイルがない・古い・壊れている場合は None
+    """
+    path = Path(path)
+    if sys.byteorder != "little" or not path.exists():
+        return None
+
+    with open(path, "rb") as f:
+        try:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # 空ファイル
+            return None
+
+    if len(mapped) < TABLE_HEADER_SIZE:
+        return None
+
+    magic, format_version, version, suit_size, honor_size, checksum = TABLE_HEADER.unpack_from(mapped)
+    if (magic != TABLE_MAGIC or format_version != TABLE_FORMAT_VERSION or version != TABLE_VERSION
+            or suit_size != SUIT_TABLE_SIZE or honor_size != HONOR_TABLE_SIZE):
+        logger.warning(f"Shanten table file {path} is stale (version={version})")
+        return None
+
+    view = memoryview(mapped)
+    suit_end = TABLE_HEADER_SIZE + suit_size * 2
+    payload = view[TABLE_HEADER_SIZE:suit_end + honor_size]
+    if len(payload) != suit_size * 2 + honor_size or zlib.crc32(payload) != checksum:
+        logger.warning(f"Shanten table file {path} is corrupted")
+        return None
+
+    return view[TABLE_HEADER_SIZE:suit_end].cast("H"), view[suit_end:suit_end + honor_size]
+
+
+_tables = None
+_tables_source = None
+
+
+def get_tables():
+    """
+    テーブルを取得
+    事前計算済みファイルを mmap で開き、使えない場合はメモリ上で作成する
+    """
+    global _tables, _tables_source
+    if _tables is None:
+        tables = open_table_file()
+        if tables is not None:
+            _tables_source = str(DEFAULT_TABLE_PATH)
+        else:
+            logger.warning(f"Shanten table file {DEFAULT_TABLE_PATH} is not usable, building tables in memory")
+            tables = (build_suit_table(), build_honor_table())
+            _tables_source = "memory"
+        _tables = tables
+    return _tables
+
+
+def get_table_info() -> Dict:
+    """テーブルの読み込み元などの情報"""
+    return {
+        'loaded': _tables is not None,
+        'source': _tables_source,
+        'version': TABLE_VERSION
+    }
+
+
+@lru_cache(maxsize=None)
+def _decode_entry(entry: int) -> Tuple[Option, ...]:
+    """数牌テーブルのエントリを分解候補に戻す"""
+    return (_decode_option(entry & 0xFF), _decode_option(entry >> 8))
+
+
+def _lookup_suit(table, counts, offset: int) -> Tuple[Option, ...]:
+    segment = counts[offset:offset + 9]
+    if max(segment) <= 4 and sum(segment) <= MAX_SUIT_TILES:
+        entry = table[suit_key(counts, offset)]
+        if entry != MISSING_ENTRY:
+            return _decode_entry(entry)
+    return suit_options(tuple(segment))
+
+
+def _lookup_honor(table, counts) -> Option:
+    segment = counts[27:34]
+    if max(segment) <= 4:
+        return _decode_option(table[suit_key(counts, 27, 7)])
+    return honor_option(tuple(segment))
+
+
+def combine_shanten(manzu, pinzu, souzu, honor: Option, meld_count: int = 0) -> int:
+    """各色の分解候補を組み合わせて最小の向聴数を求める"""
+    best = 8
+    hu, hm, hp = honor
+    for mu, mm, mp in manzu:
+        for pu, pm, pp in pinzu:
+            for su, sm, sp in souzu:
+                u = mu + pu + su + hu + 2 * meld_count
+                m = mm + pm + sm + hm + meld_count
+                p = mp | pp | sp | hp
+                shanten = max(8 - u, 4 - m - p)
+                if shanten < best:
+                    best = shanten
+    return best
+
+
+def calculate_shanten_table(counts: List[int], meld_count: int = 0) -> int:
+    """
+    向聴数を計算（テーブル参照版）
+
+    Args:
+        counts: 34種類の牌の枚数配列
+        meld_count: 副露数
+
+    Returns:
+        向聴数（min_shanten と同じ値。七対子・国士無双を含む）
+    """
+    special = special_shanten(counts, meld_count)
+    suit_table, honor_table = get_tables()
+    return min(special, combine_shanten(
+        _lookup_suit(suit_table, counts, 0),
+        _lookup_suit(suit_table, counts, 9),
+        _lookup_suit(suit_table, counts, 18),
+        _lookup_honor(honor_table, counts),
+        meld_count
+    ))
+
+
+# 牌インデックスごとの色（0: 萬子, 1: 筒子, 2: 索子, 3: 字牌）と5進数キーでの重み
+_TILE_GROUP = [i // 9 if i < 27 else 3 for i in range(34)]
+_TILE_WEIGHT = [5 ** (i % 9) if i < 27 else 5 ** (i - 27) for i in range(34)]
+_GROUP_OFFSET = (0, 9, 18, 27)
+
+
+class IncrementalShanten:
+    """
+    色ごとの分解候補を保持して向聴数を差分計算する
+
+    1枚の増減では変化した色のテーブルだけを引き直し、他の色の結果は使い回す。
+    打牌候補 × ツモ牌のループでは全34種の再計算が不要になる。
+    七対子・国士無双の向聴数も種類数・対子数の差分で更新し、一般手との最小値を返す。
+    """
+
+    __slots__ = ('counts', 'meld_count', 'lookups', '_keys', '_options', '_memo', '_tables', '_special')
+
+    def __init__(self, counts: List[int], meld_count: int = 0):
+        self.counts = list(counts)
+        self.meld_count = meld_count
+        self.lookups = 0  # テーブル参照回数（差分計算の効果確認用）
+        self._tables = get_tables()
+        self._memo: Dict[Tuple[int, int], Tuple[Option, ...]] = {}
+        self._keys = [
+            suit_key(self.counts, 0),
+            suit_key(self.counts, 9),
+            suit_key(self.counts, 18),
+            suit_key(self.counts, 27, 7)
+        ]
+        self._options = [self._group_options(g, self._keys[g]) for g in range(4)]
+        self._special = SpecialShanten(self.counts, meld_count)
+
+    def _group_options(self, group: int, key: int) -> Tuple[Option, ...]:
+        offset = _GROUP_OFFSET[group]
+        segment = self.counts[offset:offset + (7 if group == 3 else 9)]
+        if max(segment) > 4:
+            # 5枚以上の牌がある場合はキーが使えないので直接計算
+            self.lookups += 1
+            return (honor_option(tuple(segment)),) if group == 3 else suit_options(tuple(segment))
+
+        memo_key = (group, key)
+        cached = self._memo.get(memo_key)
+        if cached is not None:
+            return cached
+
+        self.lookups += 1
+        suit_table, honor_table = self._tables
+        if group == 3:
+            options = (_decode_option(honor_table[key]),)
+        elif sum(segment) <= MAX_SUIT_TILES and suit_table[key] != MISSING_ENTRY:
+            options = _decode_entry(suit_table[key])
+        else:
+            options = suit_options(tuple(segment))
+
+        self._memo[memo_key] = options
+        return options
+
+    def _change(self, index: int, delta: int):
+        group = _TILE_GROUP[index]
+        old = self.counts[index]
+        self.counts[index] = old + delta
+        self._keys[group] += delta * _TILE_WEIGHT[index]
+        self._options[group] = self._group_options(group, self._keys[group])
+        self._special.changed(index, old)
+
+    def add(self, index: int):
+        """牌を1枚加える"""
+        self._change(index, 1)
+
+    def remove(self, index: int):
+        """牌を1枚取り除く"""
+        self._change(index, -1)
+
+    def shanten(self) -> int:
+        """現在の手牌の向聴数"""
+        o = self._options
+        return min(self._special.shanten(), combine_shanten(o[0], o[1], o[2], o[3][0], self.meld_count))
+
+    def shanten_after_draw(self, index: int) -> int:
+        """牌を1枚加えた場合の向聴数（手牌自体は変更しない）"""
+        self._change(index, 1)
+        shanten = self.shanten()
+        self._change(index, -1)
+        return shanten
+
+    def effective_tile_types(self, shanten: int) -> List[Dict]:
+        """1枚加えると向聴数が下がる牌の一覧（どの形でも向聴数が下がらない牌は試さない）"""
+        effective_tile_types = []
+        counts = self.counts
+        for i in draw_tiles(counts, shanten, self.meld_count):
+            if counts[i] < 4 and self.shanten_after_draw(i) < shanten:
+                effective_tile_types.append({
+                    'tile': TILE_NAMES[i],
+                    'count': 4 - counts[i]
+                })
+        return effective_tile_types
+
+
+def get_tile_priority(tile: str) -> int:
+    """
+    牌の優先度を計算（同じ評価の場合の判断用）
+    discard_calculator.js の getTilePriority と同じ
+    """
+    num = int(tile[0])
+    suit = tile[1]
+
+    if suit == 'z':
+        return 1000 + num
+    elif num == 1 or num == 9:
+        return 500 + num
+    elif num == 2 or num == 8:
+        return 250 + num
+    elif num == 3 or num == 7:
+        return 100 + num
+    return num
+
+
+def get_recommended_discard_table(hand_str: str) -> str:
+    """
+    推奨打牌を計算（テーブル参照版）
+    候補の評価順・同点時の優先順位は discard_calculator.js と同じ
+
+    Args:
+        hand_str: 手牌文字列（例: "112233456m568p112s"）
+
+    Returns:
+        推奨打牌の文字列（例: "6m"）
+    """
+    hand = Hand.parse(hand_str)
+
+    if len(hand) != 14:
+        raise ValueError(f"手牌は14枚である必要があります。現在: {len(hand)}枚")
+
+    # 出現順を保ったまま枚数の多い順に並べる
+    counts = hand.counts
+    unique_indices = sorted(hand.unique_indices(), key=lambda i: -counts[i])
+
+    best_discard = None
+    best_key = None
+    evaluator = IncrementalShanten(counts)
+
+    for candidate_idx in unique_indices:
+        candidate = TILE_NAMES[candidate_idx]
+        evaluator.remove(candidate_idx)
+        shanten = evaluator.shanten()
+
+        # 現在の最良より悪い場合は有効牌計算をスキップ
+        if best_key is not None and -shanten < best_key[0]:
+            evaluator.add(candidate_idx)
+            continue
+
+        effective_tiles = sum(t['count'] for t in evaluator.effective_tile_types(shanten))
+        evaluator.add(candidate_idx)
+        key = (-shanten, effective_tiles, get_tile_priority(candidate))
+
+        if best_key is None or key > best_key:
+            best_key = key
+            best_discard = candidate
+
+    return best_discard if best_discard else TILE_NAMES[hand.order[0]]
+
+
+def analyze_discard_candidates_table(hand_str: str) -> List[Dict]:
+    """
+    全ての打牌候補を分析して詳細情報を返す（テーブル参照版）
+    並び順は discard_calculator.js と同じ（向聴数昇順・有効牌降順・優先度降順）
+    """
+    hand = Hand.parse(hand_str)
+
+    if len(hand) != 14:
+        raise ValueError(f"手牌は14枚である必要があります。現在: {len(hand)}枚")
+
+    evaluator = IncrementalShanten(hand.counts)
+    candidates = []
+
+    for candidate_idx in hand.unique_indices():
+        evaluator.remove(candidate_idx)
+        shanten = evaluator.shanten()
+        effective_tile_types = evaluator.effective_tile_types(shanten)
+        evaluator.add(candidate_idx)
+
+        candidates.append({
+            'discard': TILE_NAMES[candidate_idx],
+            'shanten': shanten,
+            'effective_tiles': sum(t['count'] for t in effective_tile_types),
+            'effective_tile_types': effective_tile_types
+        })
+
+    candidates.sort(key=lambda x: (x['shanten'], -x['effective_tiles'], -get_tile_priority(x['discard'])))
+
+    return candidates
+
+
+def get_shanten_and_effective_tiles_table(hand_str: str) -> Dict:
+    """
+    シャンテン数とあがり牌を取得（テーブル参照版）
+    get_shanten_and_effective_tiles_hybrid と同じ形式を返す
+    """
+    hand = Hand.parse(hand_str)
+    if len(hand) != 13:
+        raise ValueError(f"手牌は13枚である必要があります。現在: {len(hand)}枚")
+
+    evaluator = IncrementalShanten(hand.counts)
+    shanten = evaluator.shanten()
+
+    effective_tiles = evaluator.effective_tile_types(shanten) if shanten == 0 else []
+
+    return {
+        'shanten': shanten,
+        'isTenpai': shanten == 0,
+        'agarihai': [tile['tile'] for tile in effective_tiles],
+        'effective_tiles': effective_tiles
+    }
+
+
+def random_hand_counts(rng: random.Random, size: int) -> List[int]:
+    """山（136枚）からランダムに size 枚引いた手牌の枚数配列"""
+    counts = [0] * 34
+    for tile in rng.sample(range(136), size):
+        counts[tile // 4] += 1
+    return counts
+
+
+# テスト用の関数
+def test_table_accuracy(samples: int = 2000, seed: int = 0):
+    """テーブル参照版と min_shanten の一致テスト"""
+    from .discard_simulator import min_shanten_cached
+
+    import time
+
+    print("=== テーブル参照版 精度テスト ===")
+
+    start_time = time.time()
+    get_tables()
+    print(f"テーブル作成: {time.time() - start_time:.2f}秒")
+
+    rng = random.Random(seed)
+    mismatches = []
+    for n in range(samples):
+        counts = random_hand_counts(rng, 13 if n % 2 == 0 else 14)
+        expected, _ = min_shanten_cached(tuple(counts), 0)
+        actual = calculate_shanten_table(counts)
+        if expected != actual:
+            mismatches.append((counts, expected, actual))
+
+    print(f"{samples}手中 不一致: {len(mismatches)}件")
+    for counts, expected, actual in mismatches[:10]:
+        print(f"  {counts}: min_shanten={expected}, table={actual}")
+
+    return not mismatches
+
+
+if __name__ == "__main__":
+    # python -m main.utils.shanten_table build [出力先]  … テーブルファイルを作成
+    # python -m main.utils.shanten_table              … 精度テスト
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        output = write_table_file(Path(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_TABLE_PATH)
+        print(f"テーブルファイルを作成しました: {output} ({output.stat().st_size} bytes)")
+    else:
+        test_table_accuracy()
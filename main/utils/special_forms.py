@@ -0,0 +1,111 @@
+"""
+七対子・国士無双の向聴数
+どちらも牌の種類数・対子数だけで決まるため、分解探索なしに O(34) の式で求まる
+一般手（4面子1雀頭）の向聴数と合わせて最小値を取る
+
+副露している手・13枚未満の手には適用しない（NOT_APPLICABLE を返す）
+"""
+
+from typing import List, Sequence
+
+from .suit_bits import draw_candidate_tiles
+
+# 么九牌（一九字牌）のインデックス
+YAOCHU_INDICES = (0, 8, 9, 17, 18, 26, 27, 28, 29, 30, 31, 32, 33)
+_IS_YAOCHU = tuple(i in YAOCHU_INDICES for i in range(34))
+
+# 特殊形が使えない手牌の向聴数（min を取っても一般手の値が残る大きさ）
+NOT_APPLICABLE = 99
+
+
+def chiitoitsu_shanten(counts: Sequence[int]) -> int:
+    """七対子の向聴数（4枚使いの対子は1組と数える）"""
+    pairs = 0
+    kinds = 0
+    for c in counts:
+        if c:
+            kinds += 1
+            if c >= 2:
+                pairs += 1
+    return 6 - pairs + max(0, 7 - kinds)
+
+
+def kokushi_shanten(counts: Sequence[int]) -> int:
+    """国士無双の向聴数"""
+    kinds = 0
+    has_pair = False
+    for i in YAOCHU_INDICES:
+        if counts[i]:
+            kinds += 1
+            if counts[i] >= 2:
+                has_pair = True
+    return 13 - kinds - (1 if has_pair else 0)
+
+
+def special_shanten(counts: Sequence[int], meld_count: int = 0) -> int:
+    """七対子・国士無双の向聴数の小さい方（使えない手牌は NOT_APPLICABLE）"""
+    if meld_count or sum(counts) < 13:
+        return NOT_APPLICABLE
+    return min(chiitoitsu_shanten(counts), kokushi_shanten(counts))
+
+
+def special_draw_tiles(counts: Sequence[int], shanten: int, meld_count: int = 0) -> List[int]:
+    """
+    持っていない牌のうち、1枚加えると特殊形の向聴数が shanten 未満になりうる牌（昇順）
+    持っている牌は一般手の候補（suit_bits.draw_candidate_tiles）に含まれるので返さない
+    """
+    if meld_count or sum(counts) < 13:
+        return []
+    tiles = set()
+    # 七対子: 種類が7未満なら新しい種類で1つ下がる
+    if chiitoitsu_shanten(counts) - 1 < shanten and sum(1 for c in counts if c) < 7:
+        tiles.update(i for i in range(34) if not counts[i])
+    # 国士無双: 持っていない么九牌で1つ下がる
+    if kokushi_shanten(counts) - 1 < shanten:
+        tiles.update(i for i in YAOCHU_INDICES if not counts[i])
+    return sorted(tiles)
+
+
+def draw_tiles(counts: Sequence[int], shanten: int, meld_count: int = 0) -> List[int]:
+    """有効牌の候補（一般手・特殊形のどちらかで向聴数が下がりうる牌、昇順）"""
+    tiles = draw_candidate_tiles(counts)
+    special = special_draw_tiles(counts, shanten, meld_count)
+    return sorted(set(tiles).union(special)) if special else tiles
+
+
+class SpecialShanten:
+    """
+    七対子・国士無双の向聴数を1枚の増減ごとに差分更新する
+    （IncrementalShanten と同じ枚数配列を参照し、枚数の変更後に changed を呼ぶ）
+    """
+
+    __slots__ = ('counts', 'enabled', 'size', 'kinds', 'pairs', 'yaochu_kinds', 'yaochu_pairs')
+
+    def __init__(self, counts: List[int], meld_count: int = 0):
+        self.counts = counts
+        self.enabled = meld_count == 0
+        self.size = sum(counts)
+        self.kinds = sum(1 for c in counts if c)
+        self.pairs = sum(1 for c in counts if c >= 2)
+        self.yaochu_kinds = sum(1 for i in YAOCHU_INDICES if counts[i])
+        self.yaochu_pairs = sum(1 for i in YAOCHU_INDICES if counts[i] >= 2)
+
+    def changed(self, index: int, old: int):
+        """counts[index] が old から変わった後に呼ぶ"""
+        new = self.counts[index]
+        self.size += new - old
+        kinds = (new > 0) - (old > 0)
+        pairs = (new >= 2) - (old >= 2)
+        self.kinds += kinds
+        self.pairs += pairs
+        if _IS_YAOCHU[index]:
+            self.yaochu_kinds += kinds
+            self.yaochu_pairs += pairs
+
+    def shanten(self) -> int:
+        """現在の手牌の特殊形の向聴数（使えない手牌は NOT_APPLICABLE）"""
+        if not self.enabled or self.size < 13:
+            return NOT_APPLICABLE
+        chiitoitsu = 6 - self.pairs + max(0, 7 - self.kinds)
+        kokushi = 13 - self.yaochu_kinds - (1 if self.yaochu_pairs else 0)
+        return min(chiitoitsu, kokushi)
@@ -0,0 +1,257 @@
+"""
+数牌1色のビット表現
+1種類3ビット・1色27ビットの整数（Hand のキーの1色分と同じ並び）で持ち、
+対子・刻子・順子・塔子の有無や孤立判定をシフトとマスクでまとめて求める
+
+マスクは「各ランクの3ビットの最下位ビット」だけを使う（ランク r なら 1 << 3r）
+"""
+
+from typing import List, Sequence, Tuple
+
+from .hand import KEY_BITS
+
+RANK_BITS = KEY_BITS
+SUIT_BITS = RANK_BITS * 9
+SUIT_MASK = (1 << SUIT_BITS) - 1
+FIELD_MASK = (1 << RANK_BITS) - 1
+# 各ランクの最下位ビット
+LOW_BITS = sum(1 << (RANK_BITS * r) for r in range(9))
+
+# ランク r の1枚分・ランク r から始まる順子1組分
+RANK_UNITS = tuple(1 << (RANK_BITS * r) for r in range(9))
+SHUNTSU_UNITS = tuple(RANK_UNITS[r] * 0b001001001 for r in range(7))
+
+
+def encode_suit(counts: Sequence[int], offset: int = 0, size: int = 9) -> int:
+    """枚数配列の1色分をビット表現に変換"""
+    bits = 0
+    for r in range(size - 1, -1, -1):
+        bits = (bits << RANK_BITS) | counts[offset + r]
+    return bits
+
+
+def decode_suit(bits: int, size: int = 9) -> List[int]:
+    """encode_suit の逆変換"""
+    return [(bits >> (RANK_BITS * r)) & FIELD_MASK for r in range(size)]
+
+
+def present(bits: int) -> int:
+    """1枚以上あるランク"""
+    return (bits | bits >> 1 | bits >> 2) & LOW_BITS
+
+
+def pairs(bits: int) -> int:
+    """2枚以上あるランク"""
+    return (bits >> 1 | bits >> 2) & LOW_BITS
+
+
+def triplets(bits: int) -> int:
+    """3枚以上あるランク"""
+    return (bits >> 2 | (bits >> 1 & bits)) & LOW_BITS
+
+
+def singles(bits: int) -> int:
+    """ちょうど1枚のランク"""
+    return bits & ~(bits >> 1 | bits >> 2) & LOW_BITS
+
+
+def shuntsu_starts(bits: int) -> int:
+    """順子（r, r+1, r+2）が取れる先頭ランク"""
+    p = present(bits)
+    return p & p >> RANK_BITS & p >> (RANK_BITS * 2)
+
+
+def ryammen_starts(bits: int) -> int:
+    """両面・辺張（r, r+1）が取れる先頭ランク"""
+    p = present(bits)
+    return p & p >> RANK_BITS
+
+
+def kanchan_starts(bits: int) -> int:
+    """嵌張（r, r+2）が取れる先頭ランク"""
+    p = present(bits)
+    return p & p >> (RANK_BITS * 2)
+
+
+def neighbors(mask: int, distance: int = 2) -> int:
+    """マスクのランクから前後 distance 以内のランク（自身を含む）"""
+    result = mask
+    for d in range(1, distance + 1):
+        result |= mask << (RANK_BITS * d) | mask >> (RANK_BITS * d)
+    return result & LOW_BITS
+
+
+def isolated_triplets(bits: int) -> int:
+    """前後2ランク以内に他の牌がない刻子"""
+    p = present(bits)
+    others = p << RANK_BITS | p << (RANK_BITS * 2) | p >> RANK_BITS | p >> (RANK_BITS * 2)
+    return triplets(bits) & ~others
+
+
+def isolated_shuntsu(bits: int) -> int:
+    """3枚とも1枚ずつで、前後2ランク以内に他の牌がない順子の先頭ランク"""
+    p = present(bits)
+    s = singles(bits)
+    others = p << RANK_BITS | p << (RANK_BITS * 2) | p >> (RANK_BITS * 3) | p >> (RANK_BITS * 4)
+    return s & s >> RANK_BITS & s >> (RANK_BITS * 2) & ~others
+
+
+def ranks(mask: int) -> List[int]:
+    """マスクのランクを昇順に列挙"""
+    result = []
+    while mask:
+        low = mask & -mask
+        result.append((low.bit_length() - 1) // RANK_BITS)
+        mask ^= low
+    return result
+
+
+def draw_candidates(bits: int) -> int:
+    """
+    1枚加えると面子・塔子・対子が増えうるランク（持っている牌から前後2ランク以内）
+    それ以外の牌は孤立した浮き牌になるだけで、一般手の向聴数は下がらない
+    """
+    return neighbors(present(bits))
+
+
+def draw_candidate_tiles(counts: Sequence[int]) -> List[int]:
+    """
+    34種の枚数配列で、1枚加えると一般手の向聴数が下がりうる牌のインデックス（昇順）
+    数牌は draw_candidates、字牌は既に持っている牌のみ
+    """
+    tiles = []
+    for offset in (0, 9, 18):
+        tiles.extend(offset + r for r in ranks(draw_candidates(encode_suit(counts, offset))))
+    tiles.extend(i for i in range(27, 34) if counts[i])
+    return tiles
+
+
+def extract_isolated(bits: int) -> Tuple[int, List[Tuple[str, int]]]:
+    """
+    find_isolated_kotsu_shuntsu と同じ規則（ランクの小さい順に、刻子→順子の順で判定）で
+    孤立した刻子・順子を取り除く
+
+    Returns:
+        (取り除いた後のビット表現, [('kotsu' または 'shuntsu', ランク), ...])
+    """
+    blocks = []
+    floor = 0  # 判定済みのランクより上だけを見るためのマスク
+    while True:
+        kotsu = isolated_triplets(bits) & ~floor
+        shuntsu = isolated_shuntsu(bits) & ~floor
+        candidates = kotsu | shuntsu
+        if not candidates:
+            return bits, blocks
+        low = candidates & -candidates
+        rank = (low.bit_length() - 1) // RANK_BITS
+        if kotsu & low:
+            bits -= 3 * low
+            blocks.append(('kotsu', rank))
+            # 同じランクで順子も取れるかは刻子を抜いた後で判定する
+            if isolated_shuntsu(bits) & low:
+                bits -= SHUNTSU_UNITS[rank]
+                blocks.append(('shuntsu', rank))
+        else:
+            bits -= SHUNTSU_UNITS[rank]
+            blocks.append(('shuntsu', rank))
+        floor |= (low << 1) - 1
+
+
+# テスト用の関数
+def test_suit_bits(seed: int = 0):
+    """リスト版の孤立面子抽出・分岐判定との一致と、1色あたりの評価時間を比較するテスト"""
+    import random
+    import time
+    from .shanten_table import _iter_suit_vectors, calculate_shanten_table, random_hand_counts
+    from .special_forms import draw_tiles
+
+    def list_extract(counts: List[int]) -> int:
+        # 置き換え前のリスト版（find_isolated_kotsu_shuntsu の1色分）
+        blocks = 0
+        for i in range(9):
+            if counts[i] >= 3:
+                if all(counts[j] == 0 for j in range(max(0, i - 2), min(9, i + 3)) if j != i):
+                    counts[i] -= 3
+                    blocks += 1
+            if i <= 6 and counts[i] == 1 and counts[i + 1] == 1 and counts[i + 2] == 1:
+                if all(counts[j] == 0 for j in range(max(0, i - 2), min(9, i + 5)) if j < i or j > i + 2):
+                    counts[i] -= 1
+                    counts[i + 1] -= 1
+                    counts[i + 2] -= 1
+                    blocks += 1
+        return blocks
+
+    vectors = [tuple(v) for v in _iter_suit_vectors(9, 14)]
+
+    mismatches = 0
+    for vector in vectors:
+        bits = encode_suit(vector)
+        rest = list(vector)
+        blocks = list_extract(rest)
+        bits_rest, bits_blocks = extract_isolated(bits)
+        mismatches += decode_suit(bits_rest) != rest or len(bits_blocks) != blocks
+        mismatches += decode_suit(bits) != list(vector)
+        for r in range(9):
+            field = RANK_UNITS[r]
+            mismatches += bool(pairs(bits) & field) != (vector[r] >= 2)
+            mismatches += bool(triplets(bits) & field) != (vector[r] >= 3)
+            mismatches += bool(shuntsu_starts(bits) & field) != (
+                r <= 6 and vector[r] > 0 and vector[r + 1] > 0 and vector[r + 2] > 0
+            )
+            mismatches += bool(ryammen_starts(bits) & field) != (r <= 7 and vector[r] > 0 and vector[r + 1] > 0)
+            mismatches += bool(kanchan_starts(bits) & field) != (r <= 6 and vector[r] > 0 and vector[r + 2] > 0)
+
+    def list_evaluate(counts):
+        rest = list(counts)
+        list_extract(rest)
+        found = 0
+        for i in range(9):
+            if rest[i] == 0:
+                continue
+            found += rest[i] >= 2
+            found += i <= 6 and rest[i + 1] > 0 and rest[i + 2] > 0
+            found += i <= 7 and rest[i + 1] > 0
+            found += i <= 6 and rest[i + 2] > 0
+        return found
+
+    def bits_evaluate(bits):
+        rest, _ = extract_isolated(bits)
+        return (
+            pairs(rest).bit_count() + shuntsu_starts(rest).bit_count()
+            + ryammen_starts(rest).bit_count() + kanchan_starts(rest).bit_count()
+        )
+
+    # 候補外の牌を1枚加えても向聴数が下がらないこと（七対子・国士無双の候補を合わせて確認）
+    rng = random.Random(seed)
+    for _ in range(500):
+        counts = random_hand_counts(rng, 13)
+        shanten = calculate_shanten_table(counts)
+        candidates = set(draw_tiles(counts, shanten))
+        for i in range(34):
+            if i not in candidates:
+                counts[i] += 1
+                mismatches += calculate_shanten_table(counts) < shanten
+                counts[i] -= 1
+
+    samples = rng.sample(vectors, min(20000, len(vectors)))
+    encoded = [encode_suit(v) for v in samples]
+    mismatches += sum(list_evaluate(v) != bits_evaluate(b) for v, b in zip(samples, encoded))
+
+    start_time = time.time()
+    for vector in samples:
+        list_evaluate(vector)
+    list_time = time.time() - start_time
+
+    start_time = time.time()
+    for bits in encoded:
+        bits_evaluate(bits)
+    bits_time = time.time() - start_time
+
+    print("=== 1色のビット表現テスト ===")
+    print(f"{len(vectors)}通り: 不一致 {mismatches}件")
+    print(f"1色の評価（{len(samples)}件）: リスト {list_time:.4f}秒, ビット {bits_time:.4f}秒")
+    return mismatches == 0
+
+
+if __name__ == "__main__":
+    test_suit_bits()
@@ -0,0 +1,262 @@
+"""
+色ごとの待ち牌インデックス
+数牌1色（5^9通り）・字牌（5^7通り）の全枚数ベクトルについて
+「その色だけで完成しているか」と「1枚加えるとその色が完成するランク」を事前計算し、
+13枚の手牌のあがり牌を各色のエントリの組み合わせだけで求める（リクエスト時の探索なし）
+
+1色が「完成している」とは、面子だけ（枚数が3の倍数）または面子と雀頭1つ（3で割って2余る）に
+分解できること。手牌全体で和了するのは、ツモった色が完成し、他の色もすべて完成していて、
+雀頭を持つ色がちょうど1つの場合
+"""
+
+from array import array
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from .hand import Hand, TILE_NAMES
+from .shanten_table import HONOR_TABLE_SIZE, SUIT_TABLE_SIZE, calculate_shanten_table, suit_key
+from .special_forms import YAOCHU_INDICES, chiitoitsu_shanten, kokushi_shanten
+
+# エントリの下位9ビットは待ちのランク、COMPLETE はその色だけで完成していることを表す
+WAIT_MASK = 0x1FF
+COMPLETE = 1 << 9
+
+_GROUP_OFFSET = (0, 9, 18, 27)
+_GROUP_SIZE = (9, 9, 9, 7)
+
+
+def _meld_shapes(size: int, shuntsu: bool) -> List[Tuple[int, ...]]:
+    """1色の面子（刻子・順子）を枚数ベクトルの差分として列挙"""
+    shapes = []
+    for r in range(size):
+        shape = [0] * size
+        shape[r] = 3
+        shapes.append(tuple(shape))
+    if shuntsu:
+        for r in range(size - 2):
+            shape = [0] * size
+            shape[r] = shape[r + 1] = shape[r + 2] = 1
+            shapes.append(tuple(shape))
+    return shapes
+
+
+def _iter_complete_vectors(size: int, shuntsu: bool) -> Iterator[List[int]]:
+    """面子0〜4組と雀頭0〜1つで作れる枚数ベクトル（各牌4枚以下）を重複ありで列挙"""
+    shapes = _meld_shapes(size, shuntsu)
+    counts = [0] * size
+
+    def with_pair():
+        yield counts
+        for r in range(size):
+            if counts[r] <= 2:
+                counts[r] += 2
+                yield counts
+                counts[r] -= 2
+
+    def rec(start: int, remaining: int):
+        yield from with_pair()
+        if not remaining:
+            return
+        for i in range(start, len(shapes)):
+            shape = shapes[i]
+            if all(c + d <= 4 for c, d in zip(counts, shape)):
+                for r, d in enumerate(shape):
+                    counts[r] += d
+                yield from rec(i, remaining - 1)
+                for r, d in enumerate(shape):
+                    counts[r] -= d
+
+    return rec(0, 4)
+
+
+def build_wait_table(size: int = 9) -> array:
+    """
+    1色の全枚数ベクトルの待ちテーブルを作成（size=9 は数牌、size=7 は字牌）
+    完成形の枚数ベクトルから1枚ずつ抜いた形に、抜いたランクを待ちとして書き込む
+    """
+    table = array('H', bytes(2 * (SUIT_TABLE_SIZE if size == 9 else HONOR_TABLE_SIZE)))
+    weights = [5 ** r for r in range(size)]
+    seen = set()
+    for counts in _iter_complete_vectors(size, shuntsu=size == 9):
+        key = suit_key(counts, 0, size)
+        if key in seen:
+            continue
+        seen.add(key)
+        table[key] |= COMPLETE
+        for r in range(size):
+            if counts[r]:
+                table[key - weights[r]] |= 1 << r
+    return table
+
+
+_wait_tables = None
+
+
+def get_wait_tables() -> Tuple[array, array]:
+    """待ちテーブル（数牌用, 字牌用）を取得（初回にメモリ上で作成する）"""
+    global _wait_tables
+    if _wait_tables is None:
+        _wait_tables = (build_wait_table(9), build_wait_table(7))
+    return _wait_tables
+
+
+def _special_winning_tiles(counts: Sequence[int]) -> List[int]:
+    """七対子・国士無双のあがり牌（13枚の門前の手牌）"""
+    tiles = []
+    if chiitoitsu_shanten(counts) == 0:
+        # 6対子 + 単騎
+        tiles.extend(i for i in range(34) if counts[i] == 1)
+    if kokushi_shanten(counts) == 0:
+        missing = [i for i in YAOCHU_INDICES if not counts[i]]
+        # 么九牌が13種そろっていれば13面待ち
+        tiles.extend(missing if missing else YAOCHU_INDICES)
+    return tiles
+
+
+def winning_tiles(counts: Sequence[int]) -> List[int]:
+    """
+    13枚の門前の手牌（各牌4枚以下）のあがり牌のインデックス（昇順、手牌で4枚使っている牌は除く）
+    """
+    suit_table, honor_table = get_wait_tables()
+    entries = []
+    sizes = []
+    for group in range(4):
+        offset = _GROUP_OFFSET[group]
+        table = honor_table if group == 3 else suit_table
+        entries.append(table[suit_key(counts, offset, _GROUP_SIZE[group])])
+        sizes.append(sum(counts[offset:offset + _GROUP_SIZE[group]]))
+
+    incomplete = [g for g in range(4) if not entries[g] & COMPLETE]
+    pair_groups = sum(1 for g in range(4) if entries[g] & COMPLETE and sizes[g] % 3 == 2)
+
+    tiles = set()
+    for group in range(4):
+        waits = entries[group] & WAIT_MASK
+        if not waits or any(g != group for g in incomplete):
+            continue
+        # ツモった色以外で雀頭を持つ色の数 + ツモった後のこの色の雀頭
+        others = pair_groups - (1 if entries[group] & COMPLETE and sizes[group] % 3 == 2 else 0)
+        if others + ((sizes[group] + 1) % 3 == 2) != 1:
+            continue
+        offset = _GROUP_OFFSET[group]
+        tiles.update(offset + r for r in range(_GROUP_SIZE[group]) if waits >> r & 1)
+
+    tiles.update(_special_winning_tiles(counts))
+    return sorted(i for i in tiles if counts[i] < 4)
+
+
+def get_shanten_and_effective_tiles_index(hand_str: str) -> Dict:
+    """
+    シャンテン数とあがり牌を取得（待ち牌インデックス版）
+    get_shanten_and_effective_tiles_table と同じ形式を返す
+    あがり牌がなければ向聴数はテーブル参照で求める（4枚使いの牌しか待てない形も向聴数0になる）
+    """
+    hand = Hand.parse(hand_str)
+    if len(hand) != 13:
+        raise ValueError(f"手牌は13枚である必要があります。現在: {len(hand)}枚")
+
+    counts = hand.counts
+    tiles = winning_tiles(counts)
+    shanten = 0 if tiles else calculate_shanten_table(list(counts))
+
+    effective_tiles = [{'tile': TILE_NAMES[i], 'count': 4 - counts[i]} for i in tiles]
+
+    return {
+        'shanten': shanten,
+        'isTenpai': shanten == 0,
+        'agarihai': [tile['tile'] for tile in effective_tiles],
+        'effective_tiles': effective_tiles
+    }
+
+
+# テスト用の関数
+def test_wait_index(samples: int = 20000, seed: int = 0):
+    """
+    テーブル参照版（get_shanten_and_effective_tiles_table）との一致テスト
+    1色13枚・1色11枚 + 字牌の対子・1色10枚 + 字牌の刻子の全枚数ベクトルと、
+    和了形から1枚抜いたランダムな多色の手牌・七対子・国士無双の聴牌形を比較する
+    """
+    import random
+    import time
+    from .hand import pack_counts
+    from .shanten_table import _iter_suit_vectors, get_shanten_and_effective_tiles_table
+
+    def to_hand(counts: Sequence[int]) -> str:
+        return "".join(TILE_NAMES[i] * c for i, c in enumerate(counts))
+
+    hands = []
+    for suit_size, honor in ((13, None), (11, 2), (10, 3)):
+        for vector in _iter_suit_vectors(9, suit_size):
+            if sum(vector) != suit_size:
+                continue
+            for offset in (0, 18) if honor is None else (9,):
+                counts = [0] * 34
+                counts[offset:offset + 9] = vector
+                if honor is not None:
+                    counts[27] = honor
+                hands.append(counts)
+
+    rng = random.Random(seed)
+    for _ in range(samples):
+        # 和了形（4面子1雀頭）を作って1枚抜く
+        counts = [0] * 34
+        while sum(counts) < 14:
+            if sum(counts) == 12:
+                counts[rng.randrange(34)] += 2
+            elif rng.random() < 0.4:
+                counts[rng.randrange(34)] += 3
+            else:
+                index = rng.randrange(3) * 9 + rng.randrange(7)
+                for i in range(index, index + 3):
+                    counts[i] += 1
+            if max(counts) > 4:
+                counts = [0] * 34
+        counts[rng.choice([i for i in range(34) if counts[i]])] -= 1
+        hands.append(counts)
+    for _ in range(samples // 10):
+        # 七対子・国士無双の聴牌形
+        counts = [0] * 34
+        for i in rng.sample(range(34), 7):
+            counts[i] = 2
+        counts[rng.choice([i for i in range(34) if counts[i]])] -= 1
+        hands.append(counts)
+        counts = [0] * 34
+        for i in YAOCHU_INDICES:
+            counts[i] = 1
+        counts[rng.choice(YAOCHU_INDICES)] += 1
+        counts[rng.choice(YAOCHU_INDICES)] -= 1
+        hands.append(counts)
+
+    unique = {}
+    for counts in hands:
+        unique.setdefault(pack_counts(counts), counts)
+    hands = list(unique.values())
+
+    start_time = time.time()
+    get_wait_tables()
+    print("=== 待ち牌インデックス テスト ===")
+    print(f"インデックス作成: {time.time() - start_time:.2f}秒")
+
+    mismatches = []
+    tenpai = 0
+    index_time = table_time = 0.0
+    for counts in hands:
+        hand_str = to_hand(counts)
+        start_time = time.perf_counter()
+        actual = get_shanten_and_effective_tiles_index(hand_str)
+        index_time += time.perf_counter() - start_time
+        start_time = time.perf_counter()
+        expected = get_shanten_and_effective_tiles_table(hand_str)
+        table_time += time.perf_counter() - start_time
+        tenpai += expected['isTenpai']
+        if actual != expected:
+            mismatches.append((hand_str, expected['agarihai'], actual['agarihai']))
+
+    print(f"{len(hands)}手（聴牌 {tenpai}手）: 不一致 {len(mismatches)}件")
+    for hand_str, expected, actual in mismatches[:10]:
+        print(f"  {hand_str}: table={expected}, index={actual}")
+    print(f"1手あたり: インデックス {index_time / len(hands) * 1e6:.1f}µs, テーブル {table_time / len(hands) * 1e6:.1f}µs")
+    return not mismatches
+
+
+if __name__ == "__main__":
+    test_wait_index()
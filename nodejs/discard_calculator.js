@@ -200,24 +200,178 @@ function calculateShanten(blocks, meldCount = 0) {
     return 8 - mentsu * 2 - tatsu - (hasToitsu ? 1 : 0);
 }
 
-// 最小向聴数を取得（元のPythonロジックと同じ）
-function minShanten(counts, meldCount = 0) {
-    const allResults = extractMentsuTatsu(counts);
+// 分解探索の選択肢（extractMentsuTatsu と同じ順に試す）
+const TOITSU = 0, KOTSU = 1, SHUNTSU = 2, RYAMMEN = 3, KANCHAN = 4, SINGLE = 5;
+const OPTION_BLOCK_TYPES = ['toitsu', 'kotsu', 'shuntsu', 'ryammen', 'kanchan', null];
+
+// calculateShanten と同じ式（ブロック数から計算）
+function shantenValue(mentsu, tatsu, hasToitsu) {
+    if (mentsu + tatsu > 4) {
+        return 4 - mentsu - (hasToitsu ? 1 : 0);
+    }
+    return 8 - mentsu * 2 - tatsu;
+}
+
+// 残り牌がすべて面子・塔子になり、対子もあると仮定した場合の向聴数（到達できる向聴数の下限）
+function optimisticShanten(mentsu, tatsu, remaining) {
+    let best = 8;
+    for (let extra = 0; extra * 3 <= remaining; extra++) {
+        best = Math.min(best, shantenValue(mentsu + extra, tatsu + Math.floor((remaining - extra * 3) / 2), true));
+    }
+    return best;
+}
 
-    let minShantenValue = Infinity;
+// 分解を列挙せずに最小向聴数を探索（分枝限定法・Python版 _search_min_shanten と同じ）
+// collect=true なら最小向聴数となる分解結果も集める
+// limit 未満の向聴数だけを探す（下限が届かなければ探索せず、見つからなければ [limit, []] を返す）
+function searchMinShanten(counts, meldCount = 0, collect = false, limit = 9) {
+    const [isolatedBlocks, rest] = findIsolatedKotsuShuntsu(counts);
+
+    let mentsu = meldCount + isolatedBlocks.length;
+    let tatsu = 0;
+    let toitsu = 0;
+    let remaining = rest.reduce((a, b) => a + b, 0);
+    let best = 9;
     let bestResults = [];
+    // これ以上良くならない値（到達したら探索を終える）
+    const floor = optimisticShanten(mentsu, tatsu, remaining);
+    if (floor >= limit) return [limit, []];
+
+    let first = 0;
+    while (first < 34 && rest[first] === 0) first++;
+    const stack = [[first, TOITSU]];  // 深さごとの [先頭の牌, 次に試す選択肢]
+    const path = [];                  // 深さごとに選んだ [牌, 選択肢]
+
+    while (stack.length > 0) {
+        const frame = stack[stack.length - 1];
+        let i = frame[0];
+        let option;
+
+        if (i < 0) {
+            // 打ち切った分岐（選んだ選択肢を戻すだけ）
+            option = -1;
+        } else if (i === 34) {
+            // 全ての牌を割り当てた
+            const value = shantenValue(mentsu, tatsu, toitsu > 0);
+            if (value < best) {
+                best = value;
+                bestResults = [];
+            }
+            if (collect && value === best) {
+                const blocks = [...isolatedBlocks];
+                for (const [index, chosen] of path) {
+                    if (chosen !== SINGLE) blocks.push(new Block(OPTION_BLOCK_TYPES[chosen], index));
+                }
+                bestResults.push(new DecomposeResult(new Array(34).fill(0), blocks));
+            }
+            if (best === floor && !collect) break;
+            option = -1;
+        } else {
+            option = frame[1];
+            const position = i < 27 ? i % 9 : 9;
+            for (; option <= SINGLE; option++) {
+                let ok;
+                if (option === TOITSU) ok = rest[i] >= 2;
+                else if (option === KOTSU) ok = rest[i] >= 3;
+                else if (option === SHUNTSU) ok = position <= 6 && rest[i + 1] > 0 && rest[i + 2] > 0;
+                else if (option === RYAMMEN) ok = position <= 7 && rest[i + 1] > 0;
+                else if (option === KANCHAN) ok = position <= 6 && rest[i + 2] > 0;
+                else ok = true;
+                if (ok) break;
+            }
+        }
+
+        if (option === -1 || option > SINGLE) {
+            // この深さの選択肢を試し終えたので1つ戻る
+            stack.pop();
+            if (path.length > 0) {
+                const [index, undo] = path.pop();
+                if (undo === TOITSU) {
+                    rest[index] += 2; tatsu--; toitsu--; remaining += 2;
+                } else if (undo === KOTSU) {
+                    rest[index] += 3; mentsu--; remaining += 3;
+                } else if (undo === SHUNTSU) {
+                    rest[index]++; rest[index + 1]++; rest[index + 2]++; mentsu--; remaining += 3;
+                } else if (undo === RYAMMEN) {
+                    rest[index]++; rest[index + 1]++; tatsu--; remaining += 2;
+                } else if (undo === KANCHAN) {
+                    rest[index]++; rest[index + 2]++; tatsu--; remaining += 2;
+                } else {
+                    rest[index]++; remaining++;
+                }
+            }
+            continue;
+        }
 
-    for (const result of allResults) {
-        const shanten = calculateShanten(result.blocks, meldCount);
-        if (shanten < minShantenValue) {
-            minShantenValue = shanten;
-            bestResults = [result];
-        } else if (shanten === minShantenValue) {
-            bestResults.push(result);
+        frame[1] = option + 1;
+        if (option === TOITSU) {
+            rest[i] -= 2; tatsu++; toitsu++; remaining -= 2;
+        } else if (option === KOTSU) {
+            rest[i] -= 3; mentsu++; remaining -= 3;
+        } else if (option === SHUNTSU) {
+            rest[i]--; rest[i + 1]--; rest[i + 2]--; mentsu++; remaining -= 3;
+        } else if (option === RYAMMEN) {
+            rest[i]--; rest[i + 1]--; tatsu++; remaining -= 2;
+        } else if (option === KANCHAN) {
+            rest[i]--; rest[i + 2]--; tatsu++; remaining -= 2;
+        } else {
+            rest[i]--; remaining--;
         }
+        path.push([i, option]);
+
+        const bound = optimisticShanten(mentsu, tatsu, remaining);
+        if (bound > best || (bound === best && !collect) || bound >= limit) {
+            // この分岐では最良値を更新できない（次の周で戻し、同じ深さの次の選択肢を試す）
+            stack.push([-1, SINGLE]);
+            continue;
+        }
+
+        while (i < 34 && rest[i] === 0) i++;
+        stack.push([i, TOITSU]);
+    }
+
+    if (best >= limit) return [limit, []];
+    return [best, bestResults];
+}
+
+// 么九牌（一九字牌）のインデックス
+const YAOCHU_INDICES = [0, 8, 9, 17, 18, 26, 27, 28, 29, 30, 31, 32, 33];
+// 特殊形が使えない手牌の向聴数（Python版 special_forms.NOT_APPLICABLE と同じ）
+const NOT_APPLICABLE = 99;
+
+// 七対子の向聴数（4枚使いの対子は1組と数える）
+function chiitoitsuShanten(counts) {
+    let pairs = 0;
+    let kinds = 0;
+    for (const c of counts) {
+        if (c > 0) kinds++;
+        if (c >= 2) pairs++;
+    }
+    return 6 - pairs + Math.max(0, 7 - kinds);
+}
+
+// 国士無双の向聴数
+function kokushiShanten(counts) {
+    let kinds = 0;
+    let hasPair = false;
+    for (const i of YAOCHU_INDICES) {
+        if (counts[i] > 0) kinds++;
+        if (counts[i] >= 2) hasPair = true;
     }
+    return 13 - kinds - (hasPair ? 1 : 0);
+}
+
+// 七対子・国士無双の向聴数の小さい方（副露あり・13枚未満は NOT_APPLICABLE）
+function specialShanten(counts, meldCount = 0) {
+    if (meldCount > 0 || counts.reduce((a, b) => a + b, 0) < 13) return NOT_APPLICABLE;
+    return Math.min(chiitoitsuShanten(counts), kokushiShanten(counts));
+}
 
-    return [minShantenValue, bestResults];
+// 最小向聴数を取得（withResults=true なら最小向聴数となる一般手の分解結果も返す）
+// 七対子・国士無双を先に求め、一般手はそれより良くなる場合だけ探索する
+function minShanten(counts, meldCount = 0, withResults = false) {
+    const special = specialShanten(counts, meldCount);
+    return searchMinShanten(counts, meldCount, withResults, special);
 }
 
 // 手牌文字列をパース
@@ -426,7 +580,7 @@ function analyzeDiscardCandidates(handStr) {
         const counts = [...initialCounts];
         counts[candidateIdx]--;
 
-        const [shanten, results] = minShanten(counts);
+        const [shanten] = minShanten(counts);
 
         // 有効牌の詳細計算
         let effectiveTiles = 0;
@@ -481,7 +635,7 @@ function getShantenAndEffectiveTiles(handStr) {
     }
 
     const counts = tilesToCounts(tiles);
-    const [shanten, results] = minShanten(counts);
+    const [shanten] = minShanten(counts);
 
     // シャンテン数が0の場合のみ有効牌を計算
     if (shanten === 0) {
@@ -515,8 +669,107 @@ function getShantenAndEffectiveTiles(handStr) {
     }
 }
 
+// 1リクエストを処理して結果オブジェクトを返す
+function handleRequest(inputData) {
+    const { hand, action = 'recommend' } = inputData;
+
+    if (action === 'recommend') {
+        return {
+            success: true,
+            recommend: getRecommendedDiscard(hand)
+        };
+    } else if (action === 'analyze') {
+        return {
+            success: true,
+            candidates: analyzeDiscardCandidates(hand)
+        };
+    } else if (action === 'agarihai') {
+        return {
+            success: true,
+            ...getShantenAndEffectiveTiles(hand)
+        };
+    }
+    throw new Error(`Unknown action: ${action}`);
+}
+
+// サーバーモード：標準入力から1行1JSONのリクエストを読み、標準出力に1行1JSONで応答する
+function serve() {
+    const readline = require('readline');
+    const rl = readline.createInterface({ input: process.stdin, terminal: false });
+
+    rl.on('line', (line) => {
+        if (!line.trim()) return;
+
+        let id = null;
+        let response;
+        try {
+            const inputData = JSON.parse(line);
+            id = inputData.id === undefined ? null : inputData.id;
+            response = { id, ...handleRequest(inputData) };
+        } catch (error) {
+            response = {
+                id,
+                success: false,
+                error: {
+                    message: error.message,
+                    stack: error.stack
+                }
+            };
+        }
+        process.stdout.write(JSON.stringify(response) + '\n');
+    });
+
+    // 親プロセスが標準入力を閉じたら、書き込み中の応答を出し切ってから自然に終了する
+    // （process.exit は標準出力への未完了の書き込みを打ち切ることがある）
+}
+
+// 分枝限定法と全分解の列挙の一致確認・最悪ケースの時間とヒープ使用量の比較（--bench）
+function benchmarkMinShanten() {
+    const worstCaseHands = ['11223344556677m', '2233445566778p1z', '1112345678999m1p', '1122334455667m', '13579m13579p2468s'];
+
+    function enumerateAll(counts) {
+        let best = specialShanten(counts);
+        for (const result of extractMentsuTatsu(counts)) {
+            best = Math.min(best, calculateShanten(result.blocks));
+        }
+        return best;
+    }
+
+    function measure(func, counts, repeat = 5) {
+        if (global.gc) global.gc();
+        const heapBefore = process.memoryUsage().heapUsed;
+        const start = process.hrtime.bigint();
+        let value;
+        for (let i = 0; i < repeat; i++) value = func(counts);
+        const elapsed = Number(process.hrtime.bigint() - start) / 1e6 / repeat;
+        const heap = Math.max(0, process.memoryUsage().heapUsed - heapBefore);
+        return [value, elapsed, heap];
+    }
+
+    for (const hand of worstCaseHands) {
+        const counts = tilesToCounts(parseHand(hand));
+        const [oldValue, oldTime, oldHeap] = measure(enumerateAll, counts);
+        const [newValue, newTime, newHeap] = measure(c => minShanten(c)[0], counts);
+        console.log(
+            `${hand}: ${oldValue === newValue ? 'OK' : 'NG'} ` +
+            `${oldTime.toFixed(2)}ms → ${newTime.toFixed(2)}ms, ` +
+            `heap ${(oldHeap / 1024).toFixed(0)}KB → ${(newHeap / 1024).toFixed(0)}KB`
+        );
+    }
+}
+
 // メイン処理
 function main() {
+    if (process.argv[2] === '--server') {
+        serve();
+        return;
+    }
+
+    if (process.argv[2] === '--bench') {
+        benchmarkMinShanten();
+        return;
+    }
+
     if (process.argv.length < 3) {
         console.error(JSON.stringify({
             success: false,
@@ -528,27 +781,7 @@ function main() {
     try {
         const inputJson = process.argv[2];
         const inputData = JSON.parse(inputJson);
-        const { hand, action = 'recommend' } = inputData;
-
-        let result;
-        if (action === 'recommend') {
-            result = {
-                success: true,
-                recommend: getRecommendedDiscard(hand)
-            };
-        } else if (action === 'analyze') {
-            result = {
-                success: true,
-                candidates: analyzeDiscardCandidates(hand)
-            };
-        } else if (action === 'agarihai') {
-            result = {
-                success: true,
-                ...getShantenAndEffectiveTiles(hand)
-            };
-        } else {
-            throw new Error(`Unknown action: ${action}`);
-        }
+        const result = handleRequest(inputData);
 
         console.log(JSON.stringify(result));
     } catch (error) {
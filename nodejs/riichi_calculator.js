@@ -78,27 +78,61 @@ function calculateRiichi(inputData) {
     }
 }
 
-// コマンドライン引数から入力を取得
-if (process.argv.length < 3) {
-    console.error(JSON.stringify({
-        success: false,
-        error: { message: "Input JSON required as command line argument" }
-    }));
-    process.exit(1);
-}
+// サーバーモード：標準入力から1行1JSONのリクエストを読み、標準出力に1行1JSONで応答する
+// 応答には入力のidをそのまま付与するので、呼び出し側は複数リクエストを同時に送信できる
+function serve() {
+    const readline = require('readline');
+    const rl = readline.createInterface({ input: process.stdin, terminal: false });
+
+    rl.on('line', (line) => {
+        if (!line.trim()) return;
 
-try {
-    const inputJson = process.argv[2];
-    const inputData = JSON.parse(inputJson);
-    const result = calculateRiichi(inputData);
-    console.log(JSON.stringify(result));
-} catch (error) {
-    console.error(JSON.stringify({
-        success: false,
-        error: {
-            message: "Invalid JSON input: " + error.message,
-            stack: error.stack
+        let response;
+        try {
+            const { id = null, ...inputData } = JSON.parse(line);
+            response = { id, ...calculateRiichi(inputData) };
+        } catch (error) {
+            response = {
+                id: null,
+                success: false,
+                error: {
+                    message: "Invalid JSON input: " + error.message,
+                    stack: error.stack
+                }
+            };
         }
-    }));
-    process.exit(1);
+        process.stdout.write(JSON.stringify(response) + '\n');
+    });
+
+    // 親プロセスが標準入力を閉じたら、書き込み中の応答を出し切ってから自然に終了する
+    // （process.exit は標準出力への未完了の書き込みを打ち切ることがある）
+}
+
+if (process.argv[2] === '--server') {
+    serve();
+} else {
+    // コマンドライン引数から入力を取得
+    if (process.argv.length < 3) {
+        console.error(JSON.stringify({
+            success: false,
+            error: { message: "Input JSON required as command line argument" }
+        }));
+        process.exit(1);
+    }
+
+    try {
+        const inputJson = process.argv[2];
+        const inputData = JSON.parse(inputJson);
+        const result = calculateRiichi(inputData);
+        console.log(JSON.stringify(result));
+    } catch (error) {
+        console.error(JSON.stringify({
+            success: false,
+            error: {
+                message: "Invalid JSON input: " + error.message,
+                stack: error.stack
+            }
+        }));
+        process.exit(1);
+    }
 }